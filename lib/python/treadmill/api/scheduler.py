@@ -26,6 +26,7 @@ _LOGGER = logging.getLogger(__name__)
 _CACHE_TIMEOUT = 180  # 3 mins
 _LAST_CACHE_UPDATE = 0
 _RO_SHEDULER_INSTANCE = None
+_RO_EXPLAINER = None
 
 
 def get_readonly_scheduler():
@@ -48,6 +49,19 @@ def get_readonly_scheduler():
     return _RO_SHEDULER_INSTANCE
 
 
+def get_pending_explainer():
+    """Prepare pending apps explainer for the readonly master model."""
+    # C0103(invalid-name): invalid variable name
+    # W0603(global-statement): using the global statement
+    # pylint: disable=C0103,W0603
+    global _RO_EXPLAINER
+    ro_scheduler = get_readonly_scheduler()
+    if _RO_EXPLAINER is None or _RO_EXPLAINER.cell is not ro_scheduler.cell:
+        _RO_EXPLAINER = reports.PendingExplainer(ro_scheduler.cell)
+
+    return _RO_EXPLAINER
+
+
 def mk_explainapi():
     """API factory function returning _ExplainAPI class."""
 
@@ -55,6 +69,7 @@ def mk_explainapi():
         """API object implementing the scheduler explain functionality."""
         def __init__(self):
             self.get = _explain
+            self.list = _explain_pending
 
     return _ExplainAPI
 
@@ -69,17 +84,24 @@ class API(object):
                 data, _meta = context.GLOBAL.zk.conn.get(
                     z.path.state_report(report_type)
                 )
-
-                df = reports.deserialize_dataframe(data)
-                if match:
-                    df = _match_by_name(df, report_type, match)
-                if partition:
-                    df = _match_by_partition(df, partition)
-
-                return df
             except kazoo.exceptions.NoNodeError:
                 raise KeyError(report_type)
 
+            try:
+                delta, _meta = context.GLOBAL.zk.conn.get(
+                    z.path.state_report_delta(report_type)
+                )
+            except kazoo.exceptions.NoNodeError:
+                delta = None
+
+            df = reports.deserialize_dataframe(data, delta)
+            if match:
+                df = _match_by_name(df, report_type, match)
+            if partition:
+                df = _match_by_partition(df, partition)
+
+            return df
+
         self.get = get
         self.explain = mk_explainapi()()
 
@@ -127,3 +149,25 @@ def _explain(inst_id):
         return reports.explain_placement(
             ro_scheduler.cell, instance, 'servers'
         )
+
+
+def _explain_pending(match=None, partition=None):
+    """Explain placement of all pending apps, optionally filtered."""
+    start = time.time()
+    explainer = get_pending_explainer()
+    _LOGGER.info('explainer was ready in %s secs', time.time() - start)
+
+    apps = [
+        app for app in explainer.cell.apps.values()
+        if app.server is None
+    ]
+    if match:
+        apps = [app for app in apps if fnmatch.fnmatch(app.name, match)]
+    if partition:
+        apps = [
+            app for app in apps
+            if app.allocation is not None and
+            fnmatch.fnmatch(app.allocation.label or '', partition)
+        ]
+
+    return explainer.explain(sorted(apps, key=lambda app: app.name))
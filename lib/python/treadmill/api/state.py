@@ -8,6 +8,7 @@ from __future__ import absolute_import
 
 import logging
 
+import bisect
 import json
 import os
 import re
@@ -16,8 +17,10 @@ import sqlite3
 import tempfile
 import fnmatch
 import collections
+import threading
 import time
 
+import kazoo.exceptions
 import six
 
 from treadmill import admin
@@ -27,10 +30,38 @@ from treadmill import utils
 from treadmill import yamlwrapper as yaml
 from treadmill import zknamespace as z
 from treadmill import zkutils
+from treadmill import zkwatchers
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# Max number of compiled match patterns kept.
+_MATCH_CACHE_SIZE = 1024
+
+_MATCH_CACHE = {}
+
+_GLOB_CHARS = re.compile(r'[*?[]')
+
+# Max size of decoded finished history snapshots kept in memory (bytes).
+_FINISHED_HISTORY_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def _compile_match(match):
+    """Compile glob match, return regex and literal prefix of the match."""
+    try:
+        return _MATCH_CACHE[match]
+    except KeyError:
+        pass
+
+    pattern = os.path.normcase(match)
+    prefix = _GLOB_CHARS.split(pattern, 1)[0]
+    compiled = (re.compile(fnmatch.translate(pattern)), prefix)
+
+    if len(_MATCH_CACHE) >= _MATCH_CACHE_SIZE:
+        _MATCH_CACHE.clear()
+    _MATCH_CACHE[match] = compiled
+    return compiled
+
 
 def watch_running(zkclient, cell_state):
     """Watch running instances."""
@@ -39,10 +70,7 @@ def watch_running(zkclient, cell_state):
     @utils.exit_on_unhandled
     def _watch_running(running):
         """Watch /running nodes."""
-        cell_state.running = set(running)
-        for name, item in six.viewitems(cell_state.placement):
-            if name in cell_state.running:
-                item['state'] = 'running'
+        cell_state.set_running(running)
         return True
 
     _LOGGER.info('Loaded running.')
@@ -58,106 +86,207 @@ def watch_finished(zkclient, cell_state):
         current = set(cell_state.finished)
         target = set(finished)
 
-        for instance in target - current:
-            finished_data = zkutils.get_default(
-                zkclient,
-                z.path.finished(instance),
-                {}
+        added = target - current
+        finished_data = zkutils.get_many_with_metadata(
+            zkclient,
+            [z.path.finished(instance) for instance in added]
+        )
+        for instance in added:
+            data, _metadata = finished_data.get(
+                z.path.finished(instance), ({}, None)
             )
-            cell_state.finished[instance] = finished_data
+            cell_state.add_finished(instance, data)
 
         for instance in current - target:
-            del cell_state.finished[instance]
+            cell_state.remove_finished(instance)
 
     _LOGGER.info('Loaded finished.')
 
 
+def _load_placement(placement_data):
+    """Load placement checkpoint or journal entry."""
+    try:
+        placement = json.loads(
+            zlib.decompress(placement_data).decode()
+        )
+    except zlib.error:
+        # For backward compatibility, remove once all cells use new format.
+        placement = yaml.load(placement_data)
+
+    if isinstance(placement, list):
+        # Placement saved without version, before there was the journal.
+        placement = {'version': None, 'placement': placement}
+    return placement
+
+
+def _placement_items(cell_state, rows):
+    """Generate placement state of the instances from placement rows."""
+    for row in rows:
+        instance, _before, _exp_before, after, expires = tuple(row)
+        if after is None:
+            state = 'pending'
+        else:
+            state = 'scheduled'
+            if instance in cell_state.running:
+                state = 'running'
+        yield instance, {
+            'state': state,
+            'host': after,
+            'expires': expires,
+        }
+
+
 def watch_placement(zkclient, cell_state):
-    """Watch placement."""
+    """Watch placement checkpoint and the journal of placement changes."""
+
+    journal = []
+
+    def _load_checkpoint(placement_data):
+        """Replace placement with the checkpoint."""
+        checkpoint = _load_placement(placement_data)
+        cell_state.placement = dict(
+            _placement_items(cell_state, checkpoint['placement'])
+        )
+        cell_state.placement_version = checkpoint['version']
+
+    def _apply_journal(reload_checkpoint=True):
+        """Apply journal entries following the current placement version."""
+        for entry in sorted(journal):
+            version = cell_state.placement_version
+            if version is None or int(entry) <= version:
+                continue
+
+            if int(entry) != version + 1:
+                if not reload_checkpoint:
+                    _LOGGER.warning('Placement journal gap: %s - %s',
+                                    version, entry)
+                    return
+
+                # Entries were trimmed, placement is behind the checkpoint.
+                _LOGGER.info('Placement journal gap: %s - %s, reloading',
+                             version, entry)
+                placement_data, _stat = zkclient.get(z.path.placement())
+                _load_checkpoint(placement_data)
+                _apply_journal(reload_checkpoint=False)
+                return
+
+            try:
+                entry_data, _stat = zkclient.get(
+                    z.path.placement_journal(entry)
+                )
+            except kazoo.exceptions.NoNodeError:
+                # Trimmed after new checkpoint, which will be loaded.
+                return
+
+            changes = _load_placement(entry_data)
+            for instance in changes['deleted']:
+                cell_state.remove_placement(instance)
+            for instance, item in _placement_items(cell_state,
+                                                   changes['placement']):
+                cell_state.update_placement(instance, item)
+            cell_state.placement_version = changes['version']
 
     @zkclient.DataWatch(z.path.placement())
     @utils.exit_on_unhandled
     def _watch_placement(placement_data, _stat, event):
         """Watch /placement data."""
         if placement_data is None or event == 'DELETED':
-            cell_state.placement.clear()
+            cell_state.placement = {}
+            cell_state.placement_version = None
             return True
 
-        try:
-            placement = json.loads(
-                zlib.decompress(placement_data).decode()
-            )
-        except zlib.error:
-            # For backward compatibility, remove once all cells use new format.
-            placement = yaml.load(placement_data)
-
-        updated_placement = {}
-        for row in placement:
-            instance, _before, _exp_before, after, expires = tuple(row)
-            if after is None:
-                state = 'pending'
-            else:
-                state = 'scheduled'
-                if instance in cell_state.running:
-                    state = 'running'
-            updated_placement[instance] = {
-                'state': state,
-                'host': after,
-                'expires': expires,
-            }
-        cell_state.placement = updated_placement
+        _load_checkpoint(placement_data)
+        _apply_journal()
+        return True
+
+    @zkclient.ChildrenWatch(z.PLACEMENT_JOURNAL)
+    @utils.exit_on_unhandled
+    def _watch_placement_journal(entries):
+        """Watch /placement.journal nodes."""
+        journal[:] = entries
+        _apply_journal()
         return True
 
     _LOGGER.info('Loaded placement.')
 
 
+def watch_servers(zkclient, cell_state):
+    """Watch server partitions."""
+
+    def _watch_server(servername):
+        """Watch server data for given server."""
+
+        @zkwatchers.ExistingDataWatch(zkclient, z.path.server(servername))
+        @utils.exit_on_unhandled
+        def _watch_server_data(data, _stat, event):
+            """Watch /servers/<servername> data."""
+            if (data is None or
+                    (event is not None and event.type == 'DELETED')):
+                cell_state.remove_server(servername)
+                return False
+
+            server = yaml.load(data) or {}
+            cell_state.set_server(
+                servername,
+                server.get('partition') or admin.DEFAULT_PARTITION
+            )
+            return True
+
+    @zkclient.ChildrenWatch(z.SERVERS)
+    @utils.exit_on_unhandled
+    def _watch_servers(servers):
+        """Watch /servers nodes."""
+        current = set(cell_state.servers)
+        target = set(servers)
+
+        for servername in current - target:
+            cell_state.remove_server(servername)
+
+        for servername in target - current:
+            _watch_server(servername)
+
+        return True
+
+    _LOGGER.info('Loaded servers.')
+
+
 def watch_finished_history(zkclient, cell_state):
     """Watch finished historical snapshots."""
 
-    loaded_snapshots = {}
-
     @zkclient.ChildrenWatch(z.FINISHED_HISTORY)
     @utils.exit_on_unhandled
     def _watch_finished_snapshots(snapshots):
         """Watch /finished.history nodes."""
         start_time = time.time()
-        finished_history = cell_state.finished_history.copy()
+        finished_history = cell_state.finished_history
+        loaded = set(finished_history.snapshots())
 
-        for db_node in sorted(set(loaded_snapshots) - set(snapshots)):
+        for db_node in sorted(loaded - set(snapshots)):
             _LOGGER.info('Unloading snapshot: %s', db_node)
-            for instance in loaded_snapshots.pop(db_node):
-                finished_history.pop(instance, None)
-
-        for db_node in sorted(set(snapshots) - set(loaded_snapshots)):
-            _LOGGER.info('Loading snapshot: %s', db_node)
-            loading_start_time = time.time()
-            loaded_snapshots[db_node] = []
-
-            data, _stat = zkclient.get(z.path.finished_history(db_node))
+            finished_history.remove_snapshot(db_node)
 
-            with tempfile.NamedTemporaryFile(delete=False, mode='wb') as f:
-                f.write(zlib.decompress(data))
+        added = sorted(set(snapshots) - loaded)
+        snapshots_data = zkutils.get_many_data(
+            zkclient,
+            [z.path.finished_history(db_node) for db_node in added]
+        )
+        for db_node in added:
             try:
-                conn = sqlite3.connect(f.name)
-                cur = conn.cursor()
-                sql = 'SELECT name, data FROM finished ORDER BY timestamp'
-                for row in cur.execute(sql):
-                    instance, data = row
-                    if data:
-                        data = yaml.load(data)
-                    finished_history[instance] = data
-                    loaded_snapshots[db_node].append(instance)
-                conn.close()
-            finally:
-                os.unlink(f.name)
+                data, _stat = snapshots_data[z.path.finished_history(db_node)]
+            except KeyError:
+                # Removed before it was read, will be in the next event.
+                continue
 
+            _LOGGER.info('Loading snapshot: %s', db_node)
+            loading_start_time = time.time()
+            finished_history.add_snapshot(db_node, data)
             _LOGGER.debug('Loading time: %s', time.time() - loading_start_time)
 
-        cell_state.finished_history = finished_history
         _LOGGER.debug(
             'Loaded snapshots: %d, finished: %d, finished history: %d, '
-            'time: %s', len(loaded_snapshots), len(cell_state.finished),
-            len(cell_state.finished_history), time.time() - start_time
+            'time: %s', len(finished_history.snapshots()),
+            len(cell_state.finished), len(finished_history),
+            time.time() - start_time
         )
 
         return True
@@ -165,23 +294,432 @@ def watch_finished_history(zkclient, cell_state):
     _LOGGER.info('Loaded finished snapshots.')
 
 
+def _read_snapshot(data, sql):
+    """Generate rows of the query from the compressed sqlite snapshot.
+
+    Snapshot is deserialized into memory where supported (Python 3.11+),
+    otherwise it is read from a temporary file.
+    """
+    content = zlib.decompress(data)
+    if hasattr(sqlite3.Connection, 'deserialize'):
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.deserialize(content)
+            for row in conn.execute(sql):
+                yield row
+        finally:
+            conn.close()
+        return
+
+    with tempfile.NamedTemporaryFile(delete=False, mode='wb') as f:
+        f.write(content)
+    try:
+        conn = sqlite3.connect(f.name)
+        try:
+            for row in conn.execute(sql):
+                yield row
+        finally:
+            conn.close()
+    finally:
+        os.unlink(f.name)
+
+
+class FinishedHistory(object):
+    """Finished history snapshots.
+
+    Snapshots are kept compressed, as stored in Zookeeper, only instance
+    names are read when snapshot is added. Rows are decoded on lookup, the
+    decoded snapshots are kept in LRU cache bounded by cache_size (bytes).
+    """
+
+    __slots__ = (
+        '_snapshots',
+        '_order',
+        '_names',
+        '_decoded',
+        '_decoded_size',
+        '_cache_size',
+        '_lock',
+    )
+
+    def __init__(self, cache_size=_FINISHED_HISTORY_CACHE_SIZE):
+        # db_node -> (compressed data, instance names ordered by timestamp)
+        self._snapshots = {}
+        # Sorted db_nodes of the loaded snapshots.
+        self._order = []
+        # instance name -> db_node
+        self._names = {}
+        # db_node -> (instance name -> data, size)
+        self._decoded = collections.OrderedDict()
+        self._decoded_size = 0
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __reversed__(self):
+        """Iterate over instance names, most recent first."""
+        for db_node in self._order[::-1]:
+            snapshot = self._snapshots.get(db_node)
+            if snapshot is None:
+                continue
+
+            _data, names = snapshot
+            for name in reversed(names):
+                # Instance in several snapshots belongs to the latest one.
+                if self._names.get(name) == db_node:
+                    yield name
+
+    def snapshots(self):
+        """Return names of the loaded snapshots."""
+        return list(self._snapshots)
+
+    def add_snapshot(self, db_node, data):
+        """Add compressed snapshot, index instance names."""
+        names = tuple(
+            name for name, in _read_snapshot(
+                data, 'SELECT name FROM finished ORDER BY timestamp'
+            )
+        )
+        if db_node not in self._snapshots:
+            bisect.insort(self._order, db_node)
+        self._snapshots[db_node] = (data, names)
+        for name in names:
+            current = self._names.get(name)
+            if current is None or current < db_node:
+                self._names[name] = db_node
+
+    def remove_snapshot(self, db_node):
+        """Remove snapshot and its instances."""
+        _data, names = self._snapshots.pop(db_node)
+        del self._order[bisect.bisect_left(self._order, db_node)]
+        for name in names:
+            if self._names.get(name) == db_node:
+                del self._names[name]
+
+        with self._lock:
+            decoded = self._decoded.pop(db_node, None)
+            if decoded is not None:
+                self._decoded_size -= decoded[1]
+
+    def _rows(self, db_node):
+        """Return decoded rows of the snapshot, None if it was removed."""
+        with self._lock:
+            decoded = self._decoded.pop(db_node, None)
+            if decoded is not None:
+                self._decoded[db_node] = decoded
+                return decoded[0]
+
+        try:
+            data, _names = self._snapshots[db_node]
+        except KeyError:
+            return None
+
+        rows = {}
+        size = 0
+        for name, row_data in _read_snapshot(
+                data, 'SELECT name, data FROM finished'):
+            rows[name] = row_data
+            size += len(name) + len(row_data or '')
+
+        with self._lock:
+            if db_node in self._snapshots and db_node not in self._decoded:
+                self._decoded[db_node] = (rows, size)
+                self._decoded_size += size
+                while (self._decoded_size > self._cache_size and
+                       len(self._decoded) > 1):
+                    _db_node, (_rows, evicted) = self._decoded.popitem(
+                        last=False
+                    )
+                    self._decoded_size -= evicted
+
+        return rows
+
+    def get(self, name, default=None):
+        """Get finished data of the instance."""
+        db_node = self._names.get(name)
+        if db_node is None:
+            return default
+
+        rows = self._rows(db_node)
+        if rows is None or name not in rows:
+            return default
+
+        data = rows[name]
+        if data:
+            data = yaml.load(data)
+        return data
+
+
+class _NameIndex(object):
+    """Sorted index of instance names, for match prefix lookups."""
+
+    __slots__ = (
+        '_keys',
+    )
+
+    def __init__(self, names=()):
+        self._keys = sorted((os.path.normcase(name), name) for name in names)
+
+    def _range(self, prefix):
+        """Return index range of the names starting with the prefix."""
+        if not prefix:
+            return 0, len(self._keys)
+
+        upper = prefix[:-1] + six.unichr(ord(prefix[-1]) + 1)
+        return (bisect.bisect_left(self._keys, (prefix,)),
+                bisect.bisect_left(self._keys, (upper,)))
+
+    def add(self, name):
+        """Add name to the index."""
+        key = (os.path.normcase(name), name)
+        idx = bisect.bisect_left(self._keys, key)
+        if idx == len(self._keys) or self._keys[idx] != key:
+            self._keys.insert(idx, key)
+
+    def remove(self, name):
+        """Remove name from the index."""
+        key = (os.path.normcase(name), name)
+        idx = bisect.bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            del self._keys[idx]
+
+    def count(self, prefix):
+        """Count names starting with the (normalized) prefix."""
+        lower, upper = self._range(prefix)
+        return upper - lower
+
+    def prefixed(self, prefix):
+        """Return names starting with the (normalized) prefix."""
+        lower, upper = self._range(prefix)
+        return [name for _key, name in self._keys[lower:upper]]
+
+
+def _discard(index, key, instance):
+    """Remove instance from the index set, drop empty sets."""
+    instances = index.get(key)
+    if instances is not None:
+        instances.discard(instance)
+        if not instances:
+            del index[key]
+
+
 class CellState(object):
-    """Cell state."""
+    """Cell state.
+
+    Placement is indexed by instance name, state and host, servers are
+    indexed by partition. Placement, finished and servers should be only
+    changed through the methods below to keep the indexes consistent.
+    """
 
     __slots__ = (
         'running',
-        'placement',
-        'finished',
+        '_placement',
+        'placement_version',
+        '_finished',
         'finished_history',
         'watches',
+        'servers',
+        '_placement_names',
+        '_finished_names',
+        '_states',
+        '_hosts',
+        '_partitions',
     )
 
     def __init__(self):
         self.running = []
         self.placement = {}
+        self.placement_version = None
         self.finished = {}
-        self.finished_history = collections.OrderedDict()
+        self.finished_history = FinishedHistory()
         self.watches = set()
+        self.servers = {}
+        self._partitions = {}
+
+    @property
+    def placement(self):
+        """Placement state of the instances."""
+        return self._placement
+
+    @placement.setter
+    def placement(self, placement):
+        """Replace placement and rebuild the placement indexes."""
+        states = {}
+        hosts = {}
+        for instance, item in six.iteritems(placement):
+            states.setdefault(item['state'], set()).add(instance)
+            if item['host']:
+                hosts.setdefault(item['host'], set()).add(instance)
+
+        self._placement = placement
+        self._placement_names = _NameIndex(placement)
+        self._states = states
+        self._hosts = hosts
+
+    @property
+    def finished(self):
+        """Finished instances."""
+        return self._finished
+
+    @finished.setter
+    def finished(self, finished):
+        """Replace finished instances and rebuild the name index."""
+        self._finished = finished
+        self._finished_names = _NameIndex(finished)
+
+    def _index_placement(self, instance, item):
+        """Add instance to state and host indexes."""
+        self._states.setdefault(item['state'], set()).add(instance)
+        if item['host']:
+            self._hosts.setdefault(item['host'], set()).add(instance)
+
+    def _unindex_placement(self, instance, item):
+        """Remove instance from state and host indexes."""
+        _discard(self._states, item['state'], instance)
+        if item['host']:
+            _discard(self._hosts, item['host'], instance)
+
+    def update_placement(self, instance, item):
+        """Add or update placement of the instance."""
+        current = self._placement.get(instance)
+        if current is not None:
+            self._unindex_placement(instance, current)
+        else:
+            self._placement_names.add(instance)
+
+        self._placement[instance] = item
+        self._index_placement(instance, item)
+
+    def remove_placement(self, instance):
+        """Remove instance from placement."""
+        item = self._placement.pop(instance, None)
+        if item is not None:
+            self._unindex_placement(instance, item)
+            self._placement_names.remove(instance)
+
+    def set_running(self, running):
+        """Set running instances, mark them running in placement.
+
+        Placed instances which are no longer running are marked scheduled.
+        """
+        self.running = set(running)
+        for state in ('pending', 'scheduled'):
+            instances = self._states.get(state, set()) & self.running
+            for instance in instances:
+                self._set_state(instance, 'running')
+
+        stopped = self._states.get('running', set()) - self.running
+        for instance in stopped:
+            self._set_state(instance, 'scheduled')
+
+    def _set_state(self, instance, state):
+        """Change state of the placed instance, keeping indexes up to date."""
+        item = self._placement[instance]
+        self._unindex_placement(instance, item)
+        item['state'] = state
+        self._index_placement(instance, item)
+
+    def add_finished(self, instance, data):
+        """Add finished instance."""
+        self._finished[instance] = data
+        self._finished_names.add(instance)
+
+    def remove_finished(self, instance):
+        """Remove finished instance."""
+        if self._finished.pop(instance, None) is not None:
+            self._finished_names.remove(instance)
+
+    def set_server(self, servername, partition):
+        """Set server partition."""
+        current = self.servers.get(servername)
+        if current == partition:
+            return
+
+        if current is not None:
+            _discard(self._partitions, current, servername)
+        self._partitions.setdefault(partition, set()).add(servername)
+        self.servers[servername] = partition
+
+    def remove_server(self, servername):
+        """Remove server."""
+        partition = self.servers.pop(servername, None)
+        if partition is not None:
+            _discard(self._partitions, partition, servername)
+
+    def _partition_hosts(self, partition):
+        """Return hosts in the partition, None if partition is not set."""
+        if not partition:
+            return None
+        return frozenset(self._partitions.get(partition, ()))
+
+    def list_placement(self, match, partition=None):
+        """Generate (instance, item) of the placement matching the glob.
+
+        Candidates are taken from the name or host index, whichever is
+        smaller.
+        """
+        match_re, prefix = _compile_match(match)
+        hosts = self._partition_hosts(partition)
+
+        candidates = None
+        if hosts is not None:
+            by_host = [list(self._hosts.get(host, ())) for host in hosts]
+            if sum(map(len, by_host)) < self._placement_names.count(prefix):
+                candidates = [
+                    instance for instances in by_host for instance in instances
+                ]
+        if candidates is None:
+            candidates = self._placement_names.prefixed(prefix)
+
+        placement = self._placement
+        for instance in candidates:
+            item = placement.get(instance)
+            if item is None:
+                continue
+            if hosts is not None and item['host'] not in hosts:
+                continue
+            if match_re.match(os.path.normcase(instance)) is None:
+                continue
+            yield instance, item
+
+    def list_finished(self, match, partition=None, limit=None):
+        """List finished state of the instances matching the glob.
+
+        Returns at most limit of the most recent finished instances.
+        """
+        match_re, prefix = _compile_match(match)
+        hosts = self._partition_hosts(partition)
+        filtered = {}
+
+        def _filter_finished(iterable, limit=None):
+            added = 0
+            for name in iterable:
+                normname = os.path.normcase(name)
+                if not normname.startswith(prefix):
+                    continue
+                if match_re.match(normname) is None:
+                    continue
+                if limit and added >= limit:
+                    break
+                item = self.get_finished(name)
+                if item and (hosts is None or item['host'] in hosts):
+                    filtered[name] = item
+                    added += 1
+
+        _filter_finished(self._finished_names.prefixed(prefix))
+        _filter_finished(reversed(self.finished_history), limit)
+
+        res = sorted(six.viewvalues(filtered),
+                     key=lambda item: float(item['when']),
+                     reverse=True)
+        if limit:
+            res = res[:limit]
+        return res
 
     def get_finished(self, rsrc_id):
         """Get finished state if present."""
@@ -222,13 +760,6 @@ class API(object):
 
     _FINISHED_LIMIT = 1000
 
-    @staticmethod
-    def _get_server_info():
-        """Get server information"""
-        return admin.Server(context.GLOBAL.ldap.conn).list({
-            'cell': context.GLOBAL.cell
-        })
-
     def __init__(self):
 
         if context.GLOBAL.cell is not None:
@@ -241,6 +772,7 @@ class API(object):
             watch_placement(zkclient, cell_state)
             watch_finished(zkclient, cell_state)
             watch_finished_history(zkclient, cell_state)
+            watch_servers(zkclient, cell_state)
 
         def _list(match=None, finished=False, partition=None):
             """List instances state."""
@@ -251,44 +783,16 @@ class API(object):
                 match = '*'
             if '#' not in match:
                 match += '#*'
-            match_re = re.compile(fnmatch.translate(os.path.normcase(match)))
-
-            def _match(name):
-                return match_re.match(os.path.normcase(name)) is not None
-
-            hosts = None
-            if partition:
-                hosts = [server['_id'] for server in API._get_server_info()
-                         if server['partition'] == partition]
 
             filtered = [
                 {'name': name, 'state': item['state'], 'host': item['host']}
-                for name, item in six.viewitems(cell_state.placement.copy())
-                if _match(name) and (hosts is None or item['host'] in hosts)
+                for name, item in cell_state.list_placement(match, partition)
             ]
 
             if finished:
-                filtered_finished = {}
-
-                def _filter_finished(iterable, limit=None):
-                    added = 0
-                    for name in iterable:
-                        if not _match(name):
-                            continue
-                        if limit and added >= limit:
-                            break
-                        item = cell_state.get_finished(name)
-                        if item and (hosts is None or item['host'] in hosts):
-                            filtered_finished[name] = item
-                            added += 1
-
-                _filter_finished(six.viewkeys(cell_state.finished.copy()))
-                _filter_finished(reversed(cell_state.finished_history),
-                                 self._FINISHED_LIMIT)
-
-                filtered.extend(sorted(six.viewvalues(filtered_finished),
-                                       key=lambda item: float(item['when']),
-                                       reverse=True)[:self._FINISHED_LIMIT])
+                filtered.extend(cell_state.list_finished(
+                    match, partition, self._FINISHED_LIMIT
+                ))
 
             res = sorted(filtered, key=lambda item: item['name'])
             _LOGGER.debug('list time: %s', time.time() - start_time)
@@ -6,6 +6,9 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import unicode_literals
 
+import fnmatch
+import io
+import json
 import logging
 import os
 import time
@@ -20,6 +23,7 @@ from treadmill import context
 from treadmill import scheduler as treadmill_sched
 from treadmill import reports
 from treadmill.scheduler import loader
+from treadmill.scheduler import replay as sched_replay
 from treadmill.scheduler import zkbackend
 
 
@@ -34,8 +38,8 @@ def _print(frame, formatter):
         cli.out(formatter(frame.to_dict(orient='records')))
 
 
-def make_readonly_master(run_scheduler=False):
-    """Prepare a readonly master."""
+def make_readonly_master(run_scheduler=False, snapshot=None):
+    """Prepare a readonly master, from snapshot file if given."""
     treadmill_sched.DIMENSION_COUNT = 3
 
     backend = zkbackend.ZkReadonlyBackend(context.GLOBAL.zk.conn)
@@ -53,7 +57,11 @@ def make_readonly_master(run_scheduler=False):
         backend,
         context.GLOBAL.cell
     )
-    cell_master.load_model()
+    if snapshot:
+        with io.open(snapshot, 'rb') as f:
+            cell_master.load_snapshot(f.read())
+    else:
+        cell_master.load_model()
 
     if run_scheduler:
         cell_master.cell.schedule()
@@ -73,7 +81,8 @@ def view_group(parent):
     ])
 
     ctx = {
-        'run_scheduler': False
+        'run_scheduler': False,
+        'snapshot': None,
     }
 
     servers_formatter = cli.make_formatter('sched-view-servers')
@@ -83,16 +92,19 @@ def view_group(parent):
 
     @parent.group()
     @click.option('--reschedule', is_flag=True, default=False)
+    @click.option('--snapshot', type=click.Path(exists=True),
+                  help='Load cell from snapshot file instead of Zookeeper.')
     @on_exceptions
-    def view(reschedule):
+    def view(reschedule, snapshot):
         """Examine scheduler state."""
         ctx['run_scheduler'] = reschedule
+        ctx['snapshot'] = snapshot
 
     @view.command()
     @on_exceptions
     def servers():
         """View servers report"""
-        cell_master = make_readonly_master(ctx['run_scheduler'])
+        cell_master = make_readonly_master(**ctx)
         output = reports.servers(cell_master.cell)
         output['valid_until'] = pd.to_datetime(output['valid_until'], unit='s')
         _print(output, servers_formatter)
@@ -101,7 +113,7 @@ def view_group(parent):
     @on_exceptions
     def apps():
         """View apps report"""
-        cell_master = make_readonly_master(ctx['run_scheduler'])
+        cell_master = make_readonly_master(**ctx)
         output = reports.apps(cell_master.cell)
         # Replace integer N/As
         for col in ['identity', 'expires', 'lease', 'data_retention']:
@@ -118,7 +130,7 @@ def view_group(parent):
     @on_exceptions
     def allocs():
         """View allocation report"""
-        cell_master = make_readonly_master(ctx['run_scheduler'])
+        cell_master = make_readonly_master(**ctx)
         allocs = reports.allocations(cell_master.cell)
         _print(allocs, allocs_formatter)
 
@@ -128,7 +140,7 @@ def view_group(parent):
     @on_exceptions
     def reboots(histogram):
         """View server reboot times."""
-        cell_master = make_readonly_master(ctx['run_scheduler'])
+        cell_master = make_readonly_master(**ctx)
         reboots = reports.reboots(cell_master.cell)
         if histogram:
             cli.out(reboots['valid-until'].value_counts().to_string())
@@ -146,6 +158,7 @@ def explain_group(parent):
 
     queue_formatter = cli.make_formatter('alloc-queue')
     placement_formatter = cli.make_formatter('placement')
+    pending_formatter = cli.make_formatter('pending')
 
     @parent.group()
     def explain():
@@ -183,8 +196,28 @@ def explain_group(parent):
         frame = reports.explain_placement(cell_master.cell, app, mode)
         _print(frame, placement_formatter)
 
+    @explain.command()
+    @click.option('--instance', help='Pending instance pattern match')
+    @click.option('--partition', help='Cell partition pattern match')
+    @cli.admin.ON_EXCEPTIONS
+    def pending(instance, partition):
+        """Explain why pending applications are not placed"""
+        cell_master = make_readonly_master()
+        apps = [
+            app for app in cell_master.cell.apps.values()
+            if not app.server and
+            (not instance or fnmatch.fnmatch(app.name, instance)) and
+            (not partition or
+             fnmatch.fnmatch(app.allocation.label or '', partition))
+        ]
+        frame = reports.explain_pending(
+            cell_master.cell, sorted(apps, key=lambda app: app.name)
+        )
+        _print(frame, pending_formatter)
+
     del queue
     del placement
+    del pending
 
 
 def init():
@@ -203,6 +236,26 @@ def init():
         """Report scheduler state."""
         pass
 
+    @top.command()
+    @click.option('--workers', type=int, default=1,
+                  help='Number of processes scheduling independent '
+                  'partitions in parallel.')
+    @click.argument('trace', type=click.Path(exists=True))
+    def replay(trace, workers):
+        """Replay recorded scheduler trace, report scheduler stats."""
+        treadmill_sched.DIMENSION_COUNT = 3
+        if workers > 1:
+            treadmill_sched.start_workers(workers)
+        with io.open(trace, encoding='utf-8') as f:
+            stats = sched_replay.Replay(
+                context.GLOBAL.cell,
+                sched_replay.load_trace(f),
+                workers=workers
+            ).run()
+        cli.out(json.dumps(stats.to_dict(), indent=4, sort_keys=True))
+
     view_group(top)
     explain_group(top)
+
+    del replay
     return top
@@ -63,6 +63,20 @@ def init():
         else:
             placement = []
 
+        if isinstance(placement, dict):
+            # Placement checkpoint, changes since are in the journal.
+            journal = sorted(zkclient.get_children(z.PLACEMENT_JOURNAL))
+            rows = {row[0]: row for row in placement['placement']}
+            for entry in journal:
+                if int(entry) <= placement['version']:
+                    continue
+                entry_data, _ = zkclient.get(z.path.placement_journal(entry))
+                changes = json.loads(zlib.decompress(entry_data).decode())
+                for app in changes['deleted']:
+                    rows.pop(app, None)
+                rows.update((row[0], row) for row in changes['placement'])
+            placement = list(rows.values())
+
         # App is pending if it's scheduled but has no placement.
         placed = {
             app for app, _before, _exp_before, after, _exp_after in placement
@@ -38,9 +38,9 @@ def fetch_report(cell_api, report_type, match=None, partition=None):
     return pd.DataFrame(response['data'], columns=response['columns'])
 
 
-def print_report(frame):
-    """Pretty-print the report."""
-    if cli.OUTPUT_FORMAT is None:
+def print_report(frame, factors=True):
+    """Pretty-print the report, marking factors if the report has them."""
+    if cli.OUTPUT_FORMAT is None and factors:
         frame.replace(True, ' ', inplace=True)
         frame.replace(False, 'X', inplace=True)
         dict_ = frame.to_dict(orient='split')
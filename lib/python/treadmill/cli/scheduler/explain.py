@@ -12,6 +12,7 @@ import pandas as pd
 from six.moves import urllib
 
 from treadmill import (cli, context)
+from treadmill.cli.scheduler import fetch_report
 from treadmill.cli.scheduler import print_report
 from treadmill import restclient
 
@@ -27,10 +28,23 @@ def init():
 
     @click.command()
     @cli.handle_exceptions(_EXCEPTIONS)
-    @click.argument('instance')
+    @click.argument('instance', required=False)
+    @click.option('--match', help='Pending instance name pattern match')
+    @click.option('--partition', help='Partition name pattern match')
     @click.pass_context
-    def explain(ctx, instance):
-        """Explain why an instance is pending."""
+    def explain(ctx, instance, match, partition):
+        """Explain why an instance, or all pending instances, is pending.
+
+        Without instance, pending instances are reported with the number of
+        servers left after each check, and the check ruling out all servers.
+        """
+        if not instance:
+            report = fetch_report(
+                ctx.obj.get('api'), 'explain', match, partition
+            )
+            print_report(report, factors=False)
+            return
+
         api_urls = context.GLOBAL.cell_api(ctx.obj.get('api'))
         path = '/scheduler/explain/{}'.format(urllib.parse.quote(instance))
 
@@ -745,6 +745,38 @@ class PlacementPrettyFormatter(object):
             return format_item(item)
 
 
+class PendingPrettyFormatter(object):
+    """Pretty table formatter for explain-pending."""
+
+    @staticmethod
+    def format(item):
+        """Return pretty-formatted item."""
+        schema = [
+            ('name', None, None),
+            ('partition', None, None),
+            ('traits', None, None),
+            ('affinity', None, None),
+            ('state', None, None),
+            ('lifetime', None, None),
+            ('memory', None, None),
+            ('cpu', None, None),
+            ('disk', None, None),
+            ('reason', None, None),
+        ]
+
+        align = {
+            column: 'r' for column, _key, _fmt in schema
+            if column not in ('name', 'reason')
+        }
+        format_item = make_dict_to_table(schema)
+        format_list = make_list_to_table(schema, align=align)
+
+        if isinstance(item, list):
+            return format_list(item)
+        else:
+            return format_item(item)
+
+
 class SchedulerServersPrettyFormatter(object):
     """Pretty table formatter for scheduler view servers."""
 
@@ -7,11 +7,14 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import bz2
+import collections
 import datetime
 import fnmatch
 import io
 import itertools
+import json
 import logging
+import struct
 import time
 
 import numpy as np
@@ -23,6 +26,21 @@ from treadmill import scheduler
 
 _LOGGER = logging.getLogger(__name__)
 
+# Columnar report is magic followed by bzip2 compressed header size, JSON
+# header with the array types and the string table, and the array data.
+_COLUMNAR_MAGIC = b'TMC1'
+
+# Write full report instead of delta once more than half of the rows changed.
+_DELTA_MAX_RATIO = 0.5
+
+
+def _frame(columns, data):
+    """Construct DataFrame from dict of columns, in the given column order."""
+    return pd.DataFrame(
+        {name: pd.Series(values) for name, values in six.iteritems(data)},
+        columns=columns
+    )
+
 
 def servers(cell):
     """Prepare DataFrame with server information."""
@@ -35,49 +53,44 @@ def servers(cell):
         'mem_free', 'cpu_free', 'disk_free'
     ]
 
-    def _server_location(node):
-        """Recursively yield the node's parents."""
-        while node:
-            yield node.name
-            node = node.parent
-
-    def _server_row(server):
-        """Transform server into a DataFrame-ready dict."""
-        partition = list(server.labels)[0]
-        row = {
-            'name': server.name,
-            'location': '/'.join(reversed(list(
-                _server_location(server.parent)
-            ))),
-            'partition': partition if partition else '-',
-            'traits': server.traits.traits,
-            'state': server.state.value,
-            'valid_until': server.valid_until,
-            'mem': server.init_capacity[0],
-            'cpu': server.init_capacity[1],
-            'disk': server.init_capacity[2],
-            'mem_free': server.free_capacity[0],
-            'cpu_free': server.free_capacity[1],
-            'disk_free': server.free_capacity[2]
-        }
-
-        return row
+    locations = {}
 
-    rows = [_server_row(server) for server in cell.members().values()]
-    frame = pd.DataFrame.from_dict(rows).astype({
-        'mem': 'int',
-        'cpu': 'int',
-        'disk': 'int',
-        'mem_free': 'int',
-        'cpu_free': 'int',
-        'disk_free': 'int'
+    def _server_location(node):
+        """Return '/' separated path of the node, cached per node."""
+        if node is None:
+            return ''
+
+        if node.name not in locations:
+            parent = _server_location(node.parent)
+            locations[node.name] = (
+                parent + '/' + node.name if parent else node.name
+            )
+        return locations[node.name]
+
+    members = list(cell.members().values())
+    capacity = np.array(
+        [server.init_capacity[:3] for server in members], dtype=int
+    ).reshape(-1, 3)
+    free = np.array(
+        [server.free_capacity[:3] for server in members], dtype=int
+    ).reshape(-1, 3)
+
+    frame = _frame(columns, {
+        'name': [server.name for server in members],
+        'location': [_server_location(server.parent) for server in members],
+        'partition': [next(iter(server.labels)) or '-' for server in members],
+        'traits': [server.traits.traits for server in members],
+        'state': [server.state.value for server in members],
+        'valid_until': [server.valid_until for server in members],
+        'mem': capacity[:, 0],
+        'cpu': capacity[:, 1],
+        'disk': capacity[:, 2],
+        'mem_free': free[:, 0],
+        'cpu_free': free[:, 1],
+        'disk_free': free[:, 2],
     })
 
-    if frame.empty:
-        frame = pd.DataFrame(columns=columns)
-
-    return frame[columns].sort_values(
-        by=['partition', 'name']).reset_index(drop=True)
+    return frame.sort_values(by=['partition', 'name']).reset_index(drop=True)
 
 
 def iterate_allocations(path, alloc):
@@ -109,42 +122,28 @@ def allocations(cell):
         'rank', 'rank_adj', 'traits', 'max_util'
     ]
 
-    def _alloc_row(partition, name, alloc):
-        """Transform allocation into a DataFrame-ready dict."""
-        if not name:
-            name = 'root'
-        if not partition:
-            partition = '-'
-
-        return {
-            'partition': partition,
-            'name': name,
-            'mem': alloc.reserved[0],
-            'cpu': alloc.reserved[1],
-            'disk': alloc.reserved[2],
-            'rank': alloc.rank,
-            'rank_adj': alloc.rank_adjustment,
-            'traits': alloc.traits,
-            'max_util': alloc.max_utilization,
-        }
-
-    frame = pd.DataFrame.from_dict(
-        [
-            _alloc_row(label, name, alloc)
-            for label, partition in six.iteritems(cell.partitions)
-            for name, alloc in iterate_allocations(
-                [], partition.allocation
-            )
-        ]
-    )
-    if frame.empty:
-        frame = pd.DataFrame(columns=columns)
+    leaves = [
+        (label or '-', name or 'root', alloc)
+        for label, partition in six.iteritems(cell.partitions)
+        for name, alloc in iterate_allocations([], partition.allocation)
+    ]
+    reserved = np.array(
+        [alloc.reserved[:3] for _label, _name, alloc in leaves], dtype=int
+    ).reshape(-1, 3)
+
+    frame = _frame(columns, {
+        'partition': [label for label, _name, _alloc in leaves],
+        'name': [name for _label, name, _alloc in leaves],
+        'mem': reserved[:, 0],
+        'cpu': reserved[:, 1],
+        'disk': reserved[:, 2],
+        'rank': [alloc.rank for _label, _name, alloc in leaves],
+        'rank_adj': [alloc.rank_adjustment for _label, _name, alloc in leaves],
+        'traits': [alloc.traits for _label, _name, alloc in leaves],
+        'max_util': [alloc.max_utilization for _label, _name, alloc in leaves],
+    })
 
-    return frame[columns].astype({
-        'mem': 'int',
-        'cpu': 'int',
-        'disk': 'int'
-    }).sort_values(by=['partition', 'name']).reset_index(drop=True)
+    return frame.sort_values(by=['partition', 'name']).reset_index(drop=True)
 
 
 def apps(cell):
@@ -159,57 +158,80 @@ def apps(cell):
         'mem', 'cpu', 'disk'
     ]
 
-    def _app_row(item):
-        """Transform app into a DataFrame-ready dict."""
-        rank, util0, util1, pending, order, app = item
-        return {
-            'instance': app.name,
-            'affinity': app.affinity.name,
-            'allocation': app.allocation.name,
-            'rank': rank,
-            'partition': app.allocation.label or '-',
-            'util0': util0,
-            'util1': util1,
-            'pending': pending,
-            'order': order,
-            'identity_group': app.identity_group,
-            'identity': app.identity,
-            'mem': app.demand[0],
-            'cpu': app.demand[1],
-            'disk': app.demand[2],
-            'lease': app.lease,
-            'expires': app.placement_expiry,
-            'data_retention': app.data_retention_timeout,
-            'server': app.server
-        }
+    def _default(value):
+        """Replace missing value with -1."""
+        return -1 if value is None else value
 
     queue = []
     for partition in cell.partitions.values():
         allocation = partition.allocation
         queue += allocation.utilization_queue(cell.size(allocation.label))
 
-    frame = pd.DataFrame.from_dict([_app_row(item) for item in queue]).fillna({
-        'expires': -1,
-        'identity': -1,
-        'data_retention': -1
+    ranks, util0, util1, pending, order, queued = (
+        list(six.moves.zip(*queue)) or [()] * 6
+    )
+    demand = np.array(
+        [app.demand[:3] for app in queued], dtype=int
+    ).reshape(-1, 3)
+
+    frame = _frame(columns, {
+        'instance': [app.name for app in queued],
+        'allocation': [app.allocation.name for app in queued],
+        'rank': ranks,
+        'affinity': [app.affinity.name for app in queued],
+        'partition': [app.allocation.label or '-' for app in queued],
+        'identity_group': [app.identity_group for app in queued],
+        'identity': np.array(
+            [_default(app.identity) for app in queued], dtype=int
+        ),
+        'order': np.array(order, dtype=int),
+        'lease': [app.lease for app in queued],
+        'expires': np.array(
+            [_default(app.placement_expiry) for app in queued], dtype=int
+        ),
+        'data_retention': np.array(
+            [_default(app.data_retention_timeout) for app in queued],
+            dtype=int
+        ),
+        'pending': pending,
+        'server': [app.server for app in queued],
+        'util0': util0,
+        'util1': util1,
+        'mem': demand[:, 0],
+        'cpu': demand[:, 1],
+        'disk': demand[:, 2],
     })
-    if frame.empty:
-        frame = pd.DataFrame(columns=columns)
-
-    return frame[columns].astype({
-        'mem': 'int',
-        'cpu': 'int',
-        'disk': 'int',
-        'order': 'int',
-        'expires': 'int',
-        'data_retention': 'int',
-        'identity': 'int'
-    }).sort_values(by=['partition',
-                       'rank',
-                       'util0',
-                       'util1',
-                       'pending',
-                       'order']).reset_index(drop=True)
+
+    return frame.sort_values(by=['partition',
+                                 'rank',
+                                 'util0',
+                                 'util1',
+                                 'pending',
+                                 'order']).reset_index(drop=True)
+
+
+def schedule_stats(cell):
+    """Prepare DataFrame with phase durations and counters of the last
+    schedule run.
+    """
+    columns = ['kind', 'name', 'value']
+
+    stats = cell.stats
+    rows = [
+        {'kind': 'run', 'name': 'timestamp', 'value': stats.timestamp},
+        {'kind': 'run', 'name': 'incremental',
+         'value': int(stats.incremental)},
+    ]
+    rows.extend(
+        {'kind': 'phase', 'name': name, 'value': value}
+        for name, value in sorted(six.iteritems(stats.phases))
+    )
+    rows.extend(
+        {'kind': 'counter', 'name': name, 'value': value}
+        for name, value in sorted(six.iteritems(stats.counters))
+    )
+
+    return pd.DataFrame.from_dict(rows)[columns]
 
 
 def utilization(prev_utilization, apps_df):
@@ -402,6 +424,204 @@ def explain_placement(cell, app, mode):
     return pd.DataFrame(result, columns=columns)
 
 
+# Batch explain checks, in the order servers are ruled out, followed by a
+# check per capacity dimension.
+_EXPLAIN_CHECKS = [
+    'partition', 'traits', 'affinity', 'state', 'lifetime',
+]
+
+# Names of the capacity dimensions, in the order loaded by the scheduler.
+_CAPACITY_DIMENSIONS = [
+    'memory', 'cpu', 'disk'
+]
+
+
+def _explain_checks():
+    """Return names of the batch explain checks.
+    """
+    return _EXPLAIN_CHECKS + [
+        _CAPACITY_DIMENSIONS[dim] if dim < len(_CAPACITY_DIMENSIONS)
+        else 'dim%d' % dim
+        for dim in six.moves.range(scheduler.DIMENSION_COUNT)
+    ]
+
+
+class PendingExplainer(object):
+    """Explains pending apps in bulk against a snapshot of the servers.
+
+    Server state, capacity, labels and traits are copied into arrays once,
+    so that every app is checked against all servers in one vectorized
+    pass. Apps of the same shape are checked only once.
+    """
+
+    __slots__ = (
+        'cell',
+        'servers',
+        'free',
+        'up',
+        'valid_until',
+        'labels',
+        'label_codes',
+        'traits',
+        'ancestors',
+    )
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.servers = list(six.itervalues(cell.members()))
+
+        self.free = np.array(
+            [server.free_capacity for server in self.servers], dtype=float
+        ).reshape(len(self.servers), scheduler.DIMENSION_COUNT)
+        self.up = np.array(
+            [server.state is scheduler.State.up for server in self.servers],
+            dtype=bool
+        )
+        self.valid_until = np.array(
+            [server.valid_until for server in self.servers], dtype=float
+        )
+
+        self.label_codes = {}
+        self.labels = np.array([
+            self.label_codes.setdefault(
+                next(iter(server.labels)), len(self.label_codes)
+            )
+            for server in self.servers
+        ], dtype=np.int64)
+        # Traits are arbitrary length bit masks.
+        self.traits = np.array(
+            [server.traits.traits for server in self.servers], dtype=object
+        )
+
+        # Level to (ancestor nodes, index of the ancestor of each server),
+        # index is -1 for servers without ancestor at the level.
+        ancestors = collections.defaultdict(dict)
+        for idx, server in enumerate(self.servers):
+            node = server.parent
+            while node is not None:
+                ancestors[node.level][idx] = node
+                node = node.parent
+
+        self.ancestors = {}
+        for level, by_server in six.iteritems(ancestors):
+            nodes = []
+            node_idx = {}
+            index = np.full(len(self.servers), -1, dtype=np.int64)
+            for idx, node in six.iteritems(by_server):
+                if id(node) not in node_idx:
+                    node_idx[id(node)] = len(nodes)
+                    nodes.append(node)
+                index[idx] = node_idx[id(node)]
+            self.ancestors[level] = (nodes, index)
+
+    def _affinity_counts(self, name, level, cache):
+        """Return count of apps with the affinity at the level per server.
+        """
+        key = (name, level)
+        if key not in cache:
+            if level == 'server':
+                counts = np.array(
+                    [server.affinity_counters[name]
+                     for server in self.servers],
+                    dtype=np.int64
+                )
+            elif level in self.ancestors:
+                nodes, index = self.ancestors[level]
+                # Servers without ancestor at the level index the last, zero
+                # count.
+                counts = np.array(
+                    [node.affinity_counters[name] for node in nodes] + [0],
+                    dtype=np.int64
+                )[index]
+            else:
+                counts = np.zeros(len(self.servers), dtype=np.int64)
+            cache[key] = counts
+        return cache[key]
+
+    def _check(self, app, now, cache):
+        """Return number of servers left after each of the checks.
+        """
+        feasible = np.ones(len(self.servers), dtype=bool)
+        result = []
+
+        def _apply(mask):
+            """Narrow down feasible servers, record how many are left."""
+            np.logical_and(feasible, mask, out=feasible)
+            result.append(int(np.count_nonzero(feasible)))
+
+        if app.allocation is not None:
+            code = self.label_codes.get(app.allocation.label, -1)
+            _apply(self.labels == code)
+        else:
+            _apply(True)
+
+        if app.traits:
+            _apply((self.traits & app.traits) == app.traits)
+        else:
+            _apply(True)
+
+        affinity = np.ones(len(self.servers), dtype=bool)
+        for level, limit in six.iteritems(app.affinity.limits):
+            if limit < float('inf'):
+                affinity &= (
+                    self._affinity_counts(app.affinity.name, level, cache) <
+                    limit
+                )
+        _apply(affinity)
+
+        _apply(self.up)
+
+        if app.lease:
+            _apply(self.valid_until > now + app.lease)
+        else:
+            _apply(True)
+
+        for dim, demand in enumerate(app.demand):
+            _apply(self.free[:, dim] >= demand)
+
+        return result
+
+    def explain(self, pending_apps):
+        """Explain apps, return DataFrame with row per app.
+
+        Columns are the number of servers left after each consecutive check,
+        reason is the first check which rules out all servers, empty if there
+        are servers the app fits on.
+        """
+        now = time.time()
+        cache = {}
+        checked = {}
+        rows = []
+        checks = _explain_checks()
+        for app in pending_apps:
+            shape = (
+                app.allocation.label if app.allocation is not None else None,
+                app.traits,
+                app.affinity.name,
+                tuple(sorted(six.iteritems(app.affinity.limits))),
+                app.lease,
+                tuple(app.demand.tolist()),
+            )
+            if shape not in checked:
+                checked[shape] = self._check(app, now, cache)
+
+            counts = checked[shape]
+            reason = ''
+            for check, count in six.moves.zip(checks, counts):
+                if not count:
+                    reason = check
+                    break
+            rows.append([app.name] + counts + [reason])
+
+        columns = ['name'] + checks + ['reason']
+        return pd.DataFrame(rows, columns=columns)
+
+
+def explain_pending(cell, pending_apps):
+    """Explain why the apps are pending, see PendingExplainer."""
+    return PendingExplainer(cell).explain(pending_apps)
+
+
 def serialize_dataframe(report, compressed=True):
     """Serialize a dataframe for storing.
 
@@ -413,13 +633,207 @@ def serialize_dataframe(report, compressed=True):
     return result
 
 
-def deserialize_dataframe(report):
+def deserialize_dataframe(report, delta=None):
     """Deserialize a dataframe.
 
-    The dataframe is serialized as CSV and compressed with bzip2.
+    The dataframe is serialized in columnar format, optionally with delta
+    against it, or as CSV compressed with bzip2.
     """
+    if report[:len(_COLUMNAR_MAGIC)] == _COLUMNAR_MAGIC:
+        arrays, strings = _load_columns(report)
+        frame = _decode_columns(arrays, 'r', strings)
+        if delta is None:
+            return frame
+
+        delta_arrays, delta_strings = _load_columns(delta)
+        if delta_arrays['base'] != arrays['generation']:
+            _LOGGER.info('Report delta does not match the report, ignored.')
+            return frame
+
+        upserts = _decode_columns(delta_arrays, 'u', delta_strings)
+        return _apply_delta(frame, delta_arrays['index'], upserts)
+
     try:
         content = bz2.decompress(report)
     except IOError:
         content = report
     return pd.read_csv(io.StringIO(content.decode()))
+
+
+def serialize_columns(report, generation):
+    """Serialize a dataframe in columnar format.
+
+    Numeric columns are stored as typed numpy arrays, other columns are
+    dictionary encoded against a string table, with -1 for missing values.
+    Object columns of integers (e.g. trait masks too large for int64) are
+    encoded as their decimal strings and decoded back to integers.
+    Generation identifies the report for the deltas against it.
+    """
+    arrays = {'generation': np.array(generation, dtype=float)}
+    strings = {}
+    _encode_columns(report, 'r', arrays, strings)
+    return _save_columns(arrays, strings)
+
+
+def serialize_delta(base, report, generation):
+    """Serialize a dataframe as delta against the base of given generation.
+
+    Rows found unchanged in the base are stored as index into the base, only
+    the others are stored in full. Returns None if the delta is not worth it.
+    """
+    if list(base.columns) != list(report.columns):
+        return None
+
+    index = _match_rows(base, report)
+    changed = np.flatnonzero(index < 0)
+    if len(changed) > len(report) * _DELTA_MAX_RATIO:
+        return None
+
+    index[changed] = -1 - np.arange(len(changed))
+
+    arrays = {'base': np.array(generation, dtype=float), 'index': index}
+    strings = {}
+    _encode_columns(report.iloc[changed], 'u', arrays, strings)
+    return _save_columns(arrays, strings)
+
+
+def _match_rows(base, report):
+    """Return position of each report row in base, -1 if not found."""
+    positions = dict(six.moves.zip(
+        pd.util.hash_pandas_object(base, index=False).tolist(),
+        six.moves.range(len(base))
+    ))
+    index = np.array(
+        [
+            positions.get(row_hash, -1)
+            for row_hash in pd.util.hash_pandas_object(
+                report, index=False
+            ).tolist()
+        ],
+        dtype=np.int64
+    )
+
+    # Verify matched rows, in case of hash collision.
+    matched = np.flatnonzero(index >= 0)
+    same = np.ones(len(matched), dtype=bool)
+    for column in report.columns:
+        left = base[column].values[index[matched]]
+        right = report[column].values[matched]
+        same &= (left == right) | (pd.isnull(left) & pd.isnull(right))
+    index[matched[~same]] = -1
+    return index
+
+
+def _apply_delta(base, index, upserts):
+    """Reconstruct dataframe from the base and the delta."""
+    combined = pd.concat([base, upserts], ignore_index=True)
+    positions = np.where(index >= 0, index, len(base) - 1 - index)
+    return combined.iloc[positions].reset_index(drop=True)
+
+
+def _encode_columns(frame, prefix, arrays, strings):
+    """Encode dataframe columns, adding new strings to the string table."""
+    arrays[prefix + 'columns'] = np.array(
+        [strings.setdefault(column, len(strings)) for column in frame.columns],
+        dtype=np.int32
+    )
+    for idx, column in enumerate(frame.columns):
+        values = frame[column].values
+        if values.dtype.kind in 'biuf':
+            arrays['{}n{}'.format(prefix, idx)] = values
+        else:
+            kind = 'i' if _is_integers(values) else 's'
+            arrays['{}{}{}'.format(prefix, kind, idx)] = np.array(
+                [
+                    -1 if pd.isnull(value) else strings.setdefault(
+                        six.text_type(value), len(strings)
+                    )
+                    for value in values
+                ],
+                dtype=np.int32
+            )
+
+
+def _is_integers(values):
+    """Check if object column values are integers or missing."""
+    present = False
+    for value in values:
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, six.integer_types):
+            present = True
+        elif not pd.isnull(value):
+            return False
+    return present
+
+
+def _decode_columns(arrays, prefix, strings):
+    """Decode dataframe columns, strings are looked up in the string table."""
+    columns = strings[arrays[prefix + 'columns']].tolist()
+    data = {}
+    for idx, column in enumerate(columns):
+        numeric = '{}n{}'.format(prefix, idx)
+        integers = '{}i{}'.format(prefix, idx)
+        if numeric in arrays:
+            data[column] = arrays[numeric]
+        elif integers in arrays:
+            data[column] = np.array(
+                [
+                    None if value is None else int(value)
+                    for value in strings[arrays[integers]]
+                ],
+                dtype=object
+            )
+        else:
+            data[column] = strings[arrays['{}s{}'.format(prefix, idx)]]
+    return _frame(columns, data)
+
+
+def _save_columns(arrays, strings):
+    """Pack arrays and the string table, compressed with bzip2.
+
+    Array bytes are shuffled, grouping same significance bytes of all the
+    values together, which makes them compress much better.
+    """
+    header = json.dumps({
+        'arrays': [
+            [name, array.dtype.str, list(array.shape)]
+            for name, array in sorted(six.iteritems(arrays))
+        ],
+        'strings': sorted(strings, key=strings.get),
+    }).encode()
+    payload = [struct.pack('<I', len(header)), header]
+    payload.extend(
+        np.ascontiguousarray(array.reshape(-1)).view(np.uint8).reshape(
+            -1, array.dtype.itemsize
+        ).T.tobytes()
+        for _name, array in sorted(six.iteritems(arrays))
+    )
+    return _COLUMNAR_MAGIC + bz2.compress(b''.join(payload))
+
+
+def _load_columns(data):
+    """Unpack arrays and the string table.
+
+    Missing value code -1 indexes the last entry of the string table, None.
+    """
+    payload = bz2.decompress(data[len(_COLUMNAR_MAGIC):])
+    (header_size,) = struct.unpack_from('<I', payload)
+    offset = struct.calcsize('<I') + header_size
+    header = json.loads(payload[struct.calcsize('<I'):offset].decode())
+
+    arrays = {}
+    for name, dtype, shape in header['arrays']:
+        dtype = np.dtype(str(dtype))
+        count = int(np.prod(shape))
+        shuffled = np.frombuffer(
+            payload, dtype=np.uint8, count=count * dtype.itemsize,
+            offset=offset
+        ).reshape(dtype.itemsize, count)
+        arrays[name] = np.ascontiguousarray(shuffled.T).view(dtype).reshape(
+            shape
+        )
+        offset += count * dtype.itemsize
+
+    strings = np.array(header['strings'] + [None], dtype=object)
+    return arrays, strings
@@ -111,6 +111,23 @@ def init(api, cors, impl):
             args = arg_parser.parse_args()
             return fetch_report('apps', **args)
 
+    @namespace.route('/explain')
+    class _ExplainPendingResource(restplus.Resource):
+        """Batch explain resource."""
+        @webutils.get_api(
+            api,
+            cors,
+            resp_model=report_resource_resp_model,
+            parser=arg_parser,
+            json_resp=False  # Bypass webutils.as_json
+        )
+        def get(self):
+            """Return why pending apps are not placed."""
+            args = arg_parser.parse_args()
+            output = report_to_dict(impl.explain.list(**args))
+            return flask.Response(flask.json.dumps(output),
+                                  mimetype='application/json')
+
     @namespace.route('/explain/<instance>')
     class _ExplainResource(restplus.Resource):
         """Explain resource."""
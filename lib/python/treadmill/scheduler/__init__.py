@@ -7,14 +7,31 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import abc
+import bisect
 import collections
+import contextlib
 import datetime
+import functools
+import gc
 import heapq
 import itertools
 import logging
+import multiprocessing
 import operator
+import os
 import sys
 import time
+import zlib
+
+try:
+    import cPickle as pickle  # pylint: disable=wrong-import-order
+except ImportError:
+    import pickle  # pylint: disable=wrong-import-order
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = dict
 
 import enum
 
@@ -32,6 +49,9 @@ DIMENSION_COUNT = None
 _MAX_UTILIZATION = float('inf')
 _GLOBAL_ORDER_BASE = time.mktime((2014, 1, 1, 0, 0, 0, 0, 0, 0))
 
+# Version of the cell snapshot format, bump on incompatible model changes.
+_SNAPSHOT_VERSION = 5
+
 # 21 day
 DEFAULT_SERVER_UPTIME = 21 * 24 * 60 * 60
 
@@ -180,30 +200,57 @@ def _all_ge(left, right):
 
 class IdentityGroup(object):
     """Identity group.
+
+    If ordered is set, the lowest available identity is acquired, so that
+    the result does not depend on the order of previous releases. Used when
+    partitions are scheduled in parallel.
     """
     __slots__ = (
         'available',
         'count',
+        '_free',
     )
 
-    def __init__(self, count=0):
+    def __init__(self, count=0, ordered=False):
         self.count = count
         self.available = set(range(0, count))
+        # Heap of available identities, may contain already acquired ones.
+        self._free = None
+        if ordered:
+            self._free = list(self.available)
+            heapq.heapify(self._free)
 
     def acquire(self):
         """Return next available identity or None.
         """
-        if self.available:
-            return self.available.pop()
-        else:
+        if not self.available:
             return None
 
+        if self._free is None:
+            return self.available.pop()
+
+        identity = heapq.heappop(self._free)
+        while identity not in self.available:
+            identity = heapq.heappop(self._free)
+        self.available.remove(identity)
+        return identity
+
     def release(self, ident):
         """Mark identity as available.
         """
         if ident < self.count:
+            if self._free is not None and ident not in self.available:
+                heapq.heappush(self._free, ident)
             self.available.add(ident)
 
+    def reset(self, available):
+        """Reset available identities.
+        """
+        self.available = set(available)
+        if self._free is not None:
+            self._free = list(self.available)
+            heapq.heapify(self._free)
+
     def adjust(self, count):
         """Adjust identities with new count.
 
@@ -214,7 +261,11 @@ class IdentityGroup(object):
         schedule cycle.
         """
         if count >= self.count:
-            self.available ^= set(six.moves.xrange(self.count, count))
+            added = set(six.moves.xrange(self.count, count))
+            if self._free is not None:
+                for ident in added - self.available:
+                    heapq.heappush(self._free, ident)
+            self.available ^= added
         else:
             self.available -= set(six.moves.xrange(count, self.count))
         self.count = count
@@ -235,6 +286,12 @@ class State(enum.Enum):
     frozen = 'frozen'
 
 
+def _unlimited():
+    """Default affinity limit.
+    """
+    return float('inf')
+
+
 class Affinity(object):
     """Model affinity and affinity limits.
     """
@@ -246,13 +303,24 @@ class Affinity(object):
 
     def __init__(self, name, limits=None):
         self.name = name
-        self.limits = collections.defaultdict(lambda: float('inf'))
+        self.limits = collections.defaultdict(_unlimited)
         if limits:
             self.limits.update(limits)
 
         # freeze affinity shape constraints.
         self.constraints = tuple([self.name] + sorted(self.limits.values()))
 
+    def __getstate__(self):
+        """Return picklable state.
+        """
+        return self.name, dict(self.limits), self.constraints
+
+    def __setstate__(self, state):
+        """Restore state.
+        """
+        self.name, limits, self.constraints = state
+        self.limits = collections.defaultdict(_unlimited, limits)
+
 
 class Application(object):
     """Application object.
@@ -263,10 +331,10 @@ class Application(object):
         'name',
         'demand',
         'affinity',
-        'priority',
+        '_priority',
         'allocation',
         'data_retention_timeout',
-        'server',
+        '_server',
         'lease',
         'identity',
         'identity_group',
@@ -306,6 +374,53 @@ class Application(object):
         self.placement_expiry = None
         self.renew = False
 
+    def __getstate__(self):
+        """Return picklable state, demand is stored as a list.
+        """
+        state = {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if hasattr(self, slot)
+        }
+        state['demand'] = self.demand.tolist()
+        return state
+
+    def __setstate__(self, state):
+        """Restore state.
+        """
+        for slot, value in six.iteritems(state):
+            setattr(self, slot, value)
+        self.demand = np.array(self.demand, dtype=float)
+
+    @property
+    def priority(self):
+        """Application priority.
+        """
+        return self._priority
+
+    @priority.setter
+    def priority(self, priority):
+        """Set priority, invalidating the allocation queue order.
+        """
+        if self.allocation is not None:
+            self.allocation.reset_queue()
+        self._priority = priority
+
+    @property
+    def server(self):
+        """Name of the server the app is placed on, None if pending.
+        """
+        return self._server
+
+    @server.setter
+    def server(self, server):
+        """Set server, pending apps are ordered after the placed ones.
+        """
+        if self.allocation is not None and (
+                bool(server) != bool(self._server)):
+            self.allocation.reset_queue()
+        self._server = server
+
     def shape(self):
         """Return tuple of application (constraints, demand).
 
@@ -366,6 +481,8 @@ class Application(object):
 @six.add_metaclass(abc.ABCMeta)
 class Strategy(object):
     """Base class for all placement strategies.
+
+    Strategies keep position of the next node to suggest in current_idx.
     """
 
     @abc.abstractmethod
@@ -380,6 +497,30 @@ class Strategy(object):
         """
         pass
 
+    def reject_all(self):
+        """Advance the strategy as if all suggested nodes were rejected.
+
+        Mirrors iteration in Bucket.put, which stops once the first suggested
+        node comes up again.
+        """
+        first = self.suggested_node()
+        if first is None:
+            return
+
+        node = self.next_node()
+        while node.name != first.name:
+            node = self.next_node()
+
+    def get_state(self):
+        """Return strategy position.
+        """
+        return self.current_idx
+
+    def set_state(self, state):
+        """Reset strategy position, used when no node accepted the app.
+        """
+        self.current_idx = state
+
 
 class SpreadStrategy(Strategy):
     """Spread strategy will suggest new node for each subsequent placement.
@@ -412,6 +553,11 @@ class SpreadStrategy(Strategy):
         """
         return self.suggested_node()
 
+    def reject_all(self):
+        """Full cycle ends right after the first suggested node.
+        """
+        self.suggested_node()
+
 
 class PackStrategy(Strategy):
     """Pack strategy will suggest same node until it is full.
@@ -443,6 +589,11 @@ class PackStrategy(Strategy):
         self.current_idx += 1
         return self.suggested_node()
 
+    def reject_all(self):
+        """Full cycle ends on the first suggested node.
+        """
+        self.suggested_node()
+
 
 class TraitSet(object):
     """Hierarchical set of traits.
@@ -509,6 +660,223 @@ class AffinityCounter(object):
         self.affinity_counter = collections.Counter()
 
 
+class CapacityMatrix(object):
+    """Structure-of-arrays storage of node capacity.
+
+    Free and total capacity of every node attached to the matrix is kept in
+    a single contiguous N x DIMENSION_COUNT array, indexed by node id. Nodes
+    read and write their capacity through row views, which allows bucket
+    aggregates and feasibility checks to run as vectorized operations.
+
+    Capacity is stored column major, so that checks across all nodes compare
+    contiguous per dimension columns.
+    """
+    __slots__ = (
+        'free',
+        'capacity',
+        'parent',
+        'up',
+        'server',
+        'label',
+        'traits',
+        'valid_until',
+        'label_codes',
+        'nodes',
+        '_released',
+    )
+
+    _INITIAL_SIZE = 64
+
+    # Per node columns, with the value of unused rows.
+    _COLUMNS = (
+        ('free', 0),
+        ('capacity', 0),
+        ('parent', -1),
+        ('up', False),
+        ('server', False),
+        ('label', -1),
+        ('traits', 0),
+        ('valid_until', 0.0),
+    )
+
+    def __init__(self):
+        size = self._INITIAL_SIZE
+        self.free = np.zeros((size, DIMENSION_COUNT), order='F')
+        self.capacity = np.zeros((size, DIMENSION_COUNT), order='F')
+        self.parent = np.full(size, -1, dtype=np.int64)
+        self.up = np.zeros(size, dtype=bool)
+        self.server = np.zeros(size, dtype=bool)
+        self.label = np.full(size, -1, dtype=np.int64)
+        # Traits are arbitrary length bit masks.
+        self.traits = np.full(size, 0, dtype=object)
+        self.valid_until = np.zeros(size)
+        self.label_codes = dict()
+        self.nodes = []
+        self._released = []
+
+    def __len__(self):
+        return len(self.nodes) - len(self._released)
+
+    def _grow(self):
+        """Double the number of rows in every column.
+        """
+        size = len(self.parent)
+        for column, unused in self._COLUMNS:
+            current = getattr(self, column)
+            grown = np.full((2 * size,) + current.shape[1:], unused,
+                            dtype=current.dtype, order='F')
+            grown[:size] = current
+            setattr(self, column, grown)
+
+    def _allocate(self, node):
+        """Allocate row for the node, return node id.
+        """
+        if self._released:
+            node_id = self._released.pop()
+            self.nodes[node_id] = node
+        else:
+            node_id = len(self.nodes)
+            if node_id == len(self.parent):
+                self._grow()
+            self.nodes.append(node)
+        return node_id
+
+    def label_code(self, label):
+        """Return integer code of the label, allocate if new.
+        """
+        code = self.label_codes.get(label)
+        if code is None:
+            code = len(self.label_codes)
+            self.label_codes[label] = code
+        return code
+
+    def attach(self, node):
+        """Attach node and all its children to the matrix.
+        """
+        assert node.matrix is None
+        free_capacity = node.free_capacity
+        node_id = self._allocate(node)
+
+        self.free[node_id] = free_capacity
+        self.up[node_id] = node.state is State.up
+        self.valid_until[node_id] = node.valid_until
+        if node.parent is not None and node.parent.matrix is self:
+            self.parent[node_id] = node.parent.node_id
+        else:
+            self.parent[node_id] = -1
+
+        if isinstance(node, Server):
+            self.server[node_id] = True
+            self.capacity[node_id] = node.init_capacity
+            self.label[node_id] = self.label_code(next(iter(node.labels)))
+            self.traits[node_id] = node.traits.traits
+        else:
+            self.server[node_id] = False
+            self.capacity[node_id] = 0
+            self.label[node_id] = -1
+            self.traits[node_id] = 0
+
+        node.matrix = self
+        node.node_id = node_id
+        node.reset_child_ids()
+        for child in node.children_iter():
+            self.attach(child)
+
+    def detach(self, node):
+        """Detach node and all its children, copying capacity out.
+        """
+        assert node.matrix is self
+        for child in node.children_iter():
+            self.detach(child)
+
+        node_id = node.node_id
+        free_capacity = self.free[node_id].copy()
+
+        for column, unused in self._COLUMNS:
+            getattr(self, column)[node_id] = unused
+        self.nodes[node_id] = None
+        self._released.append(node_id)
+
+        node.matrix = None
+        node.node_id = None
+        node.free_capacity = free_capacity
+        node.reset_child_ids()
+
+    def max_free(self, node_ids):
+        """Element-wise max of free capacity over nodes that are up.
+        """
+        node_ids = node_ids[self.up[node_ids]]
+        free_capacity = zero_capacity()
+        if len(node_ids):
+            np.maximum(free_capacity, self.free[node_ids].max(axis=0),
+                       out=free_capacity)
+        return free_capacity
+
+    def fits(self, demand, node_ids=None):
+        """Return boolean mask of nodes where demand fits free capacity.
+        """
+        if node_ids is None:
+            node_ids = slice(0, len(self.nodes))
+
+        fits = self.free[node_ids, 0] >= demand[0]
+        for dim in six.moves.range(1, len(demand)):
+            fits &= self.free[node_ids, dim] >= demand[dim]
+        return fits
+
+    def feasible(self, app):
+        """Return boolean mask of servers where the app can be placed.
+
+        Server is feasible if it is up and satisfies app label, traits,
+        capacity and lifetime. Affinity limits are not considered. Buckets
+        are set in the mask if there is a feasible server in their subtree.
+        """
+        count = len(self.nodes)
+        feasible = self.server[:count] & self.up[:count]
+        if app.allocation is not None:
+            code = self.label_codes.get(app.allocation.label)
+            if code is None:
+                return np.zeros(count, dtype=bool)
+            feasible &= self.label[:count] == code
+
+        if app.lease:
+            feasible &= self.valid_until[:count] > time.time() + app.lease
+
+        feasible &= self.fits(app.demand)
+
+        if app.traits:
+            node_ids = np.flatnonzero(feasible)
+            feasible[node_ids] = (
+                (self.traits[node_ids] & app.traits) == app.traits
+            )
+
+        node_ids = np.flatnonzero(feasible)
+        while len(node_ids):
+            parents = np.unique(self.parent[node_ids])
+            parents = parents[parents >= 0]
+            node_ids = parents[~feasible[parents]]
+            feasible[node_ids] = True
+
+        return feasible
+
+    def size(self, bucket, label):
+        """Total capacity of the bucket children for the given label.
+
+        Matches the recursive Node.size, children that do not have the label
+        contribute eps capacity.
+        """
+        node_ids = bucket.child_ids()
+        sizes = self.capacity[node_ids]
+
+        servers = self.server[node_ids]
+        code = self.label_codes.get(label, -2)
+        sizes[servers & (self.label[node_ids] != code)] = eps_capacity()
+
+        for idx in np.flatnonzero(~servers):
+            sizes[idx] = self.nodes[node_ids[idx]].size(label)
+
+        return np.sum(sizes, 0)
+
+
 class Node(object):
     """Abstract placement node.
     """
@@ -516,14 +884,16 @@ class Node(object):
     __slots__ = (
         'name',
         'level',
-        'free_capacity',
+        'matrix',
+        'node_id',
+        '_free_capacity',
         'parent',
         'children',
         'children_by_name',
         'traits',
         'labels',
         'affinity_counters',
-        'valid_until',
+        '_valid_until',
         '_state',
         '_state_since',
     )
@@ -531,6 +901,8 @@ class Node(object):
     def __init__(self, name, traits, level, valid_until=0):
         self.name = name
         self.level = level
+        self.matrix = None
+        self.node_id = None
         self.free_capacity = zero_capacity()
         self.parent = None
         self.children = list()
@@ -547,6 +919,67 @@ class Node(object):
         """
         return not bool(self.children_by_name)
 
+    @property
+    def valid_until(self):
+        """Time until which the node is valid, 0 if not set.
+        """
+        return self._valid_until
+
+    @valid_until.setter
+    def valid_until(self, valid_until):
+        """Set valid until time, mirrored to the capacity matrix.
+        """
+        if self.parent and valid_until != self._valid_until:
+            self.parent.invalidate(self.labels)
+        self._valid_until = valid_until
+        if self.matrix is not None:
+            self.matrix.valid_until[self.node_id] = valid_until
+
+    @property
+    def free_capacity(self):
+        """Free capacity, row view of the capacity matrix if attached.
+        """
+        if self.matrix is None:
+            return self._free_capacity
+        return self.matrix.free[self.node_id]
+
+    @free_capacity.setter
+    def free_capacity(self, free_capacity):
+        """Set free capacity, in place if attached to capacity matrix.
+        """
+        if self.matrix is None:
+            self._free_capacity = free_capacity
+        else:
+            self.matrix.free[self.node_id] = free_capacity
+
+    def reset_child_ids(self):
+        """Invalidate cached ids of the children, no-op for leaf nodes.
+        """
+
+    def invalidate(self, labels):
+        """Propagate change in given partitions up to the top level node.
+        """
+        if self.parent:
+            self.parent.invalidate(labels)
+
+    def reset_sizes(self):
+        """Invalidate cached capacity totals up to the top level node.
+        """
+        if self.parent:
+            self.parent.reset_sizes()
+
+    def add_members(self, members):
+        """Propagate new leaf nodes up to the top level node.
+        """
+        if self.parent:
+            self.parent.add_members(members)
+
+    def remove_members(self, members):
+        """Propagate removed leaf nodes up to the top level node.
+        """
+        if self.parent:
+            self.parent.remove_members(members)
+
     def children_iter(self):
         """Iterate over active children.
         """
@@ -564,7 +997,10 @@ class Node(object):
         """
         if self._state is not state:
             self._state_since = since
+            self.invalidate(self.labels)
         self._state = state
+        if self.matrix is not None:
+            self.matrix.up[self.node_id] = state is State.up
         _LOGGER.debug('state: %s - (%s, %s)',
                       self.name, self._state, self._state_since)
 
@@ -614,10 +1050,16 @@ class Node(object):
     def reset_children(self):
         """Reset children to empty list.
         """
+        self.remove_members(self.members())
         for child in self.children_iter():
+            if self.matrix is not None:
+                self.matrix.detach(child)
             child.parent = None
         self.children = list()
         self.children_by_name = dict()
+        self.reset_child_ids()
+        self.reset_sizes()
+        self.invalidate(None)
 
     def add_node(self, node):
         """Add child node, set the traits and propagate traits up.
@@ -628,11 +1070,17 @@ class Node(object):
         node.parent = self
         self.children.append(node)
         self.children_by_name[node.name] = node
+        self.reset_child_ids()
+        self.reset_sizes()
+        if self.matrix is not None:
+            self.matrix.attach(node)
 
         self.add_child_traits(node)
         self.increment_affinity(node.affinity_counters)
         self.add_labels(node.labels)
         self.adjust_valid_until(node.valid_until)
+        self.invalidate(node.labels)
+        self.add_members(node.members())
 
     def add_labels(self, labels):
         """Recursively add labels to self and parents.
@@ -651,9 +1099,16 @@ class Node(object):
             if self.children[idx] == node:
                 self.children[idx] = None
 
+        self.reset_child_ids()
+        self.reset_sizes()
+        if self.matrix is not None:
+            self.matrix.detach(node)
+
         self.remove_child_traits(node.name)
         self.decrement_affinity(node.affinity_counters)
         self.adjust_valid_until(None)
+        self.invalidate(node.labels)
+        self.remove_members(node.members())
 
         node.parent = None
         return node
@@ -697,12 +1152,20 @@ class Node(object):
         """
         raise Exception('Not implemented.')
 
+    def put_feasible(self, app, _feasible, _isolated=False):
+        """Put app on the node, given feasible servers mask.
+        """
+        return self.put(app)
+
     def size(self, label):
         """Returns total capacity of the children.
         """
         if self.empty() or label not in self.labels:
             return eps_capacity()
 
+        if self.matrix is not None:
+            return self.matrix.size(self, label)
+
         return np.sum([
             n.size(label) for n in self.children_iter()], 0)
 
@@ -737,15 +1200,51 @@ class Bucket(Node):
     __slots__ = (
         'affinity_strategies',
         'traits',
+        '_child_ids',
+        '_sizes',
     )
 
     _default_strategy_t = SpreadStrategy
 
     def __init__(self, name, traits=0, level=None):
+        self._child_ids = None
+        # Total capacity of the children by label, computed on demand.
+        self._sizes = dict()
         super(Bucket, self).__init__(name, traits, level)
         self.affinity_strategies = dict()
         self.traits = TraitSet(traits)
 
+    def reset_child_ids(self):
+        """Invalidate cached ids of the children.
+        """
+        self._child_ids = None
+
+    def reset_sizes(self):
+        """Invalidate cached capacity totals up to the top level node.
+        """
+        self._sizes.clear()
+        super(Bucket, self).reset_sizes()
+
+    def size(self, label):
+        """Returns total capacity of the children, cached per label.
+        """
+        size = self._sizes.get(label)
+        if size is None:
+            size = super(Bucket, self).size(label)
+            self._sizes[label] = size
+        return size
+
+    def child_ids(self):
+        """Return capacity matrix ids of the children, in children order.
+        """
+        assert self.matrix is not None
+        if self._child_ids is None:
+            self._child_ids = np.array(
+                [child.node_id for child in self.children_iter()],
+                dtype=np.int64
+            )
+        return self._child_ids
+
     def set_affinity_strategy(self, affinity, strategy_t):
         """Initilaizes placement strategy for given affinity.
         """
@@ -762,7 +1261,11 @@ class Bucket(Node):
     def adjust_capacity_up(self, new_capacity):
         """Node can only increase capacity.
         """
-        self.free_capacity = np.maximum(self.free_capacity, new_capacity)
+        if self.matrix is not None:
+            free_capacity = self.matrix.free[self.node_id]
+            np.maximum(free_capacity, new_capacity, out=free_capacity)
+        else:
+            self.free_capacity = np.maximum(self.free_capacity, new_capacity)
         if self.parent:
             self.parent.adjust_capacity_up(self.free_capacity)
 
@@ -778,13 +1281,16 @@ class Bucket(Node):
                                                      self.free_capacity):
                 return
 
-            free_capacity = zero_capacity()
-            for child_node in self.children_iter():
-                if child_node.state is not State.up:
-                    continue
+            if self.matrix is not None:
+                free_capacity = self.matrix.max_free(self.child_ids())
+            else:
+                free_capacity = zero_capacity()
+                for child_node in self.children_iter():
+                    if child_node.state is not State.up:
+                        continue
 
-                free_capacity = np.maximum(free_capacity,
-                                           child_node.free_capacity)
+                    free_capacity = np.maximum(free_capacity,
+                                               child_node.free_capacity)
             # If resulting free_capacity is less the previous, we need to
             # adjust the parent, otherwise, nothing needs to be done.
             prev_capacity = self.free_capacity.copy()
@@ -811,6 +1317,22 @@ class Bucket(Node):
     def put(self, app):
         """Try to put app on one of the nodes that belong to the bucket.
         """
+        feasible = None
+        if self.matrix is not None:
+            feasible = self.matrix.feasible(app)
+        return self.put_feasible(app, feasible)
+
+    def put_feasible(self, app, feasible, isolated=False):
+        """Try to put app on one of the nodes, skipping infeasible servers.
+
+        If feasible servers mask is given, servers and buckets outside of the
+        mask are not tried. Strategies still advance as if they were (see
+        reject), so the placement is the same as if every server was tried.
+
+        If isolated is set and the app is not placed, the strategy position
+        is reset instead, so that the placement does not depend on apps of
+        other partitions.
+        """
         # Check if it is feasible to put app on some node low in the
         # hierarchy
         _LOGGER.debug('bucket.put: %s => %s', app.name, self.name)
@@ -819,9 +1341,18 @@ class Bucket(Node):
             return False
 
         strategy = self.get_affinity_strategy(app.affinity.name)
+        if feasible is not None and not feasible[self.node_id]:
+            # No feasible server in the bucket, nothing to try.
+            if not isolated:
+                self._reject_children(app, strategy)
+            return False
+
+        state = strategy.get_state()
         node = strategy.suggested_node()
         if node is None:
             _LOGGER.debug('All nodes in the bucket deleted.')
+            if isolated:
+                strategy.set_state(state)
             return False
 
         nodename0 = node.name
@@ -838,14 +1369,36 @@ class Bucket(Node):
 
             if node.state is not State.up:
                 _LOGGER.debug('Node not up: %s, %s', node.name, node.state)
-            else:
-                if node.put(app):
+            elif feasible is None or feasible[node.node_id]:
+                if node.put_feasible(app, feasible, isolated):
                     return True
+            elif not isolated and not self.matrix.server[node.node_id]:
+                node.reject(app)
 
             node = strategy.next_node()
 
+        if isolated:
+            strategy.set_state(state)
         return False
 
+    def reject(self, app):
+        """Advance strategies of the bucket subtree as if every server
+        rejected the app.
+        """
+        if self.check_app_constraints(app):
+            self._reject_children(
+                app, self.get_affinity_strategy(app.affinity.name)
+            )
+
+    def _reject_children(self, app, strategy):
+        """Advance the strategy and strategies of the child buckets as if
+        every server rejected the app.
+        """
+        strategy.reject_all()
+        for child in self.children_iter():
+            if isinstance(child, Bucket) and child.state is State.up:
+                child.reject(app)
+
 
 class Server(Node):
     """Server object, final app placement.
@@ -894,6 +1447,16 @@ class Server(Node):
         if not self.check_app_constraints(app):
             return False
 
+        self.attach(app)
+
+        if app.placement_expiry is None:
+            app.placement_expiry = time.time() + app.lease
+        return True
+
+    def attach(self, app):
+        """Attach the app to the server, without checking constraints.
+        """
+        assert app.name not in self.apps
         prev_capacity = self.free_capacity.copy()
         self.free_capacity -= app.demand
         self.apps[app.name] = app
@@ -903,10 +1466,6 @@ class Server(Node):
         if self.parent:
             self.parent.adjust_capacity_down(prev_capacity)
 
-        if app.placement_expiry is None:
-            app.placement_expiry = time.time() + app.lease
-        return True
-
     def restore(self, app, placement_expiry=None):
         """Put app back on the server, ignore app lifetime.
         """
@@ -999,6 +1558,85 @@ class Server(Node):
             raise Exception('Invalid state: ' % state)
 
 
+def _app_key(app):
+    """Compares apps by priority, state, global index
+    """
+    return (-app.priority, 0 if app.server else 1, app.global_order, app.name)
+
+
+def _utilization_columns(demand, allocated, available, zero):
+    """Calculates utilization score of each app in the queue.
+
+    Demand is the matrix of app demands in queue order, zero is the mask of
+    priority 0 apps. Returns tuple of (acc_demand, util_before, util_after).
+    """
+    acc_demand = np.cumsum(demand, axis=0)
+    util_after = np.max((acc_demand - allocated) / available, axis=1)
+    # Priority 0 apps are treated specially - utilization is set to max
+    # float.
+    #
+    # This ensures that they are at the end of the all queues.
+    util_after[zero] = _MAX_UTILIZATION
+
+    util_before = np.empty_like(util_after)
+    util_before[:1] = utilization(zero_capacity(), allocated, available)
+    util_before[1:] = util_after[:-1]
+    util_before[zero] = _MAX_UTILIZATION
+
+    return acc_demand, util_before, util_after
+
+
+def _is_sorted(keys):
+    """Check if the rows of key columns are in lexicographical order.
+    """
+    less = np.zeros(max(len(keys[0]) - 1, 0), dtype=bool)
+    equal = np.ones(max(len(keys[0]) - 1, 0), dtype=bool)
+    for key in keys:
+        less |= equal & (key[:-1] < key[1:])
+        equal &= key[:-1] == key[1:]
+    return bool(np.all(less | equal))
+
+
+def _merge_columns(queues):
+    """Merge queue columns, same as heapq.merge of the queue entries.
+
+    Each queue is a tuple of (rank, util_before, util_after, pending, order,
+    apps, demand, zero) columns.
+    """
+    if len(queues) == 1:
+        return queues[0]
+
+    keys = [
+        (rank.astype(float), util_before, util_after, pending, order)
+        for rank, util_before, util_after, pending, order, _apps, _demand,
+        _zero in queues
+    ]
+
+    # - lower rank allocations take precedence.
+    # - for same rank, utilization takes precedence
+    # - False < True, so for apps with same utilization we prefer
+    #   those that already running (False == not pending)
+    # - Global order
+    if all(_is_sorted(key) for key in keys):
+        merged_keys = [np.concatenate(column) for column in zip(*keys)]
+        perm = np.lexsort(merged_keys[::-1])
+    else:
+        # Same as heapq.merge of the entries, app is replaced by position.
+        offsets = np.cumsum([0] + [len(key[0]) for key in keys])
+        entries = [
+            six.moves.zip(*([column.tolist() for column in key] +
+                            [six.moves.range(offset, offset + len(key[0]))]))
+            for key, offset in six.moves.zip(keys, offsets)
+        ]
+        perm = np.array(
+            [entry[-1] for entry in heapq.merge(*entries)], dtype=int
+        )
+
+    return tuple(
+        np.concatenate(column)[perm] for column in zip(*queues)
+    )
+
+
 class Allocation(object):
     """Allocation manages queue of apps sharing same reserved capacity.
 
@@ -1029,10 +1667,14 @@ class Allocation(object):
         'sub_allocations',
         'path',
         'constraints',
+        '_queue',
+        '_columns',
     )
 
     def __init__(self, reserved=None, rank=None, traits=None,
                  max_utilization=None, partition=None):
+        self._queue = None
+        self._columns = None
         self.set_reserved(reserved)
 
         self.rank = None
@@ -1052,6 +1694,20 @@ class Allocation(object):
         # Freeze shape constraintes.
         self.constraints = (self.label, self.traits,)
 
+    def __getstate__(self):
+        """Return picklable state, cached queue order is not stored.
+        """
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['_queue'] = None
+        state['_columns'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restore state.
+        """
+        for slot, value in six.iteritems(state):
+            setattr(self, slot, value)
+
     @property
     def name(self):
         """Returns full allocation name.
@@ -1121,13 +1777,110 @@ class Allocation(object):
         app.allocation = self
         self.apps[app.name] = app
 
+        if self._queue is not None:
+            entry = (_app_key(app), app)
+            self._queue.insert(bisect.bisect(self._queue, entry), entry)
+            self._columns = None
+
     def remove(self, name):
         """Remove application from the allocation queue.
         """
         if name in self.apps:
-            self.apps[name].allocation = None
+            app = self.apps[name]
+            if self._queue is not None:
+                idx = bisect.bisect_left(self._queue, (_app_key(app),))
+                if idx < len(self._queue) and self._queue[idx][1] is app:
+                    del self._queue[idx]
+                    self._columns = None
+                else:
+                    self.reset_queue()
+
+            app.allocation = None
             del self.apps[name]
 
+    def reset_queue(self):
+        """Invalidate the queue order, it is sorted again on next use.
+        """
+        self._queue = None
+        self._columns = None
+
+    def _queue_columns(self):
+        """Returns cached columns of the apps sorted in queue order.
+
+        Returns tuple of (apps, demand, pending, order, zero), where zero is
+        the mask of priority 0 apps.
+        """
+        if self._columns is None:
+            if self._queue is None:
+                self._queue = sorted(
+                    (_app_key(app), app) for app in six.viewvalues(self.apps)
+                )
+
+            apps = np.empty(len(self._queue), dtype=object)
+            apps[:] = [app for _key, app in self._queue]
+            demand = np.array(
+                [app.demand for app in apps], dtype=float
+            ).reshape(len(apps), len(self.reserved))
+            keys = [key for key, _app in self._queue]
+            pending = np.array([key[1] for key in keys], dtype=int)
+            order = np.array([key[2] for key in keys])
+            zero = np.array([key[0] == 0 for key in keys], dtype=bool)
+
+            self._columns = (apps, demand, pending, order, zero)
+
+        return self._columns
+
+    def _priv_columns(self):
+        """Returns columns of the local prioritization queue.
+        """
+        apps, demand, pending, order, zero = self._queue_columns()
+
+        available = self.reserved + np.finfo(float).eps
+        _acc_demand, util_before, util_after = _utilization_columns(
+            demand, self.reserved, available, zero
+        )
+
+        # All things equal, already scheduled applications have priority
+        # over pending.
+        ranks = np.array(
+            [self.rank - self.rank_adjustment, self.rank, _UNPLACED_RANK],
+            dtype=object
+        )
+        rank_idx = np.where(util_before < 0, 0, 1)
+        rank_idx[~(util_after <= self.max_utilization - 1)] = 2
+
+        return (ranks[rank_idx], util_before, util_after, pending, order,
+                apps, demand, zero)
+
+    def _utilization_columns(self, free_capacity, visitor=None):
+        """Returns columns of utilization queue including the sub-allocs.
+        """
+        queues = [
+            alloc._utilization_columns(free_capacity, visitor)
+            for alloc in six.itervalues(self.sub_allocations)
+        ]
+        queues.append(self._priv_columns())
+
+        rank, _u_before, _u_after, pending, order, apps, demand, zero = (
+            _merge_columns(queues)
+        )
+
+        total_reserved = self.total_reserved()
+        available = total_reserved + free_capacity + np.finfo(float).eps
+        acc_demand, util_before, util_after = _utilization_columns(
+            demand, total_reserved, available, zero
+        )
+
+        if visitor:
+            entries = six.moves.zip(rank.tolist(), util_before.tolist(),
+                                    util_after.tolist(), pending.tolist(),
+                                    order.tolist(), apps.tolist())
+            for entry, acc in six.moves.zip(entries, acc_demand):
+                visitor(self, entry, acc)
+
+        return (rank, util_before, util_after, pending, order, apps, demand,
+                zero)
+
     def priv_utilization_queue(self):
         """Returns tuples for sorted by global utilization.
 
@@ -1140,43 +1893,12 @@ class Allocation(object):
         utilization ratio, so that this queue is suitable for merging into
         global priority queue.
         """
-        def _app_key(app):
-            """Compares apps by priority, state, global index
-            """
-            return (-app.priority, 0 if app.server else 1,
-                    app.global_order, app.name)
-
-        prio_queue = sorted(six.viewvalues(self.apps), key=_app_key)
-
-        acc_demand = zero_capacity()
-        available = self.reserved + np.finfo(float).eps
-        util_before = utilization(acc_demand, self.reserved, available)
-
-        for app in prio_queue:
-            acc_demand = acc_demand + app.demand
-            util_after = utilization(acc_demand, self.reserved, available)
-            # Priority 0 apps are treated specially - utilization is set to
-            # max float.
-            #
-            # This ensures that they are at the end of the all queues.
-            if app.priority == 0:
-                util_before = _MAX_UTILIZATION
-                util_after = _MAX_UTILIZATION
-
-            # All things equal, already scheduled applications have priority
-            # over pending.
-            pending = 0 if app.server else 1
-            if util_after <= self.max_utilization - 1:
-                rank = self.rank
-                if util_before < 0:
-                    rank -= self.rank_adjustment
-            else:
-                rank = _UNPLACED_RANK
-
-            entry = (rank, util_before, util_after, pending, app.global_order,
-                     app)
-
-            util_before = util_after
+        rank, util_before, util_after, pending, order, apps, _demand, _zero = (
+            self._priv_columns()
+        )
+        for entry in six.moves.zip(rank.tolist(), util_before.tolist(),
+                                   util_after.tolist(), pending.tolist(),
+                                   order.tolist(), apps.tolist()):
             yield entry
 
     def utilization_queue(self, free_capacity, visitor=None):
@@ -1189,36 +1911,12 @@ class Allocation(object):
         The function maintains invariant that any app (self or inside sub-alloc
         with utilization < 1 will remain with utilzation < 1.
         """
-        total_reserved = self.total_reserved()
-        queues = [
-            alloc.utilization_queue(free_capacity, visitor)
-            for alloc in six.itervalues(self.sub_allocations)
-        ]
-
-        queues.append(self.priv_utilization_queue())
-
-        acc_demand = zero_capacity()
-        available = total_reserved + free_capacity + np.finfo(float).eps
-        util_before = utilization(acc_demand, total_reserved, available)
-
-        for item in heapq.merge(*queues):
-            rank, _u_before, _u_after, pending, order, app = item
-            acc_demand = acc_demand + app.demand
-            util_after = utilization(acc_demand, total_reserved, available)
-            if app.priority == 0:
-                util_before = _MAX_UTILIZATION
-                util_after = _MAX_UTILIZATION
-
-            # - lower rank allocations take precedence.
-            # - for same rank, utilization takes precedence
-            # - False < True, so for apps with same utilization we prefer
-            #   those that already running (False == not pending)
-            # - Global order
-            entry = (rank, util_before, util_after, pending, order, app)
-            if visitor:
-                visitor(self, entry, acc_demand)
-
-            util_before = util_after
+        rank, util_before, util_after, pending, order, apps, _demand, _zero = (
+            self._utilization_columns(free_capacity, visitor)
+        )
+        for entry in six.moves.zip(rank.tolist(), util_before.tolist(),
+                                   util_after.tolist(), pending.tolist(),
+                                   order.tolist(), apps.tolist()):
             yield entry
 
     def total_reserved(self):
@@ -1272,7 +1970,17 @@ class Partition(object):
 
         '_reboot_buckets',
         '_reboot_dates',
+        '_reboot_days',
         '_reboot_last',
+        '_reboot_servers',
+        '_reboot_timestamps',
+    )
+
+    # Indexes rebuilt from reboot buckets on unpickling.
+    _REBOOT_INDEXES = (
+        '_reboot_dates',
+        '_reboot_servers',
+        '_reboot_timestamps',
     )
 
     def __init__(self, max_server_uptime=None, max_lease=None, threshold=None,
@@ -1299,27 +2007,85 @@ class Partition(object):
         if not now:
             now = time.time()
 
+        self._reboot_days = reboot_days
         self._reboot_dates = reboot_dates(
             reboot_days,
             start_date=datetime.date.fromtimestamp(now)
         )
+        # Buckets sorted by timestamp, with timestamps for bisecting and
+        # server name to bucket index.
         self._reboot_buckets = []
+        self._reboot_timestamps = []
+        self._reboot_servers = {}
         self._reboot_last = now
 
         self.tick(now)
 
+    def __getstate__(self):
+        """Return picklable state, reboot dates generator and indexes are
+        not stored.
+        """
+        return {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if slot not in self._REBOOT_INDEXES
+        }
+
+    def __setstate__(self, state):
+        """Restore state, resuming reboot dates after the last bucket.
+        """
+        for slot, value in six.iteritems(state):
+            setattr(self, slot, value)
+
+        self._reboot_dates = reboot_dates(
+            self._reboot_days,
+            start_date=(datetime.date.fromtimestamp(self._reboot_last) +
+                        datetime.timedelta(days=1))
+        )
+        self._reboot_timestamps = [
+            bucket.timestamp for bucket in self._reboot_buckets
+        ]
+        self._reboot_servers = {
+            servername: bucket
+            for bucket in self._reboot_buckets
+            for servername in bucket.servers
+        }
+
     def _find_bucket(self, timestamp):
         """Try to find bucket with given timestamp.
         """
-        for bucket in self._reboot_buckets:
-            if bucket.timestamp == timestamp:
-                return bucket
+        idx = bisect.bisect_left(self._reboot_timestamps, timestamp)
+        if (idx < len(self._reboot_timestamps) and
+                self._reboot_timestamps[idx] == timestamp):
+            return self._reboot_buckets[idx]
 
         return None
 
+    def _least_loaded_bucket(self, server):
+        """Find the least loaded bucket within server uptime limits.
+
+        Same as the bucket with minimal RebootBucket.cost, later bucket wins
+        the ties, last bucket is used if no bucket is within the limits.
+        """
+        begin = bisect.bisect_left(self._reboot_timestamps,
+                                   server.up_since + MIN_SERVER_UPTIME)
+        end = bisect.bisect_right(self._reboot_timestamps,
+                                  server.up_since + DEFAULT_SERVER_UPTIME)
+        if begin >= end:
+            return self._reboot_buckets[-1]
+
+        best = self._reboot_buckets[end - 1]
+        for idx in six.moves.range(end - 2, begin - 1, -1):
+            bucket = self._reboot_buckets[idx]
+            if len(bucket.servers) < len(best.servers):
+                best = bucket
+
+        return best
+
     def add(self, server, timestamp=None):
-        """Add server.
+        """Add server, moving it from the bucket it is in, if any.
         """
+        self.remove(server)
         bucket = None
 
         if timestamp:
@@ -1332,15 +2098,16 @@ class Partition(object):
             bucket = self._reboot_buckets[0]
 
         if not bucket:
-            bucket = min(reversed(self._reboot_buckets),
-                         key=lambda b: b.cost(server))
+            bucket = self._least_loaded_bucket(server)
 
         bucket.add(server)
+        self._reboot_servers[server.name] = bucket
 
     def remove(self, server):
         """Remove server.
         """
-        for bucket in self._reboot_buckets:
+        bucket = self._reboot_servers.pop(server.name, None)
+        if bucket is not None:
             bucket.remove(server)
 
     def tick(self, now):
@@ -1349,10 +2116,17 @@ class Partition(object):
         while self._reboot_last <= now + DEFAULT_SERVER_UPTIME:
             bucket = RebootBucket(next(self._reboot_dates))
             self._reboot_buckets.append(bucket)
+            self._reboot_timestamps.append(bucket.timestamp)
             self._reboot_last = bucket.timestamp
 
-        while self._reboot_buckets[0].timestamp < now:
-            self._reboot_buckets.pop(0)
+        expired = bisect.bisect_left(self._reboot_timestamps, now)
+        for bucket in self._reboot_buckets[:expired]:
+            for servername in bucket.servers:
+                if self._reboot_servers.get(servername) is bucket:
+                    del self._reboot_servers[servername]
+
+        del self._reboot_buckets[:expired]
+        del self._reboot_timestamps[:expired]
 
 
 class PartitionDict(dict):
@@ -1393,12 +2167,13 @@ class RebootBucket(object):
 
     def __init__(self, timestamp):
         self.timestamp = timestamp
-        self.servers = []
+        # Server name to server.
+        self.servers = {}
 
     def add(self, server):
         """Add server to this bucket.
         """
-        self.servers.append(server)
+        self.servers[server.name] = server
         server.valid_until = self.timestamp
         _LOGGER.info('Setting valid until on server: %s %s',
                      server.name, server.valid_until)
@@ -1406,10 +2181,7 @@ class RebootBucket(object):
     def remove(self, server):
         """Remove server from this bucket.
         """
-        try:
-            self.servers.remove(server)
-        except ValueError:
-            pass
+        self.servers.pop(server.name, None)
 
     def cost(self, server):
         """The cost of adding server to this bucket.
@@ -1423,6 +2195,126 @@ class RebootBucket(object):
         return len(self.servers)
 
 
+def _eviction_allowed(app, server):
+    """Check if app could be placed on server by evicting apps from it.
+    """
+    if server.state is not State.up:
+        return False
+
+    if not server.check_app_lifetime(app):
+        return False
+
+    if (app.allocation is not None and
+            app.allocation.label not in server.labels):
+        return False
+
+    return app.traits == 0 or server.traits.has(app.traits)
+
+
+def _scan_victims(app, server, candidates, best_position):
+    """Scan eviction candidates on server, lowest priority first.
+
+    Evict from the end of the queue until the app fits, this finds the most
+    important app that needs to be evicted (the boundary). Only candidates
+    queued after best_position are considered.
+
+    Returns (boundary position, boundary, lower priority apps evicted before
+    the boundary, number of scanned candidates), boundary is None if the app
+    does not fit.
+    """
+    affinity = app.affinity.name
+    limit = app.affinity.limits[server.level]
+    count = server.affinity_counters[affinity]
+    free_capacity = server.free_capacity.copy()
+
+    needed = []
+    scanned = 0
+    for victim_position, victim in reversed(candidates):
+        if victim_position <= best_position:
+            break
+
+        scanned += 1
+        if victim.server != server.name:
+            continue
+
+        needed.append(victim)
+        free_capacity += victim.demand
+        if victim.affinity.name == affinity:
+            count -= 1
+
+        if count < limit and not _any_gt(app.demand, free_capacity):
+            return victim_position, needed.pop(), needed, scanned
+
+    return None, None, needed, scanned
+
+
+def _select_victims(app, server, boundary, needed):
+    """Select the least apps to evict from server to place the app.
+
+    Evict the boundary app, then only as many of the lower priority apps as
+    needed.
+    """
+    affinity = app.affinity.name
+    limit = app.affinity.limits[server.level]
+    victims = [boundary]
+    free_capacity = server.free_capacity + boundary.demand
+    count = server.affinity_counters[affinity]
+    if boundary.affinity.name == affinity:
+        count -= 1
+
+    for victim in needed:
+        if count < limit and not _any_gt(app.demand, free_capacity):
+            break
+        victims.append(victim)
+        free_capacity += victim.demand
+        if victim.affinity.name == affinity:
+            count -= 1
+
+    return victims
+
+
+class _NullCounter(collections.Counter):
+    """Counter that ignores updates.
+    """
+    # pylint: disable=abstract-method
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        pass
+
+
+class ScheduleStats(object):
+    """Phase durations and counters of a schedule run.
+
+    If enabled is not set, phases and counters ignore updates.
+    """
+    __slots__ = (
+        'timestamp',
+        'incremental',
+        'phases',
+        'counters',
+    )
+
+    def __init__(self, incremental=False, enabled=True):
+        self.timestamp = time.time()
+        self.incremental = incremental
+        counter = collections.Counter if enabled else _NullCounter
+        self.phases = counter()
+        self.counters = counter()
+
+    def to_dict(self):
+        """Return stats as a dict.
+        """
+        return {
+            'timestamp': self.timestamp,
+            'incremental': self.incremental,
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+        }
+
+
 class PlacementFeasibilityTracker(object):
     """Tracks similar apps placement failures."""
 
@@ -1451,28 +2343,108 @@ class PlacementFeasibilityTracker(object):
 
 class Cell(Bucket):
     """Top level node.
+
+    If capacity_matrix is set, capacity of all nodes attached to the cell is
+    stored in a shared CapacityMatrix.
+
+    If workers is greater than one, partitions that do not share servers,
+    affinities or identity groups are scheduled in parallel by forked worker
+    processes, placements are merged in partition order. Placement of each
+    partition is then isolated from the others: failed placement does not
+    advance bucket strategies and the lowest free identity is acquired, so
+    the result does not depend on how partitions are grouped.
+
+    Cell keeps track of changes since the last schedule run, so that
+    incremental run can skip partitions that did not change.
+
+    If stats is not set, phase durations and counters of schedule runs are
+    not collected.
     """
     __slots__ = (
         'partitions',
         'next_event_at',
         'apps',
         'identity_groups',
+        'dirty_apps',
+        'backlog',
+        'stats',
+        'collect_stats',
+        'workers',
+        '_members',
     )
 
-    def __init__(self, name):
+    def __init__(self, name, capacity_matrix=False, workers=1, stats=True):
+        self._members = dict()
         super(Cell, self).__init__(name, traits=0, level='cell')
+        if capacity_matrix:
+            CapacityMatrix().attach(self)
 
         self.partitions = PartitionDict()
         self.apps = dict()
-        self.identity_groups = collections.defaultdict(IdentityGroup)
+        self.identity_groups = collections.defaultdict(
+            functools.partial(IdentityGroup, ordered=workers > 1)
+        )
         self.next_event_at = np.inf
+        # New apps added since the last schedule run.
+        self.dirty_apps = set()
+        # Partitions that did not change since the last full schedule run,
+        # mapped to True if there are apps still pending placement.
+        self.backlog = dict()
+        # Stats of the last schedule run.
+        self.collect_stats = stats
+        self.stats = ScheduleStats(enabled=stats)
+        self.workers = workers
+
+    def invalidate(self, labels=None):
+        """Mark partitions as changed, all partitions if labels is None.
+
+        Changed partitions are fully rescheduled on the next run.
+        """
+        if labels is None:
+            self.backlog.clear()
+            return
+
+        for label in labels:
+            self.backlog.pop(label, None)
+
+    def put_feasible(self, app, feasible, isolated=False):
+        """Try to put app on one of the nodes of the cell.
+
+        If partitions are scheduled in parallel, placement is isolated from
+        the apps of other partitions.
+        """
+        return super(Cell, self).put_feasible(
+            app, feasible, isolated or self.workers > 1
+        )
+
+    def add_members(self, members):
+        """Add leaf nodes to the cell members index.
+        """
+        self._members.update(members)
+
+    def remove_members(self, members):
+        """Remove leaf nodes from the cell members index.
+        """
+        for name in list(members):
+            self._members.pop(name, None)
+
+    def members(self):
+        """Return read-only view of all leaf nodes by name.
+        """
+        return MappingProxyType(self._members)
 
     def add_app(self, allocation, app):
         """Adds application to the scheduled list.
         """
         assert allocation is not None
 
+        if app.name in self.apps or app.server:
+            self.invalidate([allocation.label])
+        else:
+            self.dirty_apps.add(app.name)
+
         if app.allocation:
+            self.invalidate([app.allocation.label])
             app.allocation.remove(app.name)
         allocation.add(app)
         self.apps[app.name] = app
@@ -1491,18 +2463,23 @@ class Cell(Bucket):
         if app.server in servers:
             servers[app.server].remove(app.name)
         if app.allocation:
+            self.invalidate([app.allocation.label])
             app.allocation.remove(app.name)
 
         app.release_identity()
+        self.dirty_apps.discard(appname)
         del self.apps[appname]
 
     def configure_identity_group(self, name, count):
         """Add identity group to the cell.
         """
         if name not in self.identity_groups:
-            self.identity_groups[name] = IdentityGroup(count)
+            self.identity_groups[name] = IdentityGroup(
+                count, ordered=self.workers > 1
+            )
         else:
             self.identity_groups[name].adjust(count)
+        self.invalidate()
 
     def remove_identity_group(self, name):
         """Remove identity group.
@@ -1517,6 +2494,7 @@ class Cell(Bucket):
                     break
             if not in_use:
                 del self.identity_groups[name]
+            self.invalidate()
 
     def _fix_invalid_placements(self, queue, servers):
         """If app is placed on non-existent server, set server to None.
@@ -1592,11 +2570,24 @@ class Cell(Bucket):
         # At this point, if app.server is defined, it points to attached
         # server.
         evicted = dict()
-        reversed_queue = queue[::-1]
+
+        # Apps that are already placed, by server, ordered by position in the
+        # queue. Apps after the current one in the queue are eviction
+        # candidates; entries are not removed, stale ones are skipped.
+        evictable = collections.defaultdict(list)
+        for position, app in enumerate(queue):
+            if app.server:
+                evictable[app.server].append((position, app))
 
         placement_tracker = PlacementFeasibilityTracker()
 
-        for app in queue:
+        # Counters are kept in locals, added to the stats at the end.
+        puts = 0
+        infeasible = 0
+        evictions = 0
+        evictions_time = 0
+
+        for position, app in enumerate(queue):
             _LOGGER.debug('scheduling %s', app.name)
 
             if app.final_rank == _UNPLACED_RANK:
@@ -1663,35 +2654,37 @@ class Cell(Bucket):
                 _LOGGER.info(
                     'Placement not feasible: %s %r', app.name, app.shape()
                 )
+                infeasible += 1
                 continue
 
+            puts += 1
             if not self.put(app):
-                # There is not enough capacity, from the end of the queue,
-                # evict apps, freeing capacity.
-                for evicted_app in reversed_queue:
-                    # We reached the app we can't place
-                    if evicted_app == app:
-                        break
-
-                    # The app is not yet placed, skip
-                    if not evicted_app.server:
-                        continue
-
-                    assert evicted_app.server in servers
-                    evicted_app_server = servers[evicted_app.server]
-
-                    # Do not consider servers that are not up.
-                    if evicted_app_server.state is not State.up:
-                        continue
-
-                    evicted[evicted_app] = (evicted_app_server,
-                                            evicted_app.placement_expiry)
-                    evicted_app_server.remove(evicted_app.name)
+                # There is not enough capacity, find the server where evicting
+                # apps with lowest priority frees enough capacity.
+                evictions_begin = time.time()
+                found = self._find_evictions(app, position, evictable, servers)
+                if found is not None:
+                    server, victims = found
+                    for victim in victims:
+                        evicted[victim] = (server, victim.placement_expiry)
+                        server.remove(victim.name)
 
                     # TODO: we need to check affinity limit constraints on
                     #       each level, all the way to the top.
-                    if evicted_app_server.put(app):
-                        break
+                    puts += 1
+                    if server.put(app):
+                        evictions += len(victims)
+                        _LOGGER.info(
+                            'Evicted %d apps from %s to place %s: %s',
+                            len(victims), server.name, app.name,
+                            ', '.join(victim.name for victim in victims)
+                        )
+                    else:
+                        for victim in victims:
+                            _server, victim_expiry = evicted.pop(victim)
+                            server.restore(victim, victim_expiry)
+                            victim.evicted = False
+                evictions_time += time.time() - evictions_begin
 
             # Placement failed.
             if not app.server:
@@ -1704,8 +2697,82 @@ class Cell(Bucket):
                     app.release_identity()
                     placement_tracker.adjust(app)
 
+        self.stats.counters.update(
+            put=puts,
+            infeasible=infeasible,
+            evictions=evictions,
+        )
+        self.stats.phases['evictions'] += evictions_time
+
+    def _find_evictions(self, app, position, evictable, servers):
+        """Find server and apps to evict from it to place the app.
+
+        Only apps queued after the app are considered, lowest priority first.
+        The server is chosen so that the most important evicted app is as low
+        in the queue as possible; on that server, the least apps needed are
+        evicted. Nothing is modified, returns (server, victims) or None.
+        """
+        best = None
+        best_position = position
+        scanned = 0
+
+        for servername, candidates in six.iteritems(evictable):
+            if candidates[-1][0] <= best_position:
+                continue
+
+            server = servers[servername]
+            if not _eviction_allowed(app, server):
+                continue
+
+            boundary_position, boundary, needed, server_scanned = (
+                _scan_victims(app, server, candidates, best_position)
+            )
+            scanned += server_scanned
+            if boundary is None:
+                continue
+
+            best_position = boundary_position
+            best = (server, _select_victims(app, server, boundary, needed))
+
+        self.stats.counters['eviction_searches'] += 1
+        self.stats.counters['eviction_scanned'] += scanned
+        return best
+
+    def _place_new_apps(self):
+        """Place new apps without running the full schedule.
+
+        App is placed directly only if its partition did not change since the
+        last full run, all apps in it were placed and there is free capacity,
+        so that no app could be evicted by the full run. Otherwise the
+        partition is marked for the full run.
+        """
+        new_apps = sorted(
+            [self.apps[name] for name in self.dirty_apps
+             if name in self.apps],
+            key=lambda app: (-app.priority, app.global_order)
+        )
+
+        for app in new_apps:
+            if app.server:
+                continue
+
+            label = app.allocation.label
+            # Capped utilization can push other apps off the queue.
+            if (self.backlog.get(label, True) or
+                    app.allocation.max_utilization != _MAX_UTILIZATION or
+                    not app.acquire_identity()):
+                self.invalidate([label])
+                continue
+
+            self.stats.counters['put'] += 1
+            if not self.put(app):
+                app.release_identity()
+                self.invalidate([label])
+
     def schedule_alloc(self, allocation, servers):
         """Run the scheduler for given allocation.
+
+        Returns True if some of the apps are left pending placement.
         """
         begin = time.time()
 
@@ -1714,17 +2781,39 @@ class Cell(Bucket):
         self._record_rank_and_util(util_queue)
         queue = [item[-1] for item in util_queue]
 
+        evictions_before = self.stats.phases['evictions']
+        placement_begin = time.time()
         self._find_placements(queue, servers)
+        end = time.time()
+        evictions = self.stats.phases['evictions'] - evictions_before
+
+        self.stats.phases['queue'] += placement_begin - begin
+        self.stats.phases['placement'] += end - placement_begin - evictions
+        self.stats.counters['partitions'] += 1
+        self.stats.counters['queued'] += len(queue)
 
         _LOGGER.info('Scheduled %s (%d) apps in %r',
                      allocation.label,
                      len(queue),
-                     time.time() - begin)
+                     end - begin)
+
+        return any(
+            app.server is None and
+            app.final_rank != _UNPLACED_RANK and
+            not (app.schedule_once and app.evicted)
+            for app in queue
+        )
 
-    def schedule(self):
+    def schedule(self, incremental=False):
         """Run the scheduler.
+
+        If incremental is set, only partitions changed since the last run are
+        rescheduled, new apps in other partitions are placed directly if
+        possible.
         """
-        begin = time.time()
+        self.stats = stats = ScheduleStats(incremental=incremental,
+                                           enabled=self.collect_stats)
+        begin = stats.timestamp
 
         all_apps = []
         for label, partition in six.iteritems(self.partitions):
@@ -1734,16 +2823,30 @@ class Cell(Bucket):
         before = [(app.name, app.server, app.placement_expiry)
                   for app in all_apps]
 
+        # Placement of apps on down servers expires over time.
+        if not incremental or time.time() >= self.next_event_at:
+            self.invalidate()
+
+        fixup_begin = time.time()
         servers = self.members()
         self._fix_invalid_placements(six.viewvalues(self.apps), servers)
+        inactive_begin = time.time()
         self._handle_inactive_servers(servers)
+        inactive_end = time.time()
         self._fix_invalid_identities(six.viewvalues(self.apps), servers)
 
-        for label, partition in six.iteritems(self.partitions):
-            allocation = partition.allocation
-            allocation.label = label
-            self.schedule_alloc(allocation, servers)
+        for app, (_name, server, _expiry) in six.moves.zip(all_apps, before):
+            if app.server != server:
+                self.invalidate([app.allocation.label])
+
+        new_apps_begin = time.time()
+        self._place_new_apps()
+        self.dirty_apps.clear()
 
+        partitions_begin = time.time()
+        self._schedule_partitions(servers)
+
+        diff_begin = time.time()
         after = [(app.server, app.placement_expiry)
                  for app in all_apps]
 
@@ -1752,35 +2855,360 @@ class Cell(Bucket):
             for b, a in six.moves.zip(before, after)
         ]
 
+        placed = evicted = renewed = 0
         for appname, s_before, exp_before, s_after, exp_after in placement:
             if s_before != s_after:
                 _LOGGER.info('New placement: %s - %s => %s',
                              appname, s_before, s_after)
+                if s_after:
+                    placed += 1
+                else:
+                    evicted += 1
             else:
                 if exp_before != exp_after:
                     _LOGGER.info('Renewed: %s [%s] - %s => %s',
                                  appname, s_before, exp_before, exp_after)
+                    renewed += 1
+
+        end = time.time()
+        stats.phases.update(
+            snapshot=fixup_begin - begin,
+            fixups=(new_apps_begin - fixup_begin -
+                    (inactive_end - inactive_begin)),
+            inactive_servers=inactive_end - inactive_begin,
+            new_apps=partitions_begin - new_apps_begin,
+            partitions=diff_begin - partitions_begin,
+            diff=end - diff_begin,
+            total=end - begin,
+        )
+        stats.counters.update(
+            apps=len(all_apps),
+            placed=placed,
+            evicted=evicted,
+            renewed=renewed,
+        )
 
         _LOGGER.info('Total scheduler time for %s apps: %r (sec)',
                      len(all_apps),
-                     time.time() - begin)
+                     end - begin)
         return placement
 
+    def _schedule_partitions(self, servers):
+        """Schedule partitions that changed since the last full run.
+
+        If there are more workers, independent partition groups are
+        scheduled in parallel.
+        """
+        labels = [label for label in self.partitions
+                  if label not in self.backlog]
+        groups = [labels]
+        if self.workers > 1 and len(labels) > 1 and hasattr(os, 'fork'):
+            groups = self._partition_groups(labels)
+
+        if len(groups) > 1:
+            self._schedule_parallel(groups, servers)
+        else:
+            for label in labels:
+                allocation = self.partitions[label].allocation
+                allocation.label = label
+                self.backlog[label] = self.schedule_alloc(allocation, servers)
+
+    def _partition_groups(self, labels):
+        """Group partitions which can not be scheduled independently.
+
+        Partitions are dependent if their apps share affinity (counted on
+        buckets), identity group or if an app is placed on a server of
+        another partition.
+        """
+        group = {label: label for label in labels}
+
+        def _find(label):
+            """Find group of the partition."""
+            while group[label] != label:
+                label = group[label]
+            return label
+
+        scheduled = set(labels)
+        servers = self.members()
+        owners = dict()
+        for label in labels:
+            for app in self.partitions[label].allocation.all_apps():
+                shared = [owners.setdefault(('affinity', app.affinity.name),
+                                            label)]
+                if app.identity_group:
+                    shared.append(
+                        owners.setdefault(('identity', app.identity_group),
+                                          label)
+                    )
+                if app.server in servers:
+                    shared.extend(servers[app.server].labels & scheduled)
+
+                for other in shared:
+                    group[_find(other)] = _find(label)
+
+        groups = collections.OrderedDict()
+        for label in labels:
+            groups.setdefault(_find(label), []).append(label)
+        return list(groups.values())
+
+    def _schedule_parallel(self, groups, servers):
+        """Schedule independent partition groups in the worker processes.
+
+        Workers are long lived, each group is sent to them with its
+        partitions, see _group_state.
+        """
+        if _WORKER_POOL is None:
+            raise RuntimeError('Worker processes are not started.')
+
+        for labels in groups:
+            for label in labels:
+                self.partitions[label].allocation.label = label
+
+        workers = min(self.workers, len(groups))
+        tasks = []
+        with _gc_disabled():
+            for labels in groups:
+                with self._group_state(labels):
+                    data = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+                tasks.append((DIMENSION_COUNT, data, labels))
+
+        results = _WORKER_POOL.map(_schedule_worker, tasks, chunksize=1)
+
+        for result in results:
+            self._merge_placements(result, servers)
+        self.stats.counters['workers'] = workers
+
+    @contextlib.contextmanager
+    def _group_state(self, labels):
+        """Strip the cell to the state needed to schedule group of partitions.
+
+        Only partitions of the group and their apps are kept, nodes keep
+        affinity counters and strategies of the group apps only, servers that
+        do not host the group apps keep no apps. Buckets and servers are kept,
+        so that strategies see the same children.
+        """
+        partitions, apps = self.partitions, self.apps
+        group = PartitionDict()
+        group_apps = dict()
+        for label in labels:
+            group[label] = partitions[label]
+            for app in partitions[label].allocation.all_apps():
+                group_apps[app.name] = app
+
+        hosts = set()
+        affinities = set()
+        for app in six.itervalues(group_apps):
+            hosts.add(app.server)
+            affinities.add(app.affinity.name)
+
+        # Stripped (node, attribute, value), restored on exit.
+        stripped = []
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            stripped.append(
+                (node, 'affinity_counters', node.affinity_counters)
+            )
+            node.affinity_counters = collections.Counter({
+                affinity: count
+                for affinity, count in six.iteritems(node.affinity_counters)
+                if affinity in affinities
+            })
+            if isinstance(node, Bucket):
+                stripped.append(
+                    (node, 'affinity_strategies', node.affinity_strategies)
+                )
+                node.affinity_strategies = {
+                    affinity: strategy
+                    for affinity, strategy in six.iteritems(
+                        node.affinity_strategies
+                    )
+                    if affinity in affinities
+                }
+                nodes.extend(node.children_iter())
+            elif node.name not in hosts:
+                stripped.append((node, 'apps', node.apps))
+                node.apps = dict()
+
+        self.partitions, self.apps = group, group_apps
+        try:
+            yield
+        finally:
+            self.partitions, self.apps = partitions, apps
+            for node, attr, value in stripped:
+                setattr(node, attr, value)
+
+    def _schedule_group(self, labels):
+        """Schedule group of partitions, return resulting placements.
+
+        Called in the worker process, the result is merged into the cell of
+        the parent process.
+        """
+        self.stats = ScheduleStats(enabled=self.collect_stats)
+        servers = self.members()
+        backlog = dict()
+        for label in labels:
+            backlog[label] = self.schedule_alloc(
+                self.partitions[label].allocation, servers
+            )
+
+        apps = []
+        affinities = set()
+        identity_groups = dict()
+        for label in labels:
+            for app in self.partitions[label].allocation.all_apps():
+                apps.append((app.name, app.server, app.placement_expiry,
+                             app.evicted, app.renew, app.identity,
+                             app.final_rank, app.final_util))
+                affinities.add(app.affinity.name)
+                if app.identity_group_ref is not None:
+                    identity_groups[app.identity_group] = (
+                        app.identity_group_ref.available
+                    )
+
+        strategies = []
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            for affinity, strategy in six.iteritems(node.affinity_strategies):
+                if affinity in affinities:
+                    strategies.append(
+                        (node.name, affinity, strategy.get_state())
+                    )
+            nodes.extend(
+                child for child in node.children_iter()
+                if isinstance(child, Bucket)
+            )
+
+        return {
+            'backlog': backlog,
+            'apps': apps,
+            'identity_groups': identity_groups,
+            'strategies': strategies,
+            'phases': self.stats.phases,
+            'counters': self.stats.counters,
+        }
+
+    def _merge_placements(self, result, servers):
+        """Apply placements of partitions scheduled by a worker process.
+        """
+        moved = set()
+        for item in result['apps']:
+            app = self.apps[item[0]]
+            if app.server != item[1]:
+                if app.server:
+                    servers[app.server].remove(app.name)
+                moved.add(app.name)
+
+        for item in result['apps']:
+            (name, server, placement_expiry, evicted, renew, identity,
+             final_rank, final_util) = item
+            app = self.apps[name]
+            if server and name in moved:
+                # Constraints were checked by the worker, apps are attached
+                # in different order, so affinity limits may not hold midway.
+                servers[server].attach(app)
+
+            app.placement_expiry = placement_expiry
+            app.evicted = evicted
+            app.renew = renew
+            app.identity = identity
+            app.final_rank = final_rank
+            app.final_util = final_util
+
+        for name, available in six.iteritems(result['identity_groups']):
+            self.identity_groups[name].reset(available)
+
+        buckets = dict()
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            buckets[node.name] = node
+            nodes.extend(
+                child for child in node.children_iter()
+                if isinstance(child, Bucket)
+            )
+        for nodename, affinity, state in result['strategies']:
+            buckets[nodename].get_affinity_strategy(affinity).set_state(state)
+
+        self.backlog.update(result['backlog'])
+        self.stats.phases.update(result['phases'])
+        self.stats.counters.update(result['counters'])
+
     def resolve_reboot_conflicts(self):
         """Adjust server exipiration time to avoid conflicts.
         """
         pass
 
 
+# Worker processes scheduling independent partitions, see start_workers.
+_WORKER_POOL = None
+
+
+def start_workers(workers):
+    """Start pool of processes scheduling independent partitions.
+
+    The pool is started once and kept for the lifetime of the process, it
+    must be started before the first parallel schedule run. Workers are
+    forked, and forking a process with running threads may leave locks held
+    by these threads (e.g. Zookeeper client, logging) locked forever in the
+    child, so the pool must be started before any threads.
+    """
+    global _WORKER_POOL  # pylint: disable=global-statement
+
+    if _WORKER_POOL is None:
+        if hasattr(multiprocessing, 'get_context'):
+            _WORKER_POOL = multiprocessing.get_context('fork').Pool(workers)
+        else:
+            _WORKER_POOL = multiprocessing.Pool(workers)
+    return _WORKER_POOL
+
+
+def _schedule_worker(args):
+    """Schedule group of partitions sent by the parent process.
+    """
+    global DIMENSION_COUNT  # pylint: disable=global-statement
+
+    DIMENSION_COUNT, data, labels = args
+    with _gc_disabled():
+        cell = pickle.loads(data)
+    return cell._schedule_group(labels)  # pylint: disable=W0212
+
+
+@contextlib.contextmanager
+def _gc_disabled():
+    """Disable garbage collection, which otherwise repeatedly walks the
+    whole model while it is being (un)pickled.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
 def dumps(cell):
-    """Serializes cell to string.
+    """Serializes cell to compressed binary snapshot.
     """
-    del cell
-    return ''
+    snapshot = (_SNAPSHOT_VERSION, DIMENSION_COUNT, cell)
+    with _gc_disabled():
+        data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+    # Fastest compression level, higher levels barely reduce the size.
+    return zlib.compress(data, 1)
 
 
 def loads(data):
-    """Loads scheduler from string.
+    """Loads cell from snapshot created by dumps.
     """
-    del data
-    assert False, 'not implemented.'
+    with _gc_disabled():
+        snapshot = pickle.loads(zlib.decompress(data))
+
+    version, dimension_count, cell = snapshot
+    if version != _SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version: %s' % version)
+    if DIMENSION_COUNT is not None and dimension_count != DIMENSION_COUNT:
+        raise ValueError('Snapshot dimension count mismatch: %s' %
+                         dimension_count)
+    return cell
@@ -7,6 +7,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
+import posixpath
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -42,6 +43,26 @@ class Backend(object):
         except ObjectNotFoundError:
             return default
 
+    def list_many(self, paths):
+        """Return dict of path to listing, missing paths are omitted."""
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self.list(path)
+            except ObjectNotFoundError:
+                pass
+        return result
+
+    def get_many(self, paths):
+        """Return dict of path to (object, metadata), missing are omitted."""
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self.get_with_metadata(path)
+            except ObjectNotFoundError:
+                pass
+        return result
+
     def put(self, _path, _value):
         """Store object at a given path."""
         pass
@@ -54,10 +75,142 @@ class Backend(object):
         """Ensure storage path exists."""
         pass
 
+    def put_many(self, items):
+        """Store objects given list of (path, value)."""
+        for path, value in items:
+            self.put(path, value)
+
     def delete(self, _path):
         """Delete object given the path."""
         pass
 
+    def delete_many(self, paths):
+        """Delete objects given list of paths."""
+        for path in paths:
+            self.delete(path)
+
     def update(self, _path, _data, check_content=False):
         """Set data into ZK node."""
         pass
+
+
+class PrefetchBackend(Backend):
+    """Serves reads from data prefetched in bulk from the underlying backend.
+
+    Writes go through to the underlying backend and invalidate prefetched
+    data, reads which are not prefetched are forwarded as is.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        # Path to (object, metadata), None if object does not exist.
+        self.objects = {}
+        # Path to listing, None if object does not exist.
+        self.listings = {}
+        super(PrefetchBackend, self).__init__()
+
+    def prefetch(self, paths):
+        """Prefetch objects, return dict of path to (object, metadata)."""
+        paths = [path for path in paths if path not in self.objects]
+        found = self.backend.get_many(paths)
+        for path in paths:
+            self.objects[path] = found.get(path)
+        return found
+
+    def prefetch_listings(self, paths):
+        """Prefetch listings, return dict of path to listing."""
+        paths = [path for path in paths if path not in self.listings]
+        found = self.backend.list_many(paths)
+        for path in paths:
+            self.listings[path] = found.get(path)
+        return found
+
+    def _invalidate(self, path, listing=False):
+        """Invalidate object and parent listing, optionally own listing."""
+        self.objects.pop(path, None)
+        self.listings.pop(posixpath.dirname(path), None)
+        if listing:
+            self.listings.pop(path, None)
+
+    def list(self, path):
+        """Return path listing."""
+        if path not in self.listings:
+            return self.backend.list(path)
+
+        listing = self.listings[path]
+        if listing is None:
+            raise ObjectNotFoundError()
+        return list(listing)
+
+    def get(self, path):
+        """Return stored object given path."""
+        data, _metadata = self.get_with_metadata(path)
+        return data
+
+    def get_with_metadata(self, path):
+        """Return stored object with metadata."""
+        if path not in self.objects:
+            return self.backend.get_with_metadata(path)
+
+        item = self.objects[path]
+        if item is None:
+            raise ObjectNotFoundError()
+        return item
+
+    def get_default(self, path, default=None):
+        """Return stored object given path, default if not found."""
+        if path not in self.objects:
+            return self.backend.get_default(path, default=default)
+
+        item = self.objects[path]
+        if item is None:
+            return default
+        return item[0]
+
+    def exists(self, path):
+        """Check if object exists."""
+        if path not in self.objects:
+            return self.backend.exists(path)
+
+        return self.objects[path] is not None
+
+    def put(self, path, value):
+        """Store object at a given path."""
+        self._invalidate(path)
+        return self.backend.put(path, value)
+
+    def put_many(self, items):
+        """Store objects given list of (path, value)."""
+        items = list(items)
+        for path, _value in items:
+            self._invalidate(path)
+        return self.backend.put_many(items)
+
+    def ensure_exists(self, path):
+        """Ensure storage path exists."""
+        if self.objects.get(path) is None:
+            self._invalidate(path)
+        return self.backend.ensure_exists(path)
+
+    def delete(self, path):
+        """Delete object given the path."""
+        self._invalidate(path, listing=True)
+        return self.backend.delete(path)
+
+    def delete_many(self, paths):
+        """Delete objects given list of paths."""
+        paths = list(paths)
+        for path in paths:
+            self._invalidate(path, listing=True)
+        return self.backend.delete_many(paths)
+
+    def update(self, path, data, check_content=False):
+        """Set data into ZK node.
+
+        Updating data does not change node creation time, so metadata of
+        prefetched object is kept.
+        """
+        self.backend.update(path, data, check_content=check_content)
+        if self.objects.get(path) is not None:
+            _data, metadata = self.objects[path]
+            self.objects[path] = (data, metadata)
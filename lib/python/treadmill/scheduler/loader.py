@@ -35,6 +35,12 @@ def _alloc_key(name):
     return key
 
 
+def _alloc_state(alloc):
+    """Returns allocation attributes set from the allocation document."""
+    return (tuple(alloc.reserved), alloc.rank, alloc.rank_adjustment,
+            alloc.max_utilization)
+
+
 def resources(data):
     """Convert resource demand/capacity spec into resource vector."""
     parsers = {
@@ -70,28 +76,97 @@ class Loader(object):
         'allocations',
         'assignments',
         'partitions',
+        'manifest_priorities',
+        'state_reports',
     )
 
-    def __init__(self, backend, cellname):
+    def __init__(self, backend, cellname, capacity_matrix=False, workers=1):
         self.backend = backend
-        self.cell = scheduler.Cell(cellname)
+        self.cell = scheduler.Cell(cellname, capacity_matrix=capacity_matrix,
+                                   workers=workers)
         self.buckets = dict()
         self.servers = dict()
         self.allocations = dict()
         self.assignments = collections.defaultdict(list)
         self.partitions = dict()
+        self.manifest_priorities = dict()
+        self.state_reports = dict()
 
     def load_model(self):
         """Load cell state from Zookeeper."""
-        self.load_partitions()
-        self.load_buckets()
-        self.load_cell()
-        self.load_servers()
-        self.load_allocations()
-        self.load_strategies()
-        self.load_apps()
-        self.load_identity_groups()
-        self.restore_placements()
+        backend = self.backend
+        self.backend = be.PrefetchBackend(backend)
+        try:
+            self.prefetch_model()
+            self.load_partitions()
+            self.load_buckets()
+            self.load_cell()
+            self.load_servers()
+            self.load_allocations()
+            self.load_strategies()
+            self.load_apps()
+            self.load_identity_groups()
+            self.restore_placements()
+        finally:
+            self.backend = backend
+
+    def load_snapshot(self, data):
+        """Load cell state from snapshot created by scheduler.dumps."""
+        self.cell = scheduler.loads(data)
+        self.servers = dict(self.cell.members())
+
+        self.buckets = dict()
+        nodes = list(self.cell.children_by_name.values())
+        while nodes:
+            node = nodes.pop()
+            if node.name not in self.servers:
+                self.buckets[node.name] = node
+                nodes.extend(node.children_by_name.values())
+
+    def prefetch_model(self):
+        """Prefetch cell state in bulk, level by level."""
+        listings = self.backend.prefetch_listings([
+            z.BUCKETS,
+            z.CELL,
+            z.IDENTITY_GROUPS,
+            z.PARTITIONS,
+            z.SCHEDULED,
+            z.SERVERS,
+        ])
+        servers = listings.get(z.SERVERS, [])
+
+        placements = self.backend.prefetch_listings([
+            z.path.placement(servername) for servername in servers
+        ])
+
+        paths = [z.ALLOCATIONS]
+        paths.extend(
+            z.path.partition(partition)
+            for partition in listings.get(z.PARTITIONS, [])
+        )
+        paths.extend(
+            z.path.bucket(bucketname)
+            for bucketname in listings.get(z.BUCKETS, [])
+        )
+        paths.extend(
+            z.path.identity_group(name)
+            for name in listings.get(z.IDENTITY_GROUPS, [])
+        )
+        paths.extend(
+            z.path.scheduled(appname)
+            for appname in listings.get(z.SCHEDULED, [])
+        )
+        for servername in servers:
+            placement_node = z.path.placement(servername)
+            paths.append(z.path.server(servername))
+            paths.append(z.path.server_presence(servername))
+            paths.append(placement_node)
+            paths.extend(
+                z.path.placement(servername, appname)
+                for appname in placements.get(placement_node, [])
+            )
+
+        self.backend.prefetch(paths)
 
     def load_cell(self):
         """Construct cell from top level buckets."""
@@ -327,38 +402,86 @@ class Loader(object):
             placement_node, {'state': state.value, 'since': since})
 
     def load_allocations(self):
-        """Load allocations and assignments map."""
+        """Load allocations and assignments map.
+
+        Only allocations that changed are updated and only apps matching
+        changed assignments are reassigned, app manifests are not reloaded.
+        """
         data = self.backend.get_default(z.ALLOCATIONS, default={})
         if not data:
             return
 
-        self.assignments = collections.defaultdict(list)
+        assignments = collections.defaultdict(list)
         for obj in data:
             partition = obj.get('partition')
             name = obj['name']
 
-            _LOGGER.info('Loading allocation: %s into partition: %s',
-                         name, partition)
+            _LOGGER.debug('Loading allocation: %s into partition: %s',
+                          name, partition)
 
             alloc = self.cell.partitions[partition].allocation
             for part in re.split('[/:]', name):
                 alloc = alloc.get_sub_alloc(part)
 
+            before = _alloc_state(alloc)
             capacity = resources(obj)
             alloc.update(capacity, obj['rank'], obj.get('rank_adjustment'),
                          obj.get('max_utilization'))
+            if _alloc_state(alloc) != before:
+                _LOGGER.info('Allocation changed: %s in partition: %s',
+                             name, partition)
+                # Reserved capacity and ranks affect the partition queue.
+                self.cell.invalidate([alloc.label])
 
             for assignment in obj.get('assignments', []):
                 pattern = assignment['pattern'] + '[#]' + ('[0-9]' * 10)
-                pattern_re = fnmatch.translate(pattern)
                 key = _alloc_key(pattern)
                 priority = assignment['priority']
 
-                _LOGGER.info('Assignment: %s - %s', pattern, priority)
-                self.assignments[key].append(
-                    (re.compile(pattern_re), priority, alloc)
+                _LOGGER.debug('Assignment: %s - %s', pattern, priority)
+                assignments[key].append(
+                    (fnmatch.translate(pattern), priority, alloc)
                 )
 
+        changed = set()
+        for key in set(self.assignments) | set(assignments):
+            current = [
+                (compiled.pattern, priority, alloc)
+                for compiled, priority, alloc in self.assignments.get(key, ())
+            ]
+            if current != assignments.get(key, []):
+                changed.add(key)
+
+        for key in changed:
+            _LOGGER.info('Assignments changed: %s', key)
+            self.assignments[key] = [
+                (re.compile(pattern_re), priority, alloc)
+                for pattern_re, priority, alloc in assignments[key]
+            ]
+            if not self.assignments[key]:
+                del self.assignments[key]
+
+        if changed:
+            self.reassign_apps(changed)
+
+    def reassign_apps(self, keys):
+        """Reassign loaded apps matching the assignment keys."""
+        apps = [
+            app for appname, app in six.iteritems(self.cell.apps)
+            if _alloc_key(appname) in keys
+        ]
+        for app in apps:
+            priority, allocation = self.find_assignment(app.name)
+            priority = self.manifest_priorities.get(app.name, priority)
+
+            if app.allocation is not allocation:
+                _LOGGER.info('Reassigning app: %s to %s',
+                             app.name, allocation.name)
+                self.cell.add_app(allocation, app)
+            if app.priority != priority:
+                self.cell.invalidate([allocation.label])
+                app.priority = priority
+
     def find_assignment(self, name):
         """Find allocation by matching app assignment."""
         _LOGGER.debug('Find assignment: %s', name)
@@ -401,6 +524,9 @@ class Loader(object):
         priority, allocation = self.find_assignment(appname)
         if 'priority' in manifest and int(manifest['priority']) != -1:
             priority = int(manifest['priority'])
+            self.manifest_priorities[appname] = priority
+        else:
+            self.manifest_priorities.pop(appname, None)
 
         # TODO: From scheduler perspective it is theoretically
         #                possible to update data retention timeout.
@@ -430,6 +556,7 @@ class Loader(object):
 
     def remove_app(self, appname):
         """Remove app from scheduler."""
+        self.manifest_priorities.pop(appname, None)
         self.cell.remove_app(appname)
 
     def load_strategies(self):
@@ -589,10 +716,22 @@ class Loader(object):
 
     def check_placement_integrity(self):
         """Check integrity of app placement."""
-        app2server = dict()
         servers = self.backend.list(z.PLACEMENT)
-        for server in servers:
-            apps = self.backend.list(z.path.placement(server))
+        listing = self.backend.list_many(
+            [z.path.placement(server) for server in servers]
+        )
+        self._check_placement([
+            (server, listing.get(z.path.placement(server), []))
+            for server in servers
+        ])
+
+    def _check_placement(self, placement):
+        """Repair duplicate placement and cross check it with the model.
+
+        Placement is a list of (server, apps) pairs.
+        """
+        app2server = dict()
+        for server, apps in placement:
             for app in apps:
                 if app not in app2server:
                     app2server[app] = server
@@ -641,12 +780,34 @@ class Loader(object):
         return True
 
     def save_state_reports(self):
-        """Prepare scheduler reports and save them to ZooKeeper."""
-        for report_type in ('servers', 'allocations', 'apps'):
+        """Prepare scheduler reports and save them to ZooKeeper.
+
+        Once full report is saved, subsequent reports are saved as delta
+        against it, until the delta grows too large.
+        """
+        for report_type in ('servers', 'allocations', 'apps',
+                            'schedule_stats'):
+            report = getattr(reports, report_type)(self.cell)
+
+            delta = None
+            if report_type in self.state_reports:
+                generation, base = self.state_reports[report_type]
+                delta = reports.serialize_delta(base, report, generation)
+
+            if delta is not None:
+                _LOGGER.info('Saving scheduler report delta "%s" to ZooKeeper',
+                             report_type)
+                self.backend.put(
+                    z.path.state_report_delta(report_type), delta
+                )
+                continue
+
             _LOGGER.info('Saving scheduler report "%s" to ZooKeeper',
                          report_type)
-            report = getattr(reports, report_type)(self.cell)
+            generation = time.time()
             self.backend.put(
                 z.path.state_report(report_type),
-                reports.serialize_dataframe(report)
+                reports.serialize_columns(report, generation)
             )
+            self.backend.delete(z.path.state_report_delta(report_type))
+            self.state_reports[report_type] = (generation, report)
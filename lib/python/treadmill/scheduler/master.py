@@ -17,6 +17,7 @@ import zlib
 import six
 
 from treadmill import appevents
+from treadmill import fs
 from treadmill import scheduler
 from treadmill import utils
 from treadmill import zknamespace as z
@@ -25,6 +26,7 @@ from treadmill import zkutils
 from treadmill.appcfg import abort as app_abort
 from treadmill.apptrace import events as traceevents
 
+from . import backend as be
 from . import loader
 
 
@@ -40,7 +42,11 @@ def _time_past(when):
 # TIMER_INTERVAL = 60
 
 # Time interval between running the scheduler (seconds).
-_SCHEDULER_INTERVAL = 2
+SCHEDULER_INTERVAL = 2
+
+# Time interval between full scheduler runs, in between the scheduler only
+# reschedules partitions that changed (seconds).
+FULL_SCHEDULER_INTERVAL = 5 * 60
 
 # Save reports on the scheduler state to ZooKeeper every minute.
 _STATE_REPORT_INTERVAL = 60
@@ -48,7 +54,9 @@ _STATE_REPORT_INTERVAL = 60
 # Interval to sleep before checking if there is new event in the queue.
 _CHECK_EVENT_INTERVAL = 0.5
 
-# Check integrity of the scheduler every 5 minutes.
+# Check integrity of the scheduler every 5 minutes. Placement is crawled in
+# full at the same interval, in between it is checked against the watched
+# placement mirror.
 _INTEGRITY_INTERVAL = 5 * 60
 
 # Check for reboots every hour.
@@ -57,22 +65,42 @@ _REBOOT_CHECK_INTERVAL = 60 * 60
 # Max number of events to process before checking if scheduler is due.
 _EVENT_BATCH_COUNT = 20
 
+# Max number of placement journal entries between placement checkpoints,
+# checkpoint is also saved on every full scheduler run.
+_PLACEMENT_JOURNAL_SIZE = 100
+
 
 class Master(loader.Loader):
     """Treadmill master scheduler."""
 
-    def __init__(self, backend, cellname, events_dir=None):
+    def __init__(self, backend, cellname, events_dir=None,
+                 capacity_matrix=False, snapshot=None, workers=1,
+                 trace=None):
 
-        super(Master, self).__init__(backend, cellname)
+        super(Master, self).__init__(backend, cellname,
+                                     capacity_matrix=capacity_matrix,
+                                     workers=workers)
 
         self.backend = backend
         self.events_dir = events_dir
+        self.snapshot = snapshot
+        # Optional trace of processed events, see scheduler.replay.
+        self.trace = trace
 
         self.queue = collections.deque()
         self.up_to_date = False
         self.exit = False
         # Signals that processing of a given event.
         self.process_complete = dict()
+        # Server placement, maintained by watches once they are attached.
+        self.placement_mirror = dict()
+        self.placement_watches = None
+        # Placement as last published, with the version and journal entries
+        # saved since the last checkpoint. Versions start at current time in
+        # ms, so they keep increasing across master restarts.
+        self.placement_published = dict()
+        self.placement_version = int(time.time() * 1000)
+        self.placement_journal = []
 
         self.event_handlers = {
             z.SERVER_PRESENCE: self.process_server_presence,
@@ -92,11 +120,13 @@ class Master(loader.Loader):
             z.DISCOVERY_STATE,
             z.IDENTITY_GROUPS,
             z.PLACEMENT,
+            z.PLACEMENT_JOURNAL,
             z.PARTITIONS,
             z.SCHEDULED,
             z.SCHEDULER,
             z.SERVERS,
             z.STATE_REPORTS,
+            z.STATE_REPORTS_DELTA,
             z.STRATEGIES,
             z.FINISHED,
             z.FINISHED_HISTORY,
@@ -128,6 +158,8 @@ class Master(loader.Loader):
         _LOGGER.info('processing: %r', event)
 
         assert path in self.event_handlers
+        if self.trace is not None:
+            self.trace.record('event', path, children)
         self.event_handlers[path](children)
 
         _LOGGER.info('waiting for completion.')
@@ -168,15 +200,14 @@ class Master(loader.Loader):
             _LOGGER.info('event: %s %s %s', prio, seq, resource)
             node_name = '-'.join([prio, resource, seq])
             if resource == 'allocations':
-                # Changing allocations has potential of complete
-                # reshuffle, so while ineffecient, reload all apps as well.
+                # Changed allocations are updated in place and only apps
+                # matching changed assignments are reassigned.
                 #
                 # If application is assigned to different partition, from
                 # scheduler perspective is no different than host deleted. It
                 # will be detected on schedule and app will be assigned new
                 # host from proper partition.
                 self.load_allocations()
-                self.load_apps()
             elif resource == 'apps':
                 # The event node contains list of apps to be re-evaluated.
                 apps = self.backend.get_default(
@@ -235,12 +266,74 @@ class Master(loader.Loader):
             _LOGGER.debug('watcher finished: %s', path)
             return True
 
+    def watch_placement(self, servername):
+        """Mirror server placement, superseding previous watch if any."""
+        token = object()
+        self.placement_watches[servername] = token
+
+        @self.backend.zkclient.ChildrenWatch(z.path.placement(servername))
+        @utils.exit_on_unhandled
+        def _watch_placement(apps):
+            """Update placement mirror."""
+            if self.placement_watches.get(servername) is not token:
+                return False
+
+            self.placement_mirror[servername] = frozenset(apps)
+            return True
+
     def attach_watchers(self):
         """Attach watchers that push ZK children events into a queue."""
         self.watch(z.SERVER_PRESENCE)
         self.watch(z.SCHEDULED)
         self.watch(z.EVENTS)
 
+        self.placement_watches = dict()
+        for servername in self.servers:
+            self.watch_placement(servername)
+
+    def check_placement_integrity(self, full=False):
+        """Check integrity of app placement.
+
+        Unless full check is requested, placement is taken from the mirror and
+        only servers which do not match the model are read from ZooKeeper.
+        """
+        if full or self.placement_watches is None:
+            super(Master, self).check_placement_integrity()
+            if self.placement_watches is not None:
+                # Watch stops silently if placement node is deleted, re-arm.
+                for servername in self.servers:
+                    self.watch_placement(servername)
+            return
+
+        for servername in set(self.placement_watches) - set(self.servers):
+            del self.placement_watches[servername]
+            self.placement_mirror.pop(servername, None)
+
+        for servername in set(self.servers) - set(self.placement_watches):
+            self.watch_placement(servername)
+
+        mirror = dict(self.placement_mirror)
+        suspects = [
+            servername
+            for servername, server in six.iteritems(self.servers)
+            if mirror.get(servername) != frozenset(server.apps)
+        ]
+        if suspects:
+            # The mirror may lag behind ZooKeeper, verify the differences.
+            _LOGGER.info('Verifying placement: %s servers', len(suspects))
+            listing = self.backend.list_many(
+                [z.path.placement(servername) for servername in suspects]
+            )
+            for servername in suspects:
+                mirror[servername] = listing.get(
+                    z.path.placement(servername), []
+                )
+
+        self._check_placement([
+            (servername, mirror.get(servername, []))
+            for servername in sorted(self.servers)
+        ])
+
     def store_timezone(self):
         """Store local timezone in root ZK node."""
         tz = time.tzname[0]
@@ -256,6 +349,7 @@ class Master(loader.Loader):
         self.attach_watchers()
 
         last_sched_time = time.time()
+        last_full_sched_time = last_sched_time
         last_integrity_check = 0
         last_reboot_check = 0
         last_state_report = 0
@@ -272,11 +366,18 @@ class Master(loader.Loader):
 
             # Run periodic tasks
 
-            if _time_past(last_sched_time + _SCHEDULER_INTERVAL):
+            if _time_past(last_sched_time + SCHEDULER_INTERVAL):
                 last_sched_time = time.time()
                 if not self.up_to_date:
-                    self.reschedule()
+                    full = _time_past(
+                        last_full_sched_time + FULL_SCHEDULER_INTERVAL
+                    )
+                    if full:
+                        last_full_sched_time = last_sched_time
+                    self.reschedule(incremental=not full)
                     self.check_placement_integrity()
+                    if full:
+                        self.save_snapshot()
 
             if _time_past(last_state_report + _STATE_REPORT_INTERVAL):
                 last_state_report = time.time()
@@ -284,6 +385,7 @@ class Master(loader.Loader):
 
             if _time_past(last_integrity_check + _INTEGRITY_INTERVAL):
                 assert self.check_integrity()
+                self.check_placement_integrity(full=True)
                 self.tick_reboots()
                 last_integrity_check = time.time()
 
@@ -294,6 +396,16 @@ class Master(loader.Loader):
             if queue_empty:
                 time.sleep(_CHECK_EVENT_INTERVAL)
 
+    def save_snapshot(self):
+        """Save snapshot of the cell model, if snapshot file is set."""
+        if not self.snapshot:
+            return
+
+        data = scheduler.dumps(self.cell)
+        fs.write_safe(self.snapshot, lambda f: f.write(data))
+        _LOGGER.info('Saved cell snapshot: %s, %s bytes',
+                     self.snapshot, len(data))
+
     @utils.exit_on_unhandled
     def run(self):
         """Runs the master (once it is elected leader)."""
@@ -344,16 +456,61 @@ class Master(loader.Loader):
             'expires': self.cell.apps[app].placement_expiry
         }
 
-    def _save_placement(self, placement):
-        """Store latest placement as reference."""
-        placement_data = json.dumps(placement)
-        placement_zdata = zlib.compress(placement_data.encode())
-        self.backend.put(z.path.placement(), placement_zdata)
+    def _save_placement(self, placement, checkpoint=False):
+        """Publish placement changes as next placement journal entry.
+
+        Full placement is saved as checkpoint if requested, or once the
+        journal grows too long, and the journal is trimmed.
+        """
+        published = {
+            app: (after, exp_after)
+            for app, _before, _exp_before, after, exp_after in placement
+        }
+        if len(self.placement_journal) >= _PLACEMENT_JOURNAL_SIZE:
+            checkpoint = True
+
+        if checkpoint:
+            self.placement_version += 1
+            placement_data = json.dumps({
+                'version': self.placement_version,
+                'placement': placement,
+            })
+            self.backend.put(
+                z.path.placement(), zlib.compress(placement_data.encode())
+            )
+            self.backend.delete_many(self.placement_journal)
+            self.placement_journal = []
+            self.placement_published = published
+            return
+
+        changed = [
+            row for row in placement
+            if self.placement_published.get(row[0]) != published[row[0]]
+        ]
+        deleted = sorted(set(self.placement_published) - set(published))
+        if not changed and not deleted:
+            return
+
+        self.placement_version += 1
+        placement_data = json.dumps({
+            'version': self.placement_version,
+            'placement': changed,
+            'deleted': deleted,
+        })
+        entry = z.path.placement_journal(
+            '{:016d}'.format(self.placement_version)
+        )
+        self.backend.put(entry, zlib.compress(placement_data.encode()))
+        self.placement_journal.append(entry)
+        self.placement_published = published
 
     def init_schedule(self):
         """Run scheduler first time and update scheduled data."""
         placement = self.cell.schedule()
 
+        deleted = []
+        created = []
+        scheduled = []
         for servername, server in six.iteritems(self.cell.members()):
             placement_node = z.path.placement(servername)
             self.backend.ensure_exists(placement_node)
@@ -363,25 +520,39 @@ class Master(loader.Loader):
 
             for app in current - correct:
                 _LOGGER.info('Unscheduling: %s - %s', servername, app)
-                self.backend.delete(os.path.join(placement_node, app))
+                deleted.append(os.path.join(placement_node, app))
             for app in correct - current:
                 _LOGGER.info('Scheduling: %s - %s,%s',
                              servername, app, self.cell.apps[app].identity)
-
-                placement_data = self._placement_data(app)
-                self.backend.put(
-                    os.path.join(placement_node, app),
-                    placement_data
+                created.append(
+                    (os.path.join(placement_node, app),
+                     self._placement_data(app))
                 )
-
-                self._update_task(app, servername, why=None)
-
-        self._save_placement(placement)
+                scheduled.append((app, servername))
+
+        # Same as in reschedule, all stale placement is removed before any
+        # new placement is created.
+        self.backend.delete_many(deleted)
+        self.backend.put_many(created)
+
+        for app, servername in scheduled:
+            self._update_task(app, servername, why=None)
+
+        # Journal entries left by previous master are trimmed on checkpoint.
+        try:
+            self.placement_journal = [
+                z.path.placement_journal(entry)
+                for entry in self.backend.list(z.PLACEMENT_JOURNAL)
+            ]
+        except be.ObjectNotFoundError:
+            self.placement_journal = []
+
+        self._save_placement(placement, checkpoint=True)
         self.up_to_date = True
 
-    def reschedule(self):
+    def reschedule(self, incremental=False):
         """Run scheduler and adjust placement."""
-        placement = self.cell.schedule()
+        placement = self.cell.schedule(incremental=incremental)
 
         # Filter out placement records where nothing changed.
         changed_placement = [
@@ -394,14 +565,20 @@ class Master(loader.Loader):
         # any new ones. This ensures that in the event of loop interruption
         # for anyreason (like Zookeeper connection lost or master restart)
         # there are no duplicate placements.
+        #
+        # Both deletes and creates are flushed in transactions, renewals
+        # (same server, new expiration) update existing nodes one by one.
+        deleted = []
         for app, before, _exp_before, after, _exp_after in changed_placement:
             if before and before != after:
                 _LOGGER.info('Unscheduling: %s - %s', before, app)
-                self.backend.delete(z.path.placement(before, app))
+                deleted.append(z.path.placement(before, app))
 
-        for app, before, _exp_before, after, exp_after in changed_placement:
-            placement_data = self._placement_data(app)
+        self.backend.delete_many(deleted)
 
+        created = []
+        scheduled = []
+        for app, before, _exp_before, after, exp_after in changed_placement:
             why = ''
             if before is not None:
                 if (before not in self.servers or
@@ -420,17 +597,23 @@ class Master(loader.Loader):
                              self.cell.apps[app].identity,
                              exp_after)
 
-                self.backend.put(
-                    z.path.placement(after, app),
-                    placement_data
-                )
-                self._update_task(app, after, why=why)
-            else:
-                self._update_task(app, None, why=why)
+                placement_node = z.path.placement(after, app)
+                placement_data = self._placement_data(app)
+                if before == after:
+                    self.backend.put(placement_node, placement_data)
+                else:
+                    created.append((placement_node, placement_data))
+
+            scheduled.append((app, after, why))
+
+        self.backend.put_many(created)
+
+        for app, after, why in scheduled:
+            self._update_task(app, after, why=why)
 
         self._unschedule_evicted()
 
-        self._save_placement(placement)
+        self._save_placement(placement, checkpoint=not incremental)
         self.up_to_date = True
 
     def _unschedule_evicted(self):
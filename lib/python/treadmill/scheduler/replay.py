@@ -0,0 +1,531 @@
+"""Record scheduler inputs and replay them against the cell model.
+
+Trace is a file of JSON lines [time, kind, path, value], recorded by the
+master:
+
+- object: data and creation time of the node read, None if not found.
+- exists: whether the node checked exists.
+- listing: children of the node listed, None if not found.
+- event: children of the watched node, as processed by the master.
+
+Replay serves reads from the trace, processes the events and runs the
+scheduler on simulated time, as fast as possible.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import contextlib
+import json
+import logging
+import math
+import posixpath
+import time
+import timeit
+
+import numpy as np
+import six
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import backend as be
+from . import master as master_
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_Metadata = collections.namedtuple('_Metadata', ['ctime'])
+
+
+class Trace(object):
+    """Appends trace records to a stream.
+
+    Trace is replayed from the start, so it is not rotated. If max_size is
+    set, recording stops after the event that makes the trace exceed
+    max_size characters, the trace then still ends with a complete event.
+    """
+
+    __slots__ = (
+        'stream',
+        'max_size',
+        'size',
+        'stopped',
+    )
+
+    def __init__(self, stream, max_size=None):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+        self.stopped = False
+
+    def record(self, kind, path, value):
+        """Append record stamped with current time."""
+        if self.stopped:
+            return
+
+        line = six.text_type(
+            json.dumps([time.time(), kind, path, value], default=str)
+        ) + '\n'
+        self.stream.write(line)
+        self.size += len(line)
+        if kind == 'event':
+            self.stream.flush()
+            if self.max_size is not None and self.size >= self.max_size:
+                _LOGGER.warning('Trace size limit reached, stop recording.')
+                self.stopped = True
+
+
+def load_trace(stream):
+    """Return iterator over trace records in the stream."""
+    for line in stream:
+        if line.strip():
+            yield tuple(json.loads(line))
+
+
+def _ctime(metadata):
+    """Return node creation time from metadata, if any."""
+    return getattr(metadata, 'ctime', None)
+
+
+class RecordingBackend(be.Backend):
+    """Records reads from the underlying backend to the trace.
+
+    Writes go through to the underlying backend unrecorded, replay derives
+    them from the scheduler itself.
+    """
+
+    def __init__(self, backend, trace):
+        self.backend = backend
+        self.trace = trace
+        self.zkclient = getattr(backend, 'zkclient', None)
+        super(RecordingBackend, self).__init__()
+
+    def _record_object(self, path, item):
+        """Record object and its creation time, None if not found."""
+        self.trace.record(
+            'object', path,
+            None if item is None else [item[0], _ctime(item[1])]
+        )
+
+    def list(self, path):
+        """Return path listing."""
+        try:
+            listing = self.backend.list(path)
+        except be.ObjectNotFoundError:
+            self.trace.record('listing', path, None)
+            raise
+        self.trace.record('listing', path, listing)
+        return listing
+
+    def list_many(self, paths):
+        """Return dict of path to listing, missing paths are omitted."""
+        paths = list(paths)
+        found = self.backend.list_many(paths)
+        for path in paths:
+            self.trace.record('listing', path, found.get(path))
+        return found
+
+    def get(self, path):
+        """Return stored object given path."""
+        data, _metadata = self.get_with_metadata(path)
+        return data
+
+    def get_with_metadata(self, path):
+        """Return stored object with metadata."""
+        try:
+            item = self.backend.get_with_metadata(path)
+        except be.ObjectNotFoundError:
+            self._record_object(path, None)
+            raise
+        self._record_object(path, item)
+        return item
+
+    def get_default(self, path, default=None):
+        """Return stored object given path, default if not found."""
+        try:
+            return self.get(path)
+        except be.ObjectNotFoundError:
+            return default
+
+    def get_many(self, paths):
+        """Return dict of path to (object, metadata), missing are omitted."""
+        paths = list(paths)
+        found = self.backend.get_many(paths)
+        for path in paths:
+            self._record_object(path, found.get(path))
+        return found
+
+    def exists(self, path):
+        """Check if object exists."""
+        exists = self.backend.exists(path)
+        self.trace.record('exists', path, bool(exists))
+        return exists
+
+    def put(self, path, value):
+        """Store object at a given path."""
+        return self.backend.put(path, value)
+
+    def put_many(self, items):
+        """Store objects given list of (path, value)."""
+        return self.backend.put_many(items)
+
+    def ensure_exists(self, path):
+        """Ensure storage path exists."""
+        return self.backend.ensure_exists(path)
+
+    def delete(self, path):
+        """Delete object given the path."""
+        return self.backend.delete(path)
+
+    def delete_many(self, paths):
+        """Delete objects given list of paths."""
+        return self.backend.delete_many(paths)
+
+    def update(self, path, data, check_content=False):
+        """Set data into ZK node."""
+        return self.backend.update(path, data, check_content=check_content)
+
+
+class ReplayBackend(be.Backend):
+    """In-memory backend populated from trace records.
+
+    Writes are applied in memory, so they are visible to subsequent reads
+    until overridden by the trace.
+    """
+
+    def __init__(self):
+        self.zkclient = None
+        # Path to (object, metadata).
+        self.objects = {}
+        # Path to set of children.
+        self.listings = {}
+        super(ReplayBackend, self).__init__()
+
+    def apply(self, kind, path, value):
+        """Apply trace record to the stored data."""
+        if kind == 'object':
+            if value is None:
+                self._remove(path)
+            else:
+                data, ctime = value
+                self._add(path, data, ctime)
+        elif kind == 'exists':
+            if not value:
+                self._remove(path)
+            elif path not in self.objects:
+                self._add(path, None, None)
+        elif kind in ('listing', 'event'):
+            if value is None:
+                self._remove(path)
+            else:
+                self.listings[path] = set(value)
+        else:
+            _LOGGER.warning('Unknown trace record: %s %s', kind, path)
+
+    def _add(self, path, data, ctime):
+        """Store object, add it to the parent listing."""
+        self.objects[path] = (data, _Metadata(ctime))
+        self.listings.setdefault(path, set())
+        self.listings.setdefault(
+            posixpath.dirname(path), set()
+        ).add(posixpath.basename(path))
+
+    def _remove(self, path):
+        """Remove object, its listing and entry in the parent listing."""
+        self.objects.pop(path, None)
+        self.listings.pop(path, None)
+        parent = self.listings.get(posixpath.dirname(path))
+        if parent is not None:
+            parent.discard(posixpath.basename(path))
+
+    def list(self, path):
+        """Return path listing."""
+        if path not in self.listings:
+            raise be.ObjectNotFoundError()
+        return sorted(self.listings[path])
+
+    def list_many(self, paths):
+        """Return dict of path to listing, missing paths are omitted."""
+        return {
+            path: sorted(self.listings[path])
+            for path in paths if path in self.listings
+        }
+
+    def get(self, path):
+        """Return stored object given path."""
+        data, _metadata = self.get_with_metadata(path)
+        return data
+
+    def get_with_metadata(self, path):
+        """Return stored object with metadata."""
+        if path not in self.objects:
+            raise be.ObjectNotFoundError()
+        return self.objects[path]
+
+    def get_default(self, path, default=None):
+        """Return stored object given path, default if not found."""
+        if path not in self.objects:
+            return default
+        return self.objects[path][0]
+
+    def get_many(self, paths):
+        """Return dict of path to (object, metadata), missing are omitted."""
+        return {
+            path: self.objects[path]
+            for path in paths if path in self.objects
+        }
+
+    def exists(self, path):
+        """Check if object exists."""
+        return path in self.objects or path in self.listings
+
+    def put(self, path, value):
+        """Store object at a given path."""
+        self._add(path, value, int(time.time() * 1000))
+
+    def ensure_exists(self, path):
+        """Ensure storage path exists."""
+        if not self.exists(path):
+            self.put(path, None)
+
+    def delete(self, path):
+        """Delete object given the path."""
+        self._remove(path)
+
+    def update(self, path, data, check_content=False):
+        """Set data into ZK node."""
+        _data, metadata = self.objects.get(path, (None, None))
+        if metadata is None:
+            self.put(path, data)
+        else:
+            self.objects[path] = (data, metadata)
+
+
+@contextlib.contextmanager
+def _simulated_time(clock):
+    """Make time.time return simulated time while in context."""
+    real_time = time.time
+    time.time = clock
+    try:
+        yield
+    finally:
+        time.time = real_time
+
+
+def _peak_rss():
+    """Return peak resident set size of the process, None if unknown."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _distribution(values):
+    """Return summary of the distribution of values."""
+    if not values:
+        return {'count': 0}
+
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        'count': len(values),
+        'mean': float(np.mean(values)),
+        'p50': float(p50),
+        'p90': float(p90),
+        'p99': float(p99),
+        'max': float(max(values)),
+    }
+
+
+class ReplayStats(object):
+    """Stats collected during trace replay."""
+
+    __slots__ = (
+        'events',
+        'runs',
+        'latency',
+        'pending',
+        'churn',
+        'phases',
+        'peak_rss',
+        'simulated',
+        'elapsed',
+    )
+
+    def __init__(self):
+        self.events = 0
+        self.runs = collections.Counter()
+        # Wall time of each scheduler run, including placement updates.
+        self.latency = []
+        # Simulated time apps spent pending before being placed.
+        self.pending = []
+        self.churn = collections.Counter()
+        self.phases = collections.Counter()
+        self.peak_rss = None
+        self.simulated = 0
+        self.elapsed = 0
+
+    def to_dict(self):
+        """Return stats as a dict."""
+        return {
+            'events': self.events,
+            'runs': dict(self.runs),
+            'latency': _distribution(self.latency),
+            'pending': _distribution(self.pending),
+            'churn': dict(self.churn),
+            'phases': dict(self.phases),
+            'peak_rss': self.peak_rss,
+            'simulated': self.simulated,
+            'elapsed': self.elapsed,
+        }
+
+
+class Replay(object):
+    """Replays the trace against the master running on simulated time.
+
+    Scheduler runs are due at the scheduler intervals (the master ones by
+    default) after the events which triggered them, the time between events
+    is skipped. Placement integrity checks, state reports and reboots are not
+    replayed.
+    """
+
+    def __init__(self, cellname, records, workers=1,
+                 scheduler_interval=master_.SCHEDULER_INTERVAL,
+                 full_scheduler_interval=master_.FULL_SCHEDULER_INTERVAL):
+        self.records = iter(records)
+        self.scheduler_interval = scheduler_interval
+        self.full_scheduler_interval = full_scheduler_interval
+        self.backend = ReplayBackend()
+        self.master = master_.Master(self.backend, cellname, workers=workers)
+        self.stats = ReplayStats()
+        self.clock = 0
+        self.changed = None
+        self.last_run = None
+        self.last_full_run = None
+        # App to server as of the last scheduler run.
+        self.placed = {}
+        # App to time it was first seen unplaced.
+        self.pending_since = {}
+
+    def _next_batch(self):
+        """Return data records up to the next event, and the event."""
+        batch = []
+        for record in self.records:
+            if record[1] == 'event':
+                return batch, record
+            batch.append(record)
+        return batch, None
+
+    def _apply(self, batch):
+        """Apply data records to the backend."""
+        for _when, kind, path, value in batch:
+            self.backend.apply(kind, path, value)
+
+    def _schedule(self, init=False):
+        """Run scheduler, collect latency, churn and pending stats."""
+        full = init or (
+            self.clock >= self.last_full_run + self.full_scheduler_interval
+        )
+        start = timeit.default_timer()
+        if init:
+            self.master.init_schedule()
+        else:
+            self.master.reschedule(incremental=not full)
+        self.stats.latency.append(timeit.default_timer() - start)
+        self.stats.runs['full' if full else 'incremental'] += 1
+        self.stats.phases.update(self.master.cell.stats.phases)
+        self.stats.peak_rss = _peak_rss()
+
+        self.last_run = self.clock
+        if full:
+            self.last_full_run = self.clock
+
+        placed = {
+            app: server
+            for app, (server, _expires) in six.iteritems(
+                self.master.placement_published
+            )
+            if server is not None
+        }
+        for app, server in six.iteritems(placed):
+            before = self.placed.get(app)
+            if before is None:
+                self.stats.churn['scheduled'] += 1
+                since = self.pending_since.pop(app, None)
+                self.stats.pending.append(
+                    0 if since is None else self.clock - since
+                )
+            elif before != server:
+                self.stats.churn['moved'] += 1
+        for app in six.viewkeys(self.placed) - six.viewkeys(placed):
+            if app in self.master.cell.apps:
+                self.stats.churn['evicted'] += 1
+        self.placed = placed
+        self._track_pending()
+
+    def _track_pending(self):
+        """Record time unplaced apps were first seen pending."""
+        for app in six.viewkeys(self.master.cell.apps) - six.viewkeys(
+                self.placed):
+            self.pending_since.setdefault(app, self.clock)
+        for app in six.viewkeys(self.pending_since) - six.viewkeys(
+                self.master.cell.apps):
+            del self.pending_since[app]
+
+    def _advance(self, when):
+        """Advance the clock, running the scheduler if due before."""
+        if not self.master.up_to_date:
+            due = self._due()
+            if due <= when:
+                self.clock = max(self.clock, due)
+                self._schedule()
+        self.clock = max(self.clock, when)
+
+    def _due(self):
+        """Return time of the first scheduler tick after the change."""
+        ticks = math.ceil(
+            (self.changed - self.last_run) / self.scheduler_interval
+        )
+        return self.last_run + max(1, ticks) * self.scheduler_interval
+
+    def _process(self, path, children):
+        """Process event as the master would."""
+        if self.master.up_to_date:
+            self.changed = self.clock
+        self.master.event_handlers[path](children)
+        self.master.up_to_date = False
+        self.stats.events += 1
+        self._track_pending()
+
+    def run(self):
+        """Replay the trace, return the stats."""
+        start = timeit.default_timer()
+        with _simulated_time(lambda: self.clock):
+            batch, event = self._next_batch()
+            if batch:
+                self.clock = batch[0][0]
+            self._apply(batch)
+            begin = self.clock
+
+            self.master.load_model()
+            self._schedule(init=True)
+
+            while event is not None:
+                when, _kind, path, children = event
+                batch, next_event = self._next_batch()
+                self._advance(when)
+                self.backend.apply('event', path, children)
+                self._apply(batch)
+                self._process(path, children)
+                event = next_event
+
+            if not self.master.up_to_date:
+                self._advance(self._due())
+
+        self.stats.simulated = self.clock - begin
+        self.stats.elapsed = timeit.default_timer() - start
+        return self.stats
@@ -24,6 +24,15 @@ _SERVERS_ACL = zkutils.make_role_acl('servers', 'rwcda')
 # Delete only servers ACL
 _SERVERS_ACL_DEL = zkutils.make_role_acl('servers', 'd')
 
+# Max number of operations in a single Zookeeper transaction.
+_TRANSACTION_SIZE = 100
+
+
+def _chunks(items, size=_TRANSACTION_SIZE):
+    """Split list of items into chunks of a given size."""
+    for idx in range(0, len(items), size):
+        yield items[idx:idx + size]
+
 
 class ZkReadonlyBackend(backend.Backend):
     """Implements readonly Zookeeper based storage."""
@@ -39,6 +48,14 @@ class ZkReadonlyBackend(backend.Backend):
         except kazoo.client.NoNodeError:
             raise backend.ObjectNotFoundError()
 
+    def list_many(self, paths):
+        """Return dict of path to listing, pipelining the requests."""
+        return zkutils.get_children_many(self.zkclient, paths)
+
+    def get_many(self, paths):
+        """Return dict of path to (object, metadata), pipelining requests."""
+        return zkutils.get_many_with_metadata(self.zkclient, paths)
+
     def get_default(self, path, default=None):
         """Return stored object or default if not found."""
         return zkutils.get_default(self.zkclient, path, default=default)
@@ -80,12 +97,14 @@ class ZkBackend(ZkReadonlyBackend):
             z.DISCOVERY_STATE: [_SERVERS_ACL],
             z.IDENTITY_GROUPS: None,
             z.PLACEMENT: None,
+            z.PLACEMENT_JOURNAL: None,
             z.PARTITIONS: None,
             z.SCHEDULED: [_SERVERS_ACL_DEL],
             z.SCHEDULED_STATS: None,
             z.SCHEDULER: None,
             z.SERVERS: None,
             z.STATE_REPORTS: None,
+            z.STATE_REPORTS_DELTA: None,
             z.STRATEGIES: None,
             z.FINISHED: [_SERVERS_ACL],
             z.FINISHED_HISTORY: None,
@@ -127,6 +146,18 @@ class ZkBackend(ZkReadonlyBackend):
         """Store object at a given path."""
         return zkutils.put(self.zkclient, path, value, acl=self._acl(path))
 
+    def put_many(self, items):
+        """Store objects given list of (path, value), in transactions.
+
+        Objects are expected not to exist. If a transaction is rolled back,
+        objects in the chunk are stored one by one.
+        """
+        for chunk in _chunks(list(items)):
+            nodes = [(path, value, self._acl(path)) for path, value in chunk]
+            if not zkutils.create_many(self.zkclient, nodes):
+                for path, value in chunk:
+                    self.put(path, value)
+
     def ensure_exists(self, path):
         """Ensure storage path exists."""
         return zkutils.ensure_exists(self.zkclient, path, acl=self._acl(path))
@@ -135,6 +166,17 @@ class ZkBackend(ZkReadonlyBackend):
         """Delete object given the path."""
         return zkutils.ensure_deleted(self.zkclient, path)
 
+    def delete_many(self, paths):
+        """Delete objects given list of paths, in transactions.
+
+        Objects are expected to be leaf nodes. If a transaction is rolled
+        back, objects in the chunk are deleted one by one.
+        """
+        for chunk in _chunks(list(paths)):
+            if not zkutils.delete_many(self.zkclient, chunk):
+                for path in chunk:
+                    self.delete(path)
+
     def update(self, path, data, check_content=False):
         """Set data into ZK node."""
         try:
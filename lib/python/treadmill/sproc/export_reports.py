@@ -20,6 +20,7 @@ from twisted.internet import reactor, task
 
 from treadmill import context
 from treadmill import fs
+from treadmill import reports
 from treadmill import zknamespace as z
 from treadmill import zkutils
 
@@ -32,15 +33,23 @@ def export_reports(out_dir, zkclient):
     start_iso = datetime.utcfromtimestamp(int(start)).isoformat()
 
     try:
-        reports = zkclient.get_children('/reports')
+        report_types = zkclient.get_children(z.STATE_REPORTS)
     except kazoo.exceptions.NoNodeError:
         _LOGGER.critical('Reports not found in %s ZooKeeper!',
                          context.GLOBAL.cell)
         return
 
-    for report_type in reports:
-        # Write the byte contents from ZK, reports are already compressed
+    for report_type in report_types:
         report, _ = zkclient.get(z.path.state_report(report_type))
+        try:
+            delta, _ = zkclient.get(z.path.state_report_delta(report_type))
+        except kazoo.exceptions.NoNodeError:
+            delta = None
+
+        # Reports are exported as CSV compressed with bzip2.
+        report = reports.serialize_dataframe(
+            reports.deserialize_dataframe(report, delta)
+        )
         filename = '{}_{}.csv.bz2'.format(start_iso, report_type)
         with io.open(os.path.join(out_dir, filename), 'wb') as out:
             out.write(report)
@@ -6,11 +6,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
+
 import click
 
 from treadmill import context
 from treadmill import scheduler
 from treadmill.scheduler import master
+from treadmill.scheduler import replay
 from treadmill.scheduler import zkbackend
 
 
@@ -18,15 +21,48 @@ def init():
     """Return top level command handler."""
 
     @click.command()
+    @click.option('--capacity-matrix/--no-capacity-matrix', default=False,
+                  help='Store node capacity in a shared matrix.')
+    @click.option('--snapshot', type=click.Path(),
+                  help='File to periodically save cell snapshot to.')
+    @click.option('--workers', type=int, default=1,
+                  help='Number of processes scheduling independent '
+                  'partitions in parallel.')
+    @click.option('--trace', type=click.Path(),
+                  help='File to record scheduler inputs to, for replay.')
+    @click.option('--trace-size', type=int, default=1024,
+                  help='Stop recording the trace after it reaches the size '
+                  '(MiB).')
     @click.argument('events-dir', type=click.Path(exists=True))
-    def run(events_dir):
+    def run(events_dir, capacity_matrix, snapshot, workers, trace,
+            trace_size):
         """Run Treadmill master scheduler."""
         scheduler.DIMENSION_COUNT = 3
-        cell_master = master.Master(
-            zkbackend.ZkBackend(context.GLOBAL.zk.conn),
-            context.GLOBAL.cell,
-            events_dir
-        )
-        cell_master.run()
+        if workers > 1:
+            # Workers are forked, start them before Zookeeper client threads.
+            scheduler.start_workers(workers)
+
+        backend = zkbackend.ZkBackend(context.GLOBAL.zk.conn)
+        stream = None
+        recorder = None
+        if trace:
+            stream = io.open(trace, 'a', encoding='utf-8')
+            recorder = replay.Trace(stream, max_size=trace_size * 1024 * 1024)
+            backend = replay.RecordingBackend(backend, recorder)
+
+        try:
+            cell_master = master.Master(
+                backend,
+                context.GLOBAL.cell,
+                events_dir,
+                capacity_matrix=capacity_matrix,
+                snapshot=snapshot,
+                workers=workers,
+                trace=recorder
+            )
+            cell_master.run()
+        finally:
+            if stream is not None:
+                stream.close()
 
     return run
@@ -16,6 +16,7 @@ import click
 from treadmill import cli
 from treadmill import websocket as ws
 from treadmill.websocket import api
+from treadmill.websocket import fanout
 from treadmill.zksync import utils as zksync_utils
 
 
@@ -34,9 +35,13 @@ def init():
     @click.option('--port',
                   help='Websocket HTTP port',
                   required=True, default=8080)
-    def websocket(fs_root, modules, port):
+    @click.option('--workers',
+                  help='Number of worker processes, events are routed to the '
+                  'workers by separate process if more than one.',
+                  type=int, default=1)
+    def websocket(fs_root, modules, port, workers):
         """Treadmill Websocket"""
-        _LOGGER.debug('port: %s', port)
+        _LOGGER.debug('port: %s, workers: %s', port, workers)
 
         # keep sleeping until zksync ready
         zksync_utils.wait_for_ready(fs_root)
@@ -46,6 +51,10 @@ def init():
             impl[topic] = topic_impl
             watches.extend(topic_watches)
 
+        if workers > 1:
+            fanout.run(fs_root, impl, watches, port, workers)
+            return
+
         pubsub = ws.DirWatchPubSub(fs_root, impl, watches)
         pubsub.run_detached()
 
@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import bisect
 import collections
 import errno
 import fnmatch
@@ -21,9 +22,13 @@ import threading
 import time
 import uuid
 
+import tornado.concurrent
+import tornado.ioloop
 import tornado.websocket
+from tornado import gen
 
 import six
+from six.moves import queue
 from six.moves import urllib_parse
 
 from treadmill import dirwatch
@@ -32,6 +37,8 @@ from treadmill import utils
 
 _LOGGER = logging.getLogger(__name__)
 
+_GLOB_CHARS = re.compile(r'[*?[]')
+
 
 def make_handler(pubsub):
     """Make websocket handler factory."""
@@ -116,6 +123,7 @@ def make_handler(pubsub):
             _LOGGER.debug('parsed_origin: %r', parsed_origin)
             return True
 
+        @gen.coroutine
         def on_message(self, message):
             """Manage event subscriptions."""
             if not pubsub:
@@ -171,7 +179,9 @@ def make_handler(pubsub):
                     self._subscriptions.add(sub_id)
 
                 for watch, pattern in subscription:
-                    pubsub.register(watch, pattern, self, impl, since, sub_id)
+                    yield pubsub.register_async(
+                        watch, pattern, self, impl, since, sub_id
+                    )
                 if snapshot and close_conn:
                     _LOGGER.info('[%s] Closing connection.', self._request_id)
                     self.close()
@@ -193,18 +203,112 @@ def make_handler(pubsub):
     return _WS
 
 
+def read_file(path):
+    """Read file modification time and content, None if it does not exist."""
+    if '/trace/' in path:
+        # Specialized handling of trace files (no need to stat/read).
+        # If file was already deleted (trace cleanup), don't ignore it.
+        _, timestamp, _ = os.path.basename(path).split(',', 2)
+        return float(timestamp), ''
+
+    try:
+        when = os.stat(path).st_mtime
+        with io.open(path) as f:
+            content = f.read()
+    except (IOError, OSError) as err:
+        if err.errno in (errno.ENOENT, errno.EISDIR):
+            return None
+        raise
+
+    return when, content
+
+
+def _pattern_prefix(pattern):
+    """Return literal prefix of the glob pattern."""
+    return _GLOB_CHARS.split(pattern, 1)[0]
+
+
+class _DirCache(object):
+    """Cached content of the files in watched directory, indexed by name."""
+
+    __slots__ = (
+        'files',
+        'names',
+    )
+
+    def __init__(self):
+        self.files = {}
+        self.names = []
+
+    def update(self, filename, when, content):
+        """Add or update file."""
+        if filename not in self.files:
+            bisect.insort(self.names, filename)
+        self.files[filename] = (when, content)
+
+    def remove(self, filename):
+        """Remove file."""
+        if self.files.pop(filename, None) is not None:
+            del self.names[bisect.bisect_left(self.names, filename)]
+
+    def apply(self, operation, filename, when, content):
+        """Apply dirwatch event."""
+        if operation == 'd':
+            self.remove(filename)
+        else:
+            self.update(filename, when, content)
+
+    def match(self, pattern, since):
+        """Return (when, filename, content) of matching files, since when."""
+        prefix = _pattern_prefix(pattern)
+        lower = bisect.bisect_left(self.names, prefix)
+        pattern_re = re.compile(fnmatch.translate(pattern))
+
+        items = []
+        for filename in self.names[lower:]:
+            if not filename.startswith(prefix):
+                break
+            if not pattern_re.match(filename):
+                continue
+            when, content = self.files[filename]
+            if when >= since:
+                items.append((when, filename, content))
+        return items
+
+
+class _HeldEvents(object):
+    """Live events of the subscription held until its sow is published."""
+
+    __slots__ = (
+        'events',
+    )
+
+    def __init__(self):
+        # None once the events are no longer held.
+        self.events = []
+
+
 class DirWatchPubSub(object):
-    """Pubsub dirwatch events."""
+    """Pubsub dirwatch events.
 
-    def __init__(self, root, impl=None, watches=None):
+    Events come from the dirwatcher, or from the event router when the
+    watcher is a channel to the router (see treadmill.websocket.fanout).
+    """
+
+    def __init__(self, root, impl=None, watches=None, watcher=None):
         self.root = os.path.realpath(root)
         self.impl = impl or {}
         self.watches = watches or []
 
-        self.watcher = dirwatch.DirWatcher()
-        self.watcher.on_created = self._on_created
-        self.watcher.on_deleted = self._on_deleted
-        self.watcher.on_modified = self._on_modified
+        if watcher is None:
+            watcher = dirwatch.DirWatcher()
+            watcher.on_created = self._on_created
+            watcher.on_deleted = self._on_deleted
+            watcher.on_modified = self._on_modified
+        self.watcher = watcher
+        # Futures of the directory watches, resolved once the directory is
+        # watched, if the watcher is a channel to the router.
+        self._watching = {}
 
         self.watch_dirs = set()
         for watch in self.watches:
@@ -212,28 +316,131 @@ class DirWatchPubSub(object):
             self.watch_dirs.update(watch_dirs)
         for directory in self.watch_dirs:
             _LOGGER.info('Added permanent dir watcher: %s', directory)
-            self.watcher.add_dir(directory)
+            self._watch_dir(directory)
 
         self.ws = make_handler(self)
         self.handlers = collections.defaultdict(list)
-
-    def register(self, watch, pattern, ws_handler, impl, since, sub_id=None):
-        """Register handler with pattern."""
+        # Handlers of each directory, indexed by literal prefix of pattern.
+        self._index = collections.defaultdict(
+            lambda: collections.defaultdict(list)
+        )
+
+        # State of the world of the watched directories, updated from the
+        # dirwatch events.
+        self._cache = {}
+        # Events queued for the directories being loaded in the cache.
+        self._loading = collections.defaultdict(list)
+        self._cache_lock = threading.Lock()
+        self._held_lock = threading.Lock()
+
+        # Open connections to the sow databases.
+        self._dbs = {}
+        self._dbs_lock = threading.Lock()
+
+        self._sow_queue = None
+
+    def _watch_dir(self, directory):
+        """Add directory to the watcher, keep future of the watch if any."""
+        result = self.watcher.add_dir(directory)
+        if result is not None:
+            self._watching[directory] = result
+
+    def _is_watched(self, directory):
+        """Check if the watch of the directory is in place."""
+        watching = self._watching.get(directory)
+        return watching is None or watching.done()
+
+    def _add_handler(self, watch, pattern, ws_handler, impl, sub_id):
+        """Add handler with pattern.
+
+        Live events are held until released, after the sow is published.
+        Returns watched directories, futures of the pending dir watches and
+        the held events.
+        """
         watch_dirs = self._get_watch_dirs(watch)
+        held = _HeldEvents()
+        pending = []
         for directory in watch_dirs:
             if ((not self.handlers[directory] and
                  directory not in self.watch_dirs)):
                 _LOGGER.info('Added dir watcher: %s', directory)
-                self.watcher.add_dir(directory)
+                self._watch_dir(directory)
+
+            # Watch may have been added by another handler, still pending.
+            if not self._is_watched(directory):
+                pending.append(self._watching[directory])
 
             # Store pattern as precompiled regex.
             pattern_re = re.compile(
                 fnmatch.translate(pattern)
             )
-            self.handlers[directory].append(
-                (pattern_re, ws_handler, impl, sub_id)
-            )
+            handler = (pattern_re, ws_handler, impl, sub_id, held)
+            self.handlers[directory].append(handler)
+            self._index[directory][_pattern_prefix(pattern)].append(handler)
+        return watch_dirs, pending, held
+
+    def register(self, watch, pattern, ws_handler, impl, since, sub_id=None):
+        """Register handler with pattern."""
+        _watch_dirs, _pending, held = self._add_handler(
+            watch, pattern, ws_handler, impl, sub_id
+        )
         self._sow(watch, pattern, since, ws_handler, impl, sub_id=sub_id)
+        self._release(held, ws_handler, impl, sub_id)
+
+    @gen.coroutine
+    def register_async(self, watch, pattern, ws_handler, impl, since,
+                       sub_id=None):
+        """Register handler with pattern, state of the world is collected
+        in the sow thread, off the IO loop.
+        """
+        watch_dirs, pending, held = self._add_handler(
+            watch, pattern, ws_handler, impl, sub_id
+        )
+        try:
+            # Directory must be watched before sow is collected, not to miss
+            # any change in the cache.
+            yield pending
+            records = yield self._run_in_sow_thread(
+                self._sow_records, watch, watch_dirs, pattern, since, impl
+            )
+            self._publish_sow(records, ws_handler, impl, sub_id)
+        finally:
+            self._release(held, ws_handler, impl, sub_id)
+
+    def _release(self, held, handler, impl, sub_id):
+        """Send the held events and stop holding them."""
+        with self._held_lock:
+            for event in held.events:
+                self._send_event(handler, impl, sub_id, *event)
+            held.events = None
+
+    def _run_in_sow_thread(self, func, *args):
+        """Run func in the sow thread, return future resolved in IO loop."""
+        io_loop = tornado.ioloop.IOLoop.current()
+        future = tornado.concurrent.Future()
+
+        def _run():
+            try:
+                result = func(*args)
+            except Exception as err:  # pylint: disable=W0703
+                io_loop.add_callback(future.set_exception, err)
+            else:
+                io_loop.add_callback(future.set_result, result)
+
+        if self._sow_queue is None:
+            self._sow_queue = queue.Queue()
+            sow_thread = threading.Thread(target=self._run_sow_thread)
+            sow_thread.daemon = True
+            sow_thread.start()
+
+        self._sow_queue.put(_run)
+        return future
+
+    def _run_sow_thread(self):
+        """Run queued sow requests."""
+        while True:
+            request = self._sow_queue.get()
+            request()
 
     def _get_watch_dirs(self, watch):
         pathname = os.path.realpath(os.path.join(self.root, watch.lstrip('/')))
@@ -257,114 +464,270 @@ class DirWatchPubSub(object):
         _LOGGER.debug('deleted: %s', path)
         self._handle('d', path)
 
+    def _match_handlers(self, directory, filename):
+        """Return active handlers with pattern matching the filename.
+
+        Only the handlers with pattern prefix of the filename are checked.
+        """
+        index = self._index.get(directory)
+        if not index:
+            return []
+
+        handlers = []
+        for end in six.moves.range(len(filename) + 1):
+            for pattern_re, handler, impl, sub_id, held in index.get(
+                    filename[:end], ()):
+                if (handler.active(sub_id=sub_id) and
+                        pattern_re.match(filename)):
+                    handlers.append((handler, impl, sub_id, held))
+        return handlers
+
     def _handle(self, operation, path):
-        """Get event data and notify interested handlers of the change."""
+        """Get event data, update the cache and notify interested handlers of
+        the change.
+        """
         directory, filename = os.path.split(path)
 
         # Ignore (.) files, as they are temporary or "system".
         if filename[0] == '.':
             return
 
-        directory_handlers = self.handlers.get(directory, [])
-        handlers = [
-            (handler, impl, sub_id)
-            for pattern_re, handler, impl, sub_id in directory_handlers
-            if (handler.active(sub_id=sub_id) and
-                pattern_re.match(filename))
-        ]
-        if not handlers:
+        handlers = self._match_handlers(directory, filename)
+        if not handlers and not (directory in self._cache or
+                                 directory in self._loading):
             return
 
         if operation == 'd':
             when = time.time()
             content = None
         else:
-            if '/trace/' in path:
-                # Specialized handling of trace files (no need to stat/read).
-                # If file was already deleted (trace cleanup), don't ignore it.
-                _, timestamp, _ = filename.split(',', 2)
-                when, content = float(timestamp), ''
-            else:
-                try:
-                    when = os.stat(path).st_mtime
-                    with io.open(path) as f:
-                        content = f.read()
-                except (IOError, OSError) as err:
-                    if err.errno == errno.ENOENT:
-                        # If file was already deleted, ignore.
-                        # It will be handled as 'd'.
-                        return
-                    raise
-
-        self._notify(handlers, path, operation, content, when)
+            data = read_file(path)
+            if data is None:
+                # If file was already deleted, ignore.
+                # It will be handled as 'd'.
+                return
+            when, content = data
+
+        self._update_cache(operation, directory, filename, when, content)
+        if handlers:
+            self._notify(handlers, path, operation, content, when)
+
+    def dispatch(self, operation, path, when, content):
+        """Update the cache and notify interested handlers of the change read
+        by the event router.
+        """
+        directory, filename = os.path.split(path)
+        self._update_cache(operation, directory, filename, when, content)
+        handlers = self._match_handlers(directory, filename)
+        if handlers:
+            self._notify(handlers, path, operation, content, when)
+
+    def _update_cache(self, operation, directory, filename, when, content):
+        """Update cached directory, queue event if directory is loading."""
+        with self._cache_lock:
+            for queued in self._loading.get(directory, ()):
+                queued.append((operation, filename, when, content))
+            cache = self._cache.get(directory)
+            if cache is not None:
+                cache.apply(operation, filename, when, content)
 
     def _notify(self, handlers, path, operation, content, when):
-        """Notify interested handlers of the change."""
-        root_len = len(self.root)
+        """Notify interested handlers of the change.
+
+        Events are held for the handlers which did not get the sow yet.
+        """
+        for handler, impl, sub_id, held in handlers:
+            if held.events is not None:
+                with self._held_lock:
+                    if held.events is not None:
+                        held.events.append((path, operation, content, when))
+                        continue
 
-        for handler, impl, sub_id in handlers:
-            try:
-                payload = impl.on_event(path[root_len:],
-                                        operation,
-                                        content)
-                if payload is not None:
-                    payload['when'] = when
-                    if sub_id is not None:
-                        payload['sub-id'] = sub_id
-                    handler.send_msg(payload)
-            except Exception as err:  # pylint: disable=broad-except
-                _LOGGER.exception('Error handling event: %s, %s, %s, %s, %s',
-                                  path, operation, content, when, sub_id)
-                handler.send_error_msg(
-                    '{cls}: {err}'.format(
-                        cls=type(err).__name__,
-                        err=str(err)
-                    ),
-                    sub_id=sub_id,
-                    close_conn=sub_id is None
-                )
-
-    def _db_records(self, db_path, sow_table, watch, pattern, since):
-        """Get matching records from db."""
-        # if file does not exist, do not try to open it. Opening connection
-        # will create the file, there is no way to prevent this from
-        # happening until py3.
-        #
-        if not os.path.exists(db_path):
-            _LOGGER.info('Ignore deleted db: %s', db_path)
-            return (None, None)
-
-        # There is rare condition that the db file is deleted HERE. In this
-        # case connection will be open, but the tables will not be there.
-        conn = sqlite3.connect(db_path)
+            self._send_event(handler, impl, sub_id,
+                             path, operation, content, when)
+
+    def _send_event(self, handler, impl, sub_id, path, operation, content,
+                    when):
+        """Send event to the handler."""
+        try:
+            payload = impl.on_event(path[len(self.root):],
+                                    operation,
+                                    content)
+            if payload is not None:
+                payload['when'] = when
+                if sub_id is not None:
+                    payload['sub-id'] = sub_id
+                handler.send_msg(payload)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.exception('Error handling event: %s, %s, %s, %s, %s',
+                              path, operation, content, when, sub_id)
+            handler.send_error_msg(
+                '{cls}: {err}'.format(
+                    cls=type(err).__name__,
+                    err=str(err)
+                ),
+                sub_id=sub_id,
+                close_conn=sub_id is None
+            )
 
+    def _get_dbs(self, sow):
+        """Return open connections to the sow databases, sorted by name.
+
+        Connections are kept open, connections to the deleted databases are
+        closed. Must be called with _dbs_lock held.
+        """
+        dbs = set(
+            db for db in glob.glob(os.path.join(self.root, sow, '*'))
+            if not os.path.basename(db).startswith('.')
+        )
+        for db in set(self._dbs) - dbs:
+            _LOGGER.info('Closing deleted db: %s', db)
+            self._dbs.pop(db).close()
+
+        for db in sorted(dbs - set(self._dbs)):
+            # if file does not exist, do not try to open it. Opening
+            # connection will create the file, there is no way to prevent
+            # this from happening until py3.
+            if not os.path.exists(db):
+                _LOGGER.info('Ignore deleted db: %s', db)
+                continue
+            self._dbs[db] = sqlite3.connect(db, check_same_thread=False)
+
+        return [
+            (db, self._dbs[db]) for db in sorted(dbs) if db in self._dbs
+        ]
+
+    def _db_records(self, sow, sow_table, watch, pattern, since):
+        """Get matching records from sow databases."""
         # Before Python 3.7 GLOB pattern must not be parametrized to use index.
+        # Statements are prepared once per connection and pattern, connection
+        # keeps cache of the prepared statements.
         select_stmt = """
             SELECT timestamp, path, data FROM %s
             WHERE directory GLOB ? AND name GLOB '%s' AND timestamp >= ?
             ORDER BY timestamp
         """ % (sow_table, pattern)
 
-        # Return open connection, as conn.execute is cursor iterator, not
-        # materialized list.
+        records = []
+        with self._dbs_lock:
+            for db_path, conn in self._get_dbs(sow):
+                try:
+                    records.append(
+                        conn.execute(select_stmt, (watch, since,)).fetchall()
+                    )
+                except sqlite3.OperationalError as db_err:
+                    # There is rare condition that the db file is deleted
+                    # before it is opened, the tables will not be there.
+                    _LOGGER.info('Unable to execute: select from %s:%s ..., '
+                                 '%s', db_path, sow_table, str(db_err))
+        return records
+
+    def _fs_records(self, watch_dirs, pattern, since):
+        """Get state of the world from the cache of the watched directories.
+
+        Directories not cached yet are loaded from the filesystem.
+        """
+        root_len = len(self.root)
+
+        items = []
+        for directory in watch_dirs:
+            with self._cache_lock:
+                cache = self._cache.get(directory)
+            if cache is None:
+                cache = self._load_dir(directory)
+
+            with self._cache_lock:
+                matched = cache.match(pattern, since)
+            for when, filename, content in matched:
+                path = os.path.join(directory, filename)[root_len:]
+                items.append((when, path, content))
+
+        return sorted(items)
+
+    def _load_dir(self, directory):
+        """Load directory content in the cache.
+
+        Files are read without holding _cache_lock. Events of the directory
+        are queued meanwhile and replayed on the loaded content, before it
+        is swapped in the cache. Content is cached only if the directory is
+        watched, otherwise it would not be updated.
+        """
+        queued = []
+        with self._cache_lock:
+            self._loading[directory].append(queued)
+
+        cache = _DirCache()
+        loaded = False
         try:
-            return conn, conn.execute(select_stmt, (watch, since,))
-        except sqlite3.OperationalError as db_err:
-            # Not sure if the file needs to be deleted at this point. As
-            # sow_table is a parameter, passing non-existing table can cause
-            # legit file to be deleted.
-            _LOGGER.info('Unable to execute: select from %s:%s ..., %s',
-                         db_path, sow_table, str(db_err))
-            conn.close()
-            return (None, None)
+            try:
+                filenames = os.listdir(directory)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                filenames = []
 
-    def _sow(self, watch, pattern, since, handler, impl, sub_id=None):
-        """Publish state of the world."""
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                data = read_file(os.path.join(directory, filename))
+                if data is not None:
+                    cache.update(filename, *data)
+            loaded = True
+        finally:
+            with self._cache_lock:
+                loading = [
+                    other for other in self._loading.pop(directory)
+                    if other is not queued
+                ]
+                if loading:
+                    self._loading[directory] = loading
+
+                if loaded:
+                    for event in queued:
+                        cache.apply(*event)
+
+                    current = self._cache.get(directory)
+                    if current is not None:
+                        # Loaded concurrently.
+                        cache = current
+                    elif ((directory in self.handlers or
+                           directory in self.watch_dirs) and
+                          self._is_watched(directory)):
+                        self._cache[directory] = cache
+
+        _LOGGER.info('Loaded %s files in the cache: %s',
+                     len(cache.files), directory)
+        return cache
+
+    def _sow_records(self, watch, watch_dirs, pattern, since, impl):
+        """Get state of the world records, sorted and without duplicates."""
         if since is None:
             since = 0
 
-        def _publish(item):
-            when, path, content = item
+        records = []
+        sow = getattr(impl, 'sow', None)
+        if sow:
+            sow_table = getattr(impl, 'sow_table', 'sow')
+            records.extend(
+                self._db_records(sow, sow_table, watch, pattern, since)
+            )
+
+        records.append(self._fs_records(watch_dirs, pattern, since))
+
+        # Merge db and fs records, removing duplicates.
+        merged = []
+        prev_path = None
+        for item in heapq.merge(*records):
+            _when, path, _content = item
+            if path == prev_path:
+                continue
+            prev_path = path
+            merged.append(item)
+        return merged
+
+    def _publish_sow(self, records, handler, impl, sub_id=None):
+        """Publish state of the world records."""
+        for when, path, content in records:
             try:
                 payload = impl.on_event(str(path), None, content)
                 if payload is not None:
@@ -377,76 +740,19 @@ class DirWatchPubSub(object):
                                   path, content, when, sub_id)
                 handler.send_error_msg(str(err), sub_id=sub_id)
 
-        db_connections = []
-        fs_records = self._get_fs_sow(watch, pattern, since)
-
-        sow = getattr(impl, 'sow', None)
-        sow_table = getattr(impl, 'sow_table', 'sow')
-        try:
-            records = []
-            if sow:
-                dbs = sorted(glob.glob(os.path.join(self.root, sow, '*')))
-                for db in dbs:
-                    if os.path.basename(db).startswith('.'):
-                        continue
-
-                    conn, db_cursor = self._db_records(
-                        db, sow_table, watch, pattern, since
-                    )
-                    if db_cursor:
-                        records.append(db_cursor)
-
-                    # FIXME: Figure out pylint use before assign
-                    #
-                    # pylint: disable=E0601
-                    if conn:
-                        db_connections.append(conn)
-
-            records.append(fs_records)
-            # Merge db and fs records, removing duplicates.
-            prev_path = None
-
-            for item in heapq.merge(*records):
-                _when, path, _content = item
-                if path == prev_path:
-                    continue
-                prev_path = path
-                _publish(item)
-        finally:
-            for conn in db_connections:
-                if conn:
-                    conn.close()
-
-    def _get_fs_sow(self, watch, pattern, since):
-        """Get state of the world from filesystem."""
-        root_len = len(self.root)
-        fs_glob = os.path.join(self.root, watch.lstrip('/'), pattern)
-
-        files = glob.glob(fs_glob)
-
-        items = []
-        for filename in files:
-            try:
-                stat = os.stat(filename)
-                with io.open(filename) as f:
-                    content = f.read()
-                if stat.st_mtime >= since:
-                    path, when = filename[root_len:], stat.st_mtime
-                    items.append((when, path, content))
-            except (IOError, OSError) as err:
-                # Ignore deleted files.
-                if err.errno != errno.ENOENT:
-                    raise
-
-        return sorted(items)
+    def _sow(self, watch, pattern, since, handler, impl, sub_id=None):
+        """Publish state of the world."""
+        records = self._sow_records(
+            watch, self._get_watch_dirs(watch), pattern, since, impl
+        )
+        self._publish_sow(records, handler, impl, sub_id=sub_id)
 
     def _gc(self):
         """Remove disconnected websocket handlers."""
         for directory in list(six.viewkeys(self.handlers)):
             handlers = [
-                (pattern, handler, impl, sub_id)
-                for pattern, handler, impl, sub_id in self.handlers[directory]
-                if handler.active(sub_id=sub_id)
+                handler for handler in self.handlers[directory]
+                if handler[1].active(sub_id=handler[3])
             ]
 
             _LOGGER.info('Number of active handlers for %s: %s',
@@ -455,11 +761,25 @@ class DirWatchPubSub(object):
             if not handlers:
                 _LOGGER.info('No active handlers for %s', directory)
                 self.handlers.pop(directory, None)
+                self._index.pop(directory, None)
                 if directory not in self.watch_dirs:
-                    # Watch is not permanent, remove dir from watcher.
+                    # Watch is not permanent, remove dir from watcher, the
+                    # cache is no longer updated.
                     self.watcher.remove_dir(directory)
+                    self._watching.pop(directory, None)
+                    with self._cache_lock:
+                        self._cache.pop(directory, None)
             else:
                 self.handlers[directory] = handlers
+                active = set(id(handler) for handler in handlers)
+                index = self._index[directory]
+                for prefix in list(index):
+                    index[prefix] = [
+                        handler for handler in index[prefix]
+                        if id(handler) in active
+                    ]
+                    if not index[prefix]:
+                        del index[prefix]
 
     @utils.exit_on_unhandled
     def run(self, once=False):
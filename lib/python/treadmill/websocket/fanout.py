@@ -0,0 +1,358 @@
+"""Multi-process websocket server.
+
+One event router process owns the dirwatcher, reads the changed files once
+and routes the events to the worker processes subscribed to the directory.
+Worker processes own the client connections, each worker is connected to
+the router with unix socket pair, messages are JSON lines:
+
+    worker -> router: {"watch": <dir>}, {"unwatch": <dir>}
+    router -> worker: {"watching": <dir>}, {"event": [op, path, when, data]}
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import errno
+import json
+import logging
+import os
+import select
+import socket
+import time
+
+import tornado.concurrent
+import tornado.httpserver
+import tornado.ioloop
+import tornado.iostream
+import tornado.netutil
+import tornado.process
+import tornado.web
+from tornado import gen
+
+import six
+
+from treadmill import dirwatch
+from treadmill import utils
+from treadmill import websocket
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Interval of the removal of disconnected handlers in workers (seconds).
+_GC_INTERVAL = 10
+
+_RECV_SIZE = 64 * 1024
+
+# Max size of the events buffered for a worker not reading them (bytes).
+_MAX_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+def _encode(msg):
+    """Encode message as JSON line."""
+    return (json.dumps(msg) + '\n').encode()
+
+
+class EventRouter(object):
+    """Route dirwatch events to the worker processes.
+
+    Channels are non-blocking, messages a worker is not ready to read are
+    buffered, so that a slow worker does not delay the others. If the buffer
+    of a worker exceeds _MAX_BUFFER_SIZE, the router exits.
+    """
+
+    __slots__ = (
+        'channels',
+        'subscribers',
+        'watcher',
+        '_buffers',
+        '_output',
+        '_poll',
+        '_fds',
+    )
+
+    def __init__(self, channels):
+        self.channels = channels
+        # Directory -> indexes of the subscribed workers.
+        self.subscribers = collections.defaultdict(set)
+        self._buffers = [b''] * len(channels)
+        self._output = [bytearray() for _ in channels]
+
+        self.watcher = dirwatch.DirWatcher()
+        self.watcher.on_created = self._on_created
+        self.watcher.on_deleted = self._on_deleted
+        self.watcher.on_modified = self._on_modified
+
+        # Dirwatch events and worker requests are polled together.
+        self._poll = select.poll()
+        self._poll.register(self.watcher.inotify, select.POLLIN)
+        self._fds = {}
+        for idx, channel in enumerate(channels):
+            channel.setblocking(False)
+            self._poll.register(channel, select.POLLIN)
+            self._fds[channel.fileno()] = idx
+
+    @utils.exit_on_unhandled
+    def _on_created(self, path):
+        """On file created callback."""
+        self._route('c', path)
+
+    @utils.exit_on_unhandled
+    def _on_modified(self, path):
+        """On file modified callback."""
+        self._route('m', path)
+
+    @utils.exit_on_unhandled
+    def _on_deleted(self, path):
+        """On file deleted callback."""
+        self._route('d', path)
+
+    def _route(self, operation, path):
+        """Read event data and send it to the subscribed workers."""
+        directory, filename = os.path.split(path)
+
+        # Ignore (.) files, as they are temporary or "system".
+        if filename[0] == '.':
+            return
+
+        subscribers = self.subscribers.get(directory)
+        if not subscribers:
+            return
+
+        if operation == 'd':
+            when, content = time.time(), None
+        else:
+            data = websocket.read_file(path)
+            if data is None:
+                # If file was already deleted, it will be handled as 'd'.
+                return
+            when, content = data
+
+        msg = _encode({'event': [operation, path, when, content]})
+        for idx in subscribers:
+            self._send(idx, msg)
+
+    def _send(self, idx, msg):
+        """Send message to the worker, buffer what can not be sent now."""
+        output = self._output[idx]
+        if output:
+            output.extend(msg)
+        else:
+            output.extend(msg[self._write(idx, msg):])
+            if output:
+                self._poll.modify(self.channels[idx],
+                                  select.POLLIN | select.POLLOUT)
+
+        if len(output) > _MAX_BUFFER_SIZE:
+            _LOGGER.critical('Worker %s is not reading events.', idx)
+            utils.sys_exit(1)
+
+    def _flush(self, idx):
+        """Send buffered messages to the worker."""
+        output = self._output[idx]
+        del output[:self._write(idx, output)]
+        if not output:
+            self._poll.modify(self.channels[idx], select.POLLIN)
+
+    def _write(self, idx, data):
+        """Write data to the worker, return number of bytes written."""
+        try:
+            return self.channels[idx].send(data)
+        except socket.error as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return 0
+            raise
+
+    def _watch(self, idx, directory):
+        """Subscribe worker to the directory events."""
+        if not self.subscribers[directory]:
+            _LOGGER.info('Added dir watcher: %s', directory)
+            try:
+                self.watcher.add_dir(directory)
+            except OSError as err:
+                # Directory removed since subscribed, there are no events.
+                _LOGGER.warning('Unable to watch %s: %s', directory, err)
+
+        self.subscribers[directory].add(idx)
+        self._send(idx, _encode({'watching': directory}))
+
+    def _unwatch(self, idx, directory):
+        """Unsubscribe worker from the directory events."""
+        subscribers = self.subscribers.get(directory)
+        if subscribers is None:
+            return
+
+        subscribers.discard(idx)
+        if not subscribers:
+            _LOGGER.info('No subscribers for %s', directory)
+            del self.subscribers[directory]
+            self.watcher.remove_dir(directory)
+
+    def _receive(self, idx):
+        """Receive and handle requests from the worker."""
+        try:
+            data = self.channels[idx].recv(_RECV_SIZE)
+        except socket.error as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+
+        if not data:
+            _LOGGER.critical('Worker %s exited.', idx)
+            utils.sys_exit(1)
+            return
+
+        lines = (self._buffers[idx] + data).split(b'\n')
+        self._buffers[idx] = lines.pop()
+        for line in lines:
+            request = json.loads(line.decode())
+            if 'watch' in request:
+                self._watch(idx, request['watch'])
+            elif 'unwatch' in request:
+                self._unwatch(idx, request['unwatch'])
+            else:
+                _LOGGER.warning('Unexpected request: %r', request)
+
+    def _wait(self, timeout):
+        """Wait for dirwatch events or worker channels ready."""
+        try:
+            return self._poll.poll(timeout)
+        except select.error as err:
+            if six.PY2:
+                # pylint: disable=W1624,E1136,indexing-exception
+                if err[0] == errno.EINTR:
+                    return []
+            else:
+                if err.errno == errno.EINTR:
+                    return []
+            raise
+
+    @utils.exit_on_unhandled
+    def run(self, once=False):
+        """Run event loop."""
+        inotify_fd = self.watcher.inotify.fileno()
+        while True:
+            for fd, event in self._wait(0 if once else -1):
+                if fd == inotify_fd:
+                    self.watcher.process_events()
+                    continue
+
+                idx = self._fds[fd]
+                if event & select.POLLOUT:
+                    self._flush(idx)
+                if event & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                    self._receive(idx)
+
+            if once:
+                break
+
+
+class RouterChannel(object):
+    """Worker end of the channel to the event router.
+
+    Used as the watcher of the worker DirWatchPubSub.
+    """
+
+    __slots__ = (
+        'pubsub',
+        '_pending',
+        '_stream',
+    )
+
+    def __init__(self, sock):
+        self.pubsub = None
+        self._pending = collections.defaultdict(collections.deque)
+        self._stream = tornado.iostream.IOStream(sock)
+
+    def add_dir(self, directory):
+        """Subscribe to directory events, return future resolved once the
+        directory is watched.
+        """
+        future = tornado.concurrent.Future()
+        self._pending[directory].append(future)
+        self._stream.write(_encode({'watch': directory}))
+        return future
+
+    def remove_dir(self, directory):
+        """Unsubscribe from directory events."""
+        self._stream.write(_encode({'unwatch': directory}))
+
+    def _handle(self, msg):
+        """Handle message from the router."""
+        if 'event' in msg:
+            self.pubsub.dispatch(*msg['event'])
+        elif 'watching' in msg:
+            pending = self._pending.get(msg['watching'])
+            if pending:
+                pending.popleft().set_result(True)
+            if not pending:
+                self._pending.pop(msg['watching'], None)
+        else:
+            _LOGGER.warning('Unexpected message: %r', msg)
+
+    @gen.coroutine
+    def run(self):
+        """Read and handle messages from the router."""
+        while True:
+            try:
+                line = yield self._stream.read_until(b'\n')
+            except tornado.iostream.StreamClosedError:
+                _LOGGER.critical('Event router exited.')
+                utils.sys_exit(1)
+                return
+
+            self._handle(json.loads(line.decode()))
+
+
+def _run_worker(root, impl, watches, sock, sockets):
+    """Run worker serving the websocket connections."""
+    channel = RouterChannel(sock)
+    pubsub = websocket.DirWatchPubSub(root, impl, watches, watcher=channel)
+    channel.pubsub = pubsub
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    io_loop.spawn_callback(channel.run)
+    tornado.ioloop.PeriodicCallback(
+        pubsub._gc,  # pylint: disable=protected-access
+        _GC_INTERVAL * 1000
+    ).start()
+
+    application = tornado.web.Application([(r'/', pubsub.ws)])
+    http_server = tornado.httpserver.HTTPServer(application)
+    http_server.add_sockets(sockets)
+    io_loop.start()
+
+
+def run(root, impl, watches, port, workers):
+    """Run event router and workers in separate processes.
+
+    If any process exits, the others exit as well.
+    """
+    sockets = tornado.netutil.bind_sockets(port)
+    channels = [
+        socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        for _ in range(workers)
+    ]
+
+    task_id = tornado.process.fork_processes(workers + 1, max_restarts=0)
+    if task_id == 0:
+        for sock in sockets:
+            sock.close()
+        for _router_end, worker_end in channels:
+            worker_end.close()
+
+        _LOGGER.info('Starting event router, workers: %s', workers)
+        EventRouter([router_end for router_end, _ in channels]).run()
+    else:
+        worker_sock = None
+        for idx, (router_end, worker_end) in enumerate(channels):
+            router_end.close()
+            if idx == task_id - 1:
+                worker_sock = worker_end
+            else:
+                worker_end.close()
+
+        _LOGGER.info('Starting worker: %s', task_id)
+        _run_worker(root, impl, watches, worker_sock, sockets)
@@ -32,6 +32,7 @@ IDENTITY_GROUPS = '/identity-groups'
 KEYTAB_LOCKER = '/keytab.locker'
 PARTITIONS = '/partitions'
 PLACEMENT = '/placement'
+PLACEMENT_JOURNAL = '/placement.journal'
 REBOOTS = '/reboots'
 RUNNING = '/running'
 SCHEDULED = '/scheduled'
@@ -40,6 +41,7 @@ SCHEDULER = '/scheduler'
 SERVERS = '/servers'
 SERVER_PRESENCE = '/server.presence'
 STATE_REPORTS = '/reports'
+STATE_REPORTS_DELTA = '/reports.delta'
 STRATEGIES = '/strategies'
 TICKET_LOCKER = '/ticket.locker'
 TICKETS = '/tickets'
@@ -137,6 +139,7 @@ class path(object):  # pylint: disable=C0103
     identity_group = make_path_f(IDENTITY_GROUPS)
     partition = make_path_f(PARTITIONS)
     placement = make_path_f(PLACEMENT)
+    placement_journal = make_path_f(PLACEMENT_JOURNAL)
     reboot = make_path_f(REBOOTS)
     running = make_path_f(RUNNING)
     scheduled = make_path_f(SCHEDULED)
@@ -157,6 +160,7 @@ class path(object):  # pylint: disable=C0103
     trace_history = make_path_f(TRACE_HISTORY)
     trace_shard = make_path_f(TRACE)
     state_report = make_path_f(STATE_REPORTS)
+    state_report_delta = make_path_f(STATE_REPORTS_DELTA)
     globals = make_path_f(GLOBALS)
 
     # Special methods
@@ -6,8 +6,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import errno
 import logging
-import glob
 import os
 import kazoo
 
@@ -21,13 +21,19 @@ from treadmill.zksync import utils as zksync_utils
 
 _LOGGER = logging.getLogger(__name__)
 
+# Max number of added nodes read and written in one batch.
+_SYNC_BATCH_SIZE = 1000
+
 
 class Zk2Fs(object):
     """Syncronize Zookeeper with file system."""
 
     def __init__(self, zkclient, fsroot, tmp_dir=None):
         self.watches = set()
-        self.processed_once = set()
+        # Names of the children mirrored to file system, by zk path. File
+        # system is listed only on the first children event, after that the
+        # children are diffed against the index.
+        self.mirrored = dict()
         self.zkclient = zkclient
         self.fsroot = fsroot
         self.tmp_dir = tmp_dir
@@ -87,60 +93,32 @@ class Zk2Fs(object):
         else:
             self._write_data(fpath, data, stat)
 
-    def _filter_children_actions(self, sorted_children, sorted_filenames, add,
-                                 remove, common):
-        """sorts the children actions to add, remove and common."""
-        num_children = len(sorted_children)
-        num_filenames = len(sorted_filenames)
-
-        child_idx = 0
-        file_idx = 0
-
-        while child_idx < num_children or file_idx < num_filenames:
-            child_name = None
-            if child_idx < num_children:
-                child_name = sorted_children[child_idx]
-
-            file_name = None
-            if file_idx < num_filenames:
-                file_name = sorted_filenames[file_idx]
-
-            if child_name is None:
-                remove.append(file_name)
-                file_idx += 1
-
-            elif file_name is None:
-                add.append(child_name)
-                child_idx += 1
-
-            elif child_name == file_name:
-                common.append(child_name)
-                child_idx += 1
-                file_idx += 1
-
-            elif child_name < file_name:
-                add.append(child_name)
-                child_idx += 1
-
-            else:
-                remove.append(file_name)
-                file_idx += 1
+    def _list_files(self, fpath):
+        """List names of the files mirrored in the directory."""
+        try:
+            return [
+                name for name in os.listdir(fpath)
+                if not name.startswith('.')
+            ]
+        except OSError as err:
+            if err.errno == errno.ENOENT:
+                return []
+            raise
 
     def _children_watch(self, zkpath, children, watch_data,
                         on_add, on_del, cont_watch_predicate=None):
         """Callback invoked on children watch."""
-        fpath = self.fpath(zkpath)
-
-        sorted_children = sorted(children)
-        sorted_filenames = sorted(map(os.path.basename,
-                                      glob.glob(os.path.join(fpath, '*'))))
+        children = set(children)
 
-        add = []
-        remove = []
+        mirrored = self.mirrored.get(zkpath)
         common = []
+        if mirrored is None:
+            # Files left from previous run are synced once.
+            mirrored = set(self._list_files(self.fpath(zkpath)))
+            common = sorted(children & mirrored)
 
-        self._filter_children_actions(sorted_children, sorted_filenames,
-                                      add, remove, common)
+        remove = sorted(mirrored - children)
+        add = sorted(children - mirrored)
 
         for node in remove:
             _LOGGER.info('Delete: %s', node)
@@ -148,28 +126,31 @@ class Zk2Fs(object):
             self.watches.discard(zknode)
             on_del(zknode)
 
-        if zkpath not in self.processed_once:
-            self.processed_once.add(zkpath)
-            for node in common:
-                _LOGGER.info('Common: %s', node)
-
-                zknode = z.join_zookeeper_path(zkpath, node)
-                if watch_data:
-                    self.watches.add(zknode)
-
-                on_add(zknode)
-
+        for node in common:
+            _LOGGER.info('Common: %s', node)
         for node in add:
             _LOGGER.info('Add: %s', node)
 
-            zknode = z.join_zookeeper_path(zkpath, node)
-            if watch_data:
-                self.watches.add(zknode)
+        zknodes = [
+            z.join_zookeeper_path(zkpath, node) for node in common + add
+        ]
+        if watch_data:
+            self.watches.update(zknodes)
+
+        # Added nodes without data watches are read in bulk, unless the
+        # default callback was replaced.
+        #
+        # pylint: disable=W0143
+        if on_add == self._default_on_add and not watch_data:
+            self.sync_data_many(zknodes)
+        else:
+            for zknode in zknodes:
+                on_add(zknode)
 
-            on_add(zknode)
+        self.mirrored[zkpath] = children
 
         if cont_watch_predicate:
-            return cont_watch_predicate(zkpath, sorted_children)
+            return cont_watch_predicate(zkpath, sorted(children))
 
         return True
 
@@ -193,6 +174,29 @@ class Zk2Fs(object):
             self._write_data(fpath, data, stat)
             self._update_last()
 
+    def sync_data_many(self, zkpaths):
+        """Sync data of zk nodes to files, reading the nodes in batches.
+
+        Nodes are read with pipelined async requests, files which nodes no
+        longer exist are removed.
+        """
+        for idx in range(0, len(zkpaths), _SYNC_BATCH_SIZE):
+            batch = zkpaths[idx:idx + _SYNC_BATCH_SIZE]
+            found = zkutils.get_many_data(self.zkclient, batch)
+            for zkpath in batch:
+                fpath = self.fpath(zkpath)
+                if zkpath in found:
+                    data, stat = found[zkpath]
+                    self._write_data(fpath, data, stat)
+                else:
+                    _LOGGER.warning(
+                        'Tried to add node that no longer exists: %s', zkpath
+                    )
+                    fs.rm_safe(fpath)
+
+        if zkpaths:
+            self._update_last()
+
     def _make_children_watch(self, zkpath, watch_data=False,
                              on_add=None, on_del=None,
                              cont_watch_predicate=None):
@@ -238,6 +242,8 @@ class Zk2Fs(object):
 
         fpath = self.fpath(zkpath)
         fs.mkdir_safe(fpath)
+        # Directory may have been recreated, list it again on first event.
+        self.mirrored.pop(zkpath, None)
 
         done_file = os.path.join(fpath, '.done')
         if os.path.exists(done_file):
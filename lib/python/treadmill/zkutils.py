@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
 import fnmatch
 import io
 import logging
@@ -37,6 +38,9 @@ ZK_MAX_CONNECTION_START_TIMEOUT = 30
 _VAGRANT_PROFILE = 'vagrant'
 _ZK_PLUGIN_MOD = None
 
+# Max number of outstanding async requests when reading nodes in bulk.
+_MAX_PENDING = 256
+
 DEFAULT_ACL = True
 
 
@@ -475,10 +479,8 @@ def get(zkclient, path, watcher=None, strict=True):
     return data
 
 
-def get_with_metadata(zkclient, path, watcher=None, strict=True):
-    """Read content of Zookeeper node and return YAML parsed object."""
-    data, metadata = zkclient.get(path, watch=watcher)
-
+def _load(data, strict=True):
+    """Parse YAML content of Zookeeper node."""
     result = None
     if data is not None:
         try:
@@ -489,7 +491,71 @@ def get_with_metadata(zkclient, path, watcher=None, strict=True):
             else:
                 result = data
 
-    return result, metadata
+    return result
+
+
+def get_with_metadata(zkclient, path, watcher=None, strict=True):
+    """Read content of Zookeeper node and return YAML parsed object."""
+    data, metadata = zkclient.get(path, watch=watcher)
+    return _load(data, strict=strict), metadata
+
+
+def _pipeline(request, paths, max_pending):
+    """Send async requests, keeping at most max_pending outstanding.
+
+    Returns dict of path to result, paths which do not exist are omitted.
+    """
+    results = {}
+    pending = collections.deque()
+
+    def _collect():
+        """Wait for the oldest outstanding request."""
+        path, async_result = pending.popleft()
+        try:
+            results[path] = async_result.get()
+        except kazoo.client.NoNodeError:
+            _LOGGER.debug('Node %s does not exist.', path)
+
+    for path in paths:
+        pending.append((path, request(path)))
+        if len(pending) >= max_pending:
+            _collect()
+
+    while pending:
+        _collect()
+
+    return results
+
+
+def get_many_with_metadata(zkclient, paths, strict=True,
+                           max_pending=_MAX_PENDING):
+    """Read content of Zookeeper nodes, pipelining the requests.
+
+    Returns dict of path to (YAML parsed object, metadata), nodes which do
+    not exist are omitted.
+    """
+    results = _pipeline(zkclient.get_async, paths, max_pending)
+    return {
+        path: (_load(data, strict=strict), metadata)
+        for path, (data, metadata) in six.iteritems(results)
+    }
+
+
+def get_many_data(zkclient, paths, max_pending=_MAX_PENDING):
+    """Read raw data of Zookeeper nodes, pipelining the requests.
+
+    Returns dict of path to (data, metadata), nodes which do not exist are
+    omitted.
+    """
+    return _pipeline(zkclient.get_async, paths, max_pending)
+
+
+def get_children_many(zkclient, paths, max_pending=_MAX_PENDING):
+    """Read children of Zookeeper nodes, pipelining the requests.
+
+    Returns dict of path to children, nodes which do not exist are omitted.
+    """
+    return _pipeline(zkclient.get_children_async, paths, max_pending)
 
 
 def get_default(zkclient, path, watcher=None, strict=True, default=None):
@@ -550,6 +616,54 @@ def ensure_deleted(zkclient, path, recursive=True):
         _LOGGER.debug('Node %s does not exist.', path)
 
 
+def _commit(transaction):
+    """Commit transaction, return True if all operations succeeded."""
+    for result in transaction.commit():
+        if isinstance(result, Exception):
+            _LOGGER.debug('Transaction rolled back: %r', result)
+            return False
+    return True
+
+
+def create_many(zkclient, nodes, default_acl=True):
+    """Create nodes in a single transaction, converting data to YAML.
+
+    Nodes is a list of (path, data, acl) tuples, parent nodes must exist.
+    Return True if all nodes were created, False if the transaction was
+    rolled back (e.g. some of the nodes exist) and nothing was created.
+    """
+    if not nodes:
+        return True
+
+    transaction = zkclient.transaction()
+    for path, data, acl in nodes:
+        if default_acl:
+            realacl = make_default_acl(acl)
+        else:
+            realacl = acl
+        _LOGGER.debug('create (transaction): %s acl=%s', path, realacl)
+        transaction.create(path, _payload(data), acl=realacl)
+
+    return _commit(transaction)
+
+
+def delete_many(zkclient, paths):
+    """Delete leaf nodes in a single transaction.
+
+    Return True if all nodes were deleted, False if the transaction was
+    rolled back (e.g. some of the nodes do not exist) and nothing was deleted.
+    """
+    if not paths:
+        return True
+
+    transaction = zkclient.transaction()
+    for path in paths:
+        _LOGGER.debug('delete (transaction): %s', path)
+        transaction.delete(path)
+
+    return _commit(transaction)
+
+
 def exists(zk_client, zk_path, timeout=60):
     """wrapping the zk exists function with timeout"""
     node_created_event = zk_client.handler.event_object()
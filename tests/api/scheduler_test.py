@@ -12,6 +12,8 @@ import unittest
 import mock
 import pandas as pd
 
+from treadmill import reports
+from treadmill import scheduler as tm_sched
 from treadmill.api import scheduler  # pylint: disable=no-name-in-module
 
 
@@ -35,12 +37,38 @@ class ApiReportTest(unittest.TestCase):
 
         result = self.report.get('foo')
 
-        zk_mock.get.assert_called_with('/reports/foo')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/foo'),
+            mock.call('/reports.delta/foo'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame([[1, 2, 3], [4, 5, 6]], columns=['a', 'b', 'c'])
         )
 
+    @mock.patch('treadmill.context.ZkContext.conn')
+    def test_get_delta(self, zk_mock):
+        """Test fetching a columnar report with delta against it.
+        """
+        base = pd.DataFrame(
+            [['foo', 1], ['bar', 2]], columns=['instance', 'rank']
+        )
+        current = pd.DataFrame(
+            [['bar', 2], ['baz', 3]], columns=['instance', 'rank']
+        )
+        zk_mock.get.side_effect = [
+            (reports.serialize_columns(base, 1), None),
+            (reports.serialize_delta(base, current, 1), None),
+        ]
+
+        result = self.report.get('apps')
+
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
+        self.assertEqual(result.to_dict('list'), current.to_dict('list'))
+
     @mock.patch('treadmill.context.ZkContext.conn')
     def test_get_match(self, zk_mock):
         """Test match parameter on get csv.
@@ -54,7 +82,10 @@ class ApiReportTest(unittest.TestCase):
         ])
         zk_mock.get.return_value = (bz2.compress(content.encode()), None)
         result = self.report.get('apps', match='findme')
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -63,7 +94,10 @@ class ApiReportTest(unittest.TestCase):
             )
         )
         result = self.report.get('apps', match='findme*')
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -72,7 +106,10 @@ class ApiReportTest(unittest.TestCase):
             )
         )
         result = self.report.get('apps', match='*findme')
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -96,7 +133,10 @@ class ApiReportTest(unittest.TestCase):
         zk_mock.get.return_value = (bz2.compress(content.encode()), None)
         result = self.report.get('apps', partition='part1')
 
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -109,7 +149,10 @@ class ApiReportTest(unittest.TestCase):
         )
 
         result = self.report.get('apps', partition='part[12]')
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -123,7 +166,10 @@ class ApiReportTest(unittest.TestCase):
         )
 
         result = self.report.get('apps', partition='*part1')
-        zk_mock.get.assert_called_with('/reports/apps')
+        zk_mock.get.assert_has_calls([
+            mock.call('/reports/apps'),
+            mock.call('/reports.delta/apps'),
+        ])
         pd.util.testing.assert_frame_equal(
             result,
             pd.DataFrame(
@@ -165,6 +211,36 @@ class ApiReportTest(unittest.TestCase):
             scheduler.get_readonly_scheduler()
             self.assertFalse(loader_mock.called)
 
+    @mock.patch('treadmill.api.scheduler.get_readonly_scheduler')
+    def test_explain_list(self, ro_scheduler_mock):
+        """Test explaining pending apps in bulk."""
+        # W0212(protected-access): Access to a protected member
+        # pylint: disable=W0212
+        tm_sched.DIMENSION_COUNT = 3
+        cell = tm_sched.Cell('top')
+        cell.add_node(tm_sched.Server('srv1', [10, 10, 10], label='part1'))
+        for name, label in [('foo#1', 'part1'), ('foo#2', 'part1'),
+                            ('bar#1', 'part2'), ('baz#1', 'part1')]:
+            cell.add_app(
+                cell.partitions[label].allocation,
+                tm_sched.Application(name, 100, [1, 1, 1], name[:3])
+            )
+        cell.members()['srv1'].put(cell.apps['baz#1'])
+        ro_scheduler_mock.return_value = mock.Mock(cell=cell)
+        scheduler._RO_EXPLAINER = None
+
+        result = self.report.explain.list()
+        self.assertEqual(result['name'].tolist(), ['bar#1', 'foo#1', 'foo#2'])
+        self.assertEqual(result['reason'].tolist(), ['partition', '', ''])
+
+        result = self.report.explain.list(match='foo*', partition='part1')
+        self.assertEqual(result['name'].tolist(), ['foo#1', 'foo#2'])
+
+        # Explainer is reused while the model is not reloaded.
+        explainer = scheduler._RO_EXPLAINER
+        self.report.explain.list()
+        self.assertIs(scheduler._RO_EXPLAINER, explainer)
+
 
 if __name__ == '__main__':
     unittest.main()
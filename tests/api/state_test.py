@@ -6,6 +6,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
 import json
 import zlib
@@ -26,6 +31,32 @@ def _create_zkclient_mock(placement_data):
     return zkclient_mock
 
 
+def _snapshot(rows):
+    """Create compressed finished history snapshot."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmpdir, 'finished.db')
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute(
+                'CREATE TABLE finished (path text, timestamp real, data text,'
+                ' directory text, name text)'
+            )
+            conn.executemany(
+                'INSERT INTO finished (path, timestamp, data, directory, name)'
+                ' VALUES(?, ?, ?, ?, ?)',
+                [
+                    ('/finished/' + name, timestamp, data, '/finished', name)
+                    for name, timestamp, data in rows
+                ]
+            )
+        conn.close()
+        with io.open(db_path, 'rb') as f:
+            return zlib.compress(f.read())
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 class ApiStateTest(unittest.TestCase):
     """treadmill.api.state tests."""
 
@@ -75,6 +106,7 @@ class ApiStateTest(unittest.TestCase):
     @mock.patch('treadmill.api.state.watch_placement', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished_history', mock.Mock())
+    @mock.patch('treadmill.api.state.watch_servers', mock.Mock())
     @mock.patch('treadmill.api.state.CellState')
     def test_get(self, cell_state_cls_mock):
         """Tests for treadmill.api.state.get()"""
@@ -124,6 +156,7 @@ class ApiStateTest(unittest.TestCase):
     @mock.patch('treadmill.api.state.watch_placement', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished_history', mock.Mock())
+    @mock.patch('treadmill.api.state.watch_servers', mock.Mock())
     @mock.patch('treadmill.api.state.CellState')
     def test_list(self, cell_state_cls_mock):
         """Tests for treadmill.api.state.list()"""
@@ -148,21 +181,18 @@ class ApiStateTest(unittest.TestCase):
             ]
         )
 
-    @mock.patch('treadmill.admin.Server.list', mock.Mock(
-        return_value=[
-            {'cell': 'x', 'traits': [], '_id': 'baz1', 'partition': 'part1'},
-            {'cell': 'x', 'traits': [], '_id': 'baz2', 'partition': 'part2'}
-        ]
-    ))
     @mock.patch('treadmill.context.GLOBAL', mock.Mock())
     @mock.patch('treadmill.api.state.watch_running', mock.Mock())
     @mock.patch('treadmill.api.state.watch_placement', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished', mock.Mock())
     @mock.patch('treadmill.api.state.watch_finished_history', mock.Mock())
+    @mock.patch('treadmill.api.state.watch_servers', mock.Mock())
     @mock.patch('treadmill.api.state.CellState')
     def test_list_partition(self, cell_state_cls_mock):
         """Tests for treadmill.api.state.list() with partition"""
         cell_state_cls_mock.return_value = self.cell_state
+        self.cell_state.set_server('baz1', 'part1')
+        self.cell_state.set_server('baz2', 'part2')
 
         state_api = state.API()
 
@@ -180,6 +210,185 @@ class ApiStateTest(unittest.TestCase):
             ]
         )
 
+    def test_list_indexes(self):
+        """Test placement indexes are maintained on updates."""
+        cell_state = state.CellState()
+        cell_state.placement = {
+            'foo.bar#0000000001': {
+                'state': 'scheduled', 'expires': None, 'host': 'baz1'
+            },
+            'foo.baz#0000000002': {
+                'state': 'pending', 'expires': None, 'host': None
+            },
+        }
+        cell_state.set_server('baz1', 'part1')
+        cell_state.set_server('baz2', 'part1')
+        cell_state.set_server('baz3', 'part2')
+
+        cell_state.update_placement(
+            'foo.baz#0000000002',
+            {'state': 'scheduled', 'expires': None, 'host': 'baz3'}
+        )
+        cell_state.update_placement(
+            'foo.bar#0000000003',
+            {'state': 'scheduled', 'expires': None, 'host': 'baz2'}
+        )
+        cell_state.remove_placement('foo.bar#0000000001')
+        cell_state.set_running(['foo.bar#0000000003'])
+
+        def _list(match, partition=None):
+            return sorted(
+                (name, item['state'], item['host'])
+                for name, item in cell_state.list_placement(match, partition)
+            )
+
+        self.assertEqual(
+            _list('foo.*'),
+            [('foo.bar#0000000003', 'running', 'baz2'),
+             ('foo.baz#0000000002', 'scheduled', 'baz3')]
+        )
+        self.assertEqual(
+            _list('foo.bar#*'),
+            [('foo.bar#0000000003', 'running', 'baz2')]
+        )
+        self.assertEqual(_list('foo.baz#*', 'part1'), [])
+        self.assertEqual(
+            _list('*', 'part2'),
+            [('foo.baz#0000000002', 'scheduled', 'baz3')]
+        )
+
+        # Server moved to another partition.
+        cell_state.set_server('baz2', 'part2')
+        self.assertEqual(_list('*', 'part1'), [])
+        self.assertEqual(len(_list('*', 'part2')), 2)
+
+        cell_state.remove_server('baz3')
+        self.assertEqual(
+            _list('*', 'part2'),
+            [('foo.bar#0000000003', 'running', 'baz2')]
+        )
+
+        # Instance no longer running.
+        cell_state.set_running([])
+        self.assertEqual(
+            _list('*', 'part2'),
+            [('foo.bar#0000000003', 'scheduled', 'baz2')]
+        )
+
+    def test_watch_servers(self):
+        """Test watching server partitions."""
+        zk_data = {
+            '/servers/baz1': b'partition: part1\n',
+            '/servers/baz2': b'{}\n',
+        }
+        zkclient_mock = mock.Mock()
+        zkclient_mock.ChildrenWatch.return_value = mock.Mock(
+            side_effect=lambda func: func(['baz1', 'baz2'])
+        )
+
+        def _data_watch(_client, path):
+            return lambda func: func(zk_data[path], None, None)
+
+        cell_state = state.CellState()
+        with mock.patch('treadmill.zkwatchers.ExistingDataWatch',
+                        mock.Mock(side_effect=_data_watch)):
+            state.watch_servers(zkclient_mock, cell_state)
+
+        self.assertEqual(
+            cell_state.servers,
+            {'baz1': 'part1', 'baz2': '_default'}
+        )
+
+        _args, _kwargs = zkclient_mock.ChildrenWatch.return_value.call_args
+        watch_servers = _args[0]
+        watch_servers(['baz1'])
+        self.assertEqual(cell_state.servers, {'baz1': 'part1'})
+
+    def test_watch_finished(self):
+        """Test new finished nodes are read in a batch."""
+        zkclient_mock = mock.Mock()
+        zkclient_mock.ChildrenWatch.return_value = mock.Mock(
+            side_effect=lambda func: func(['foo.bar#1', 'foo.bar#2'])
+        )
+        cell_state = state.CellState()
+
+        with mock.patch('treadmill.zkutils.get_many_with_metadata',
+                        mock.Mock(return_value={
+                            '/finished/foo.bar#1': ({'state': 'finished'},
+                                                    None),
+                        })) as get_many_mock:
+            state.watch_finished(zkclient_mock, cell_state)
+
+            self.assertEqual(get_many_mock.call_count, 1)
+            self.assertEqual(
+                sorted(get_many_mock.call_args[0][1]),
+                ['/finished/foo.bar#1', '/finished/foo.bar#2']
+            )
+            self.assertEqual(
+                cell_state.finished,
+                {'foo.bar#1': {'state': 'finished'}, 'foo.bar#2': {}}
+            )
+
+            _args, _kwargs = zkclient_mock.ChildrenWatch.return_value.call_args
+            watch_finished = _args[0]
+            watch_finished(['foo.bar#2'])
+            self.assertEqual(cell_state.finished, {'foo.bar#2': {}})
+
+    def test_finished_history(self):
+        """Test finished history snapshots are decoded on lookup."""
+        data = 'host: baz1\nstate: finished\nwhen: \'{}\'\ndata: \'0.0\'\n'
+        history = state.FinishedHistory(cache_size=1)
+        # Snapshots are ordered by name, regardless of the order added.
+        history.add_snapshot('finished.db.gzip-0000000002', _snapshot([
+            ('foo.bar#0000000003', 3.0, data.format(3)),
+            ('foo.bar#0000000002', 4.0, data.format(4)),
+            ('foo.bar#0000000004', 5.0, None),
+        ]))
+        history.add_snapshot('finished.db.gzip-0000000001', _snapshot([
+            ('foo.bar#0000000001', 1.0, data.format(1)),
+            ('foo.bar#0000000002', 2.0, data.format(2)),
+        ]))
+
+        self.assertEqual(len(history), 4)
+        self.assertEqual(
+            list(reversed(history)),
+            ['foo.bar#0000000004', 'foo.bar#0000000002',
+             'foo.bar#0000000003', 'foo.bar#0000000001']
+        )
+        self.assertEqual(history.get('foo.bar#0000000002')['when'], '4')
+        self.assertEqual(history.get('foo.bar#0000000001')['when'], '1')
+        self.assertIsNone(history.get('foo.bar#0000000004'))
+        self.assertIsNone(history.get('foo.bar#0000000005'))
+        # Only the last decoded snapshot is kept within the cache size.
+        self.assertEqual(
+            list(history._decoded),  # pylint: disable=protected-access
+            ['finished.db.gzip-0000000002']
+        )
+
+        history.remove_snapshot('finished.db.gzip-0000000002')
+        self.assertEqual(
+            list(reversed(history)),
+            ['foo.bar#0000000001']
+        )
+        self.assertNotIn('foo.bar#0000000002', history)
+
+        # Snapshot is read from temporary file if it can not be deserialized.
+        with mock.patch('treadmill.api.state.sqlite3',
+                        mock.Mock(connect=sqlite3.connect, Connection=object)):
+            history.add_snapshot('finished.db.gzip-0000000003', _snapshot([
+                ('foo.bar#0000000005', 6.0, data.format(6)),
+            ]))
+            self.assertEqual(history.get('foo.bar#0000000005')['when'], '6')
+        history.remove_snapshot('finished.db.gzip-0000000003')
+
+        cell_state = state.CellState()
+        cell_state.finished_history = history
+        self.assertEqual(
+            cell_state.list_finished('foo.bar#*', limit=10),
+            [{'host': 'baz1', 'name': 'foo.bar#0000000001', 'oom': False,
+              'when': '1', 'state': 'finished', 'exitcode': 0}]
+        )
+
     def test_watch_placement(self):
         """Test loading placement.
         """
@@ -224,6 +433,74 @@ class ApiStateTest(unittest.TestCase):
             }
         )
 
+    def test_watch_placement_journal(self):
+        """Test loading placement checkpoint and applying the journal.
+        """
+        def _zdata(data):
+            return zlib.compress(json.dumps(data).encode()), None
+
+        zk_data = {
+            '/placement': _zdata({
+                'version': 10,
+                'placement': [
+                    ['foo.bar#0000000001', None, None, 'baz', 100.0],
+                    ['foo.bar#0000000002', None, None, 'baz', 100.0],
+                ],
+            }),
+            '/placement.journal/0000000000000010': _zdata({
+                'version': 10,
+                'placement': [['foo.bar#0000000002', None, None, None, None]],
+                'deleted': [],
+            }),
+            '/placement.journal/0000000000000011': _zdata({
+                'version': 11,
+                'placement': [['foo.bar#0000000003', None, None, 'baz', 1.0]],
+                'deleted': ['foo.bar#0000000001'],
+            }),
+        }
+        journal = ['0000000000000011', '0000000000000010']
+
+        zkclient_mock = _create_zkclient_mock(zk_data['/placement'][0])
+        zkclient_mock.ChildrenWatch.return_value = mock.Mock(
+            side_effect=lambda func: func(journal)
+        )
+        zkclient_mock.get.side_effect = lambda path: zk_data[path]
+
+        cell_state = state.CellState()
+        state.watch_placement(zkclient_mock, cell_state)
+
+        # Entry 10 is in the checkpoint already, only 11 is applied.
+        self.assertEqual(cell_state.placement_version, 11)
+        self.assertEqual(
+            cell_state.placement,
+            {
+                'foo.bar#0000000002': {
+                    'state': 'scheduled', 'expires': 100.0, 'host': 'baz'
+                },
+                'foo.bar#0000000003': {
+                    'state': 'scheduled', 'expires': 1.0, 'host': 'baz'
+                },
+            }
+        )
+
+        # Consumer behind the trimmed journal reloads the checkpoint.
+        zk_data['/placement'] = _zdata({
+            'version': 20,
+            'placement': [['foo.bar#0000000004', None, None, 'baz', 2.0]],
+        })
+        zk_data['/placement.journal/0000000000000021'] = _zdata({
+            'version': 21,
+            'placement': [],
+            'deleted': ['foo.bar#0000000004'],
+        })
+        journal[:] = ['0000000000000021']
+        _args, _kwargs = zkclient_mock.ChildrenWatch.return_value.call_args
+        watch_journal = _args[0]
+        watch_journal(journal)
+
+        self.assertEqual(cell_state.placement_version, 21)
+        self.assertEqual(cell_state.placement, {})
+
     def test_watch_placement_yaml(self):
         """Test loading placement stored as yaml, for backward compatibility.
         """
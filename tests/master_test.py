@@ -430,6 +430,10 @@ class MasterTest(mockzk.MockZookeeperTestCase):
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.create_many',
+                mock.Mock(return_value=True))
+    @mock.patch('treadmill.zkutils.delete_many',
+                mock.Mock(return_value=True))
     @mock.patch('time.time', mock.Mock(return_value=500))
     def test_reschedule(self):
         """Tests application placement."""
@@ -453,42 +457,94 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         cell.add_app(cell.partitions[None].allocation, app1)
         cell.add_app(cell.partitions[None].allocation, app2)
 
+        self.master.placement_version = 1000
+
         # At this point app1 is on server 1, app2 on server 2.
         self.master.reschedule()
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement/2/app2',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-        ], any_order=True)
+        args, _kwargs = treadmill.zkutils.create_many.call_args
+        self.assertEqual(sorted(args[1]), [
+            ('/placement/1/app1', {'expires': 500, 'identity': None},
+             mock.ANY),
+            ('/placement/2/app2', {'expires': 500, 'identity': None},
+             mock.ANY),
+        ])
 
-        treadmill.zkutils.ensure_deleted.reset_mock()
         treadmill.zkutils.put.reset_mock()
         srv_1.state = scheduler.State.down
         self.master.reschedule()
 
-        treadmill.zkutils.ensure_deleted.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1'),
-        ])
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/3/app1',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement', mock.ANY, acl=mock.ANY),
-        ])
+        treadmill.zkutils.delete_many.assert_called_with(
+            mock.ANY, ['/placement/1/app1']
+        )
+        treadmill.zkutils.create_many.assert_called_with(
+            mock.ANY,
+            [('/placement/3/app1', {'expires': 500, 'identity': None},
+              mock.ANY)]
+        )
+        treadmill.zkutils.put.assert_called_once_with(
+            mock.ANY, '/placement', mock.ANY, acl=mock.ANY
+        )
         # Verify that placement data was properly saved as a compressed json.
-        args, _kwargs = treadmill.zkutils.put.call_args_list[1]
+        args, _kwargs = treadmill.zkutils.put.call_args
         placement_data = args[2]
         placement = json.loads(
             zlib.decompress(placement_data).decode()
         )
-        self.assertIn(['app1', '1', 500, '3', 500], placement)
-        self.assertIn(['app2', '2', 500, '2', 500], placement)
+        self.assertEqual(placement['version'], 1002)
+        self.assertIn(['app1', '1', 500, '3', 500], placement['placement'])
+        self.assertIn(['app2', '2', 500, '2', 500], placement['placement'])
+
+        # Incremental run publishes only the changes to the journal.
+        treadmill.zkutils.put.reset_mock()
+        srv_3.state = scheduler.State.down
+        self.master.reschedule(incremental=True)
+
+        treadmill.zkutils.put.assert_called_once_with(
+            mock.ANY, '/placement.journal/0000000000001003', mock.ANY,
+            acl=mock.ANY
+        )
+        args, _kwargs = treadmill.zkutils.put.call_args
+        placement = json.loads(zlib.decompress(args[2]).decode())
+        self.assertEqual(placement['version'], 1003)
+        self.assertEqual(
+            placement['placement'], [['app1', '3', 500, '4', 500]]
+        )
+        self.assertEqual(placement['deleted'], [])
+
+        # App removal is published as deleted.
+        treadmill.zkutils.put.reset_mock()
+        cell.remove_app('app2')
+        self.master.reschedule(incremental=True)
+
+        args, _kwargs = treadmill.zkutils.put.call_args
+        self.assertEqual(args[1], '/placement.journal/0000000000001004')
+        placement = json.loads(zlib.decompress(args[2]).decode())
+        self.assertEqual(placement['placement'], [])
+        self.assertEqual(placement['deleted'], ['app2'])
+
+        # Checkpoint trims the journal.
+        treadmill.zkutils.put.reset_mock()
+        self.master.reschedule()
+
+        treadmill.zkutils.put.assert_called_once_with(
+            mock.ANY, '/placement', mock.ANY, acl=mock.ANY
+        )
+        treadmill.zkutils.delete_many.assert_called_with(
+            mock.ANY, [
+                '/placement.journal/0000000000001003',
+                '/placement.journal/0000000000001004',
+            ]
+        )
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.create_many',
+                mock.Mock(return_value=True))
+    @mock.patch('treadmill.zkutils.delete_many',
+                mock.Mock(return_value=True))
     @mock.patch('time.time', mock.Mock(return_value=500))
     def test_reschedule_maxutil(self):
         """Tests application placement."""
@@ -515,27 +571,33 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         cell.add_app(cell.partitions[None].allocation, app2)
 
         self.master.reschedule()
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-        ])
+        treadmill.zkutils.create_many.assert_called_with(
+            mock.ANY,
+            [('/placement/1/app1', {'expires': 500, 'identity': None},
+              mock.ANY)]
+        )
 
         app2.priority = 5
         self.master.reschedule()
 
-        treadmill.zkutils.ensure_deleted.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1'),
-        ])
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/2/app2',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-        ])
+        treadmill.zkutils.delete_many.assert_called_with(
+            mock.ANY, ['/placement/1/app1']
+        )
+        treadmill.zkutils.create_many.assert_called_with(
+            mock.ANY,
+            [('/placement/2/app2', {'expires': 500, 'identity': None},
+              mock.ANY)]
+        )
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.create_many',
+                mock.Mock(return_value=True))
+    @mock.patch('treadmill.zkutils.delete_many',
+                mock.Mock(return_value=True))
     @mock.patch('time.time', mock.Mock(return_value=500))
     def test_reschedule_once(self):
         """Tests application placement."""
@@ -560,22 +622,27 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         cell.add_app(cell.partitions[None].allocation, app1)
         cell.add_app(cell.partitions[None].allocation, app2)
 
+        self.master.placement_version = 1000
+
         # At this point app1 is on server 1, app2 on server 2.
         self.master.reschedule()
-        treadmill.zkutils.put.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-            mock.call(mock.ANY, '/placement/2/app2',
-                      {'expires': 500, 'identity': None}, acl=mock.ANY),
-        ], any_order=True)
+        args, _kwargs = treadmill.zkutils.create_many.call_args
+        self.assertEqual(sorted(args[1]), [
+            ('/placement/1/app1', {'expires': 500, 'identity': None},
+             mock.ANY),
+            ('/placement/2/app2', {'expires': 500, 'identity': None},
+             mock.ANY),
+        ])
 
         srv_1.state = scheduler.State.down
         self.master.reschedule()
 
-        treadmill.zkutils.ensure_deleted.assert_has_calls([
-            mock.call(mock.ANY, '/placement/1/app1'),
-            mock.call(mock.ANY, '/scheduled/app1'),
-        ])
+        treadmill.zkutils.delete_many.assert_called_with(
+            mock.ANY, ['/placement/1/app1']
+        )
+        treadmill.zkutils.ensure_deleted.assert_called_once_with(
+            mock.ANY, '/scheduled/app1'
+        )
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
@@ -606,6 +673,80 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         self.assertEqual(alloc.rank_adjustment, 10)
         self.assertEqual(alloc.max_utilization, 1.1)
 
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_reload_allocations(self):
+        """Tests reloading changed allocations, reassigning apps."""
+        zk_content = {
+            'allocations': {
+                '.data': """
+                    - name: foo/dev
+                      rank: 100
+                      memory: 1G
+                      assignments:
+                      - pattern: foo.*
+                        priority: 10
+                    - name: bar/dev
+                      rank: 100
+                      memory: 1G
+                      assignments:
+                      - pattern: bar.*
+                        priority: 20
+                """
+            },
+            'scheduled': {
+                'foo.app#0000000001': {'memory': '1G'},
+                'foo.app#0000000002': {'memory': '1G', 'priority': 50},
+                'bar.app#0000000003': {'memory': '1G'},
+            },
+        }
+
+        self.make_mock_zk(zk_content)
+        self.master.load_allocations()
+        self.master.load_apps()
+
+        root = self.master.cell.partitions[None].allocation
+        foo = root.get_sub_alloc('foo').get_sub_alloc('dev')
+        bar = root.get_sub_alloc('bar').get_sub_alloc('dev')
+        apps = self.master.cell.apps
+        self.assertIs(apps['foo.app#0000000001'].allocation, foo)
+        self.assertEqual(apps['foo.app#0000000001'].priority, 10)
+        self.assertEqual(apps['foo.app#0000000002'].priority, 50)
+
+        zk_content['allocations']['.data'] = """
+            - name: foo/dev
+              rank: 100
+              memory: 2G
+              assignments:
+              - pattern: bar.*
+                priority: 30
+            - name: bar/dev
+              rank: 100
+              memory: 1G
+              assignments:
+              - pattern: foo.*
+                priority: 40
+        """
+        self.make_mock_zk(zk_content)
+        self.master.cell.backlog.update({None: False})
+        kazoo.client.KazooClient.get.reset_mock()
+
+        self.master.load_allocations()
+
+        self.assertEqual(foo.reserved[0], 2048)
+        self.assertNotIn(None, self.master.cell.backlog)
+        self.assertIs(apps['foo.app#0000000001'].allocation, bar)
+        self.assertEqual(apps['foo.app#0000000001'].priority, 40)
+        self.assertIs(apps['foo.app#0000000002'].allocation, bar)
+        self.assertEqual(apps['foo.app#0000000002'].priority, 50)
+        self.assertIs(apps['bar.app#0000000003'].allocation, foo)
+        self.assertEqual(apps['bar.app#0000000003'].priority, 30)
+
+        # App manifests are not reloaded.
+        for call in kazoo.client.KazooClient.get.call_args_list:
+            self.assertFalse(call[0][0].startswith('/scheduled'))
+
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
@@ -689,6 +830,10 @@ class MasterTest(mockzk.MockZookeeperTestCase):
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.create_many',
+                mock.Mock(return_value=True))
+    @mock.patch('treadmill.zkutils.delete_many',
+                mock.Mock(return_value=True))
     @mock.patch('time.time', mock.Mock(return_value=123.34))
     def test_restore_placement(self):
         """Tests application placement."""
@@ -923,6 +1068,7 @@ class MasterTest(mockzk.MockZookeeperTestCase):
         treadmill.zkutils.ensure_exists.reset_mock()
         self.master.reschedule()
         self.assertFalse(treadmill.zkutils.ensure_deleted.called)
+        self.assertFalse(treadmill.zkutils.delete_many.called)
         self.assertFalse(treadmill.zkutils.ensure_exists.called)
 
         # Restore identity
@@ -1066,7 +1212,7 @@ class MasterTest(mockzk.MockZookeeperTestCase):
                 break
 
         self.assertTrue(master.Master.load_allocations.called)
-        self.assertTrue(master.Master.load_apps.called)
+        self.assertFalse(master.Master.load_apps.called)
         master.Master.load_app.assert_has_calls([
             mock.call('xxx.app1#1234'),
             mock.call('xxx.app2#2345'),
@@ -1099,7 +1245,7 @@ class MasterTest(mockzk.MockZookeeperTestCase):
                 break
 
         self.assertTrue(master.Master.load_allocations.called)
-        self.assertTrue(master.Master.load_apps.called)
+        self.assertFalse(master.Master.load_apps.called)
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.create', mock.Mock())
@@ -1320,6 +1466,10 @@ class MasterTest(mockzk.MockZookeeperTestCase):
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
     @mock.patch('treadmill.zkutils.update', mock.Mock())
+    @mock.patch('treadmill.zkutils.create_many',
+                mock.Mock(return_value=True))
+    @mock.patch('treadmill.zkutils.delete_many',
+                mock.Mock(return_value=True))
     @mock.patch('time.time', mock.Mock())
     def test_check_reboot(self):
         """Tests reboot checks."""
@@ -1440,6 +1590,7 @@ class MasterTest(mockzk.MockZookeeperTestCase):
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children_async', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     def test_placement_integrity(self):
         """Tests placement integrity."""
@@ -1470,6 +1621,115 @@ class MasterTest(mockzk.MockZookeeperTestCase):
             '/placement/test2.xx.com/xxx.app1#1234'
         )
 
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children_async', mock.Mock())
+    @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
+    def test_placement_integrity_mirror(self):
+        """Tests placement integrity checked against the placement mirror."""
+        zk_content = {
+            'placement': {
+                'test1.xx.com': {
+                    'xxx.app1#1234': '',
+                },
+                'test2.xx.com': {
+                    'xxx.app2#2345': '',
+                },
+            },
+        }
+        self.make_mock_zk(zk_content)
+
+        for servername in ['test1.xx.com', 'test2.xx.com']:
+            self.master.servers[servername] = scheduler.Server(
+                servername, [10, 10, 10], valid_until=1000)
+
+        app1 = scheduler.Application(
+            'xxx.app1#1234', 100, [1, 1, 1], 'app1')
+        app2 = scheduler.Application(
+            'xxx.app2#2345', 100, [1, 1, 1], 'app2')
+        self.master.cell.apps[app1.name] = app1
+        self.master.cell.apps[app2.name] = app2
+        self.master.servers['test1.xx.com'].attach(app1)
+        self.master.servers['test2.xx.com'].attach(app2)
+
+        watches = dict()
+
+        def _children_watch(path):
+            """Register placement watch, invoke it with current children."""
+            def _register(func):
+                """Register the watch function."""
+                watches[path] = func
+                func(kazoo.client.KazooClient.get_children(path))
+                return func
+
+            return _register
+
+        zkclient = self.master.backend.zkclient
+        zkclient.ChildrenWatch = mock.Mock(side_effect=_children_watch)
+        with mock.patch.object(self.master, 'watch', mock.Mock()):
+            self.master.attach_watchers()
+
+        self.assertEqual(
+            self.master.placement_mirror,
+            {
+                'test1.xx.com': frozenset(['xxx.app1#1234']),
+                'test2.xx.com': frozenset(['xxx.app2#2345']),
+            }
+        )
+
+        # Mirror matches the model, ZooKeeper is not read.
+        kazoo.client.KazooClient.get_children_async.reset_mock()
+        self.master.check_placement_integrity()
+        kazoo.client.KazooClient.get_children_async.assert_not_called()
+
+        # Duplicate placement is verified for the affected server only.
+        zk_content['placement']['test2.xx.com']['xxx.app1#1234'] = ''
+        watches['/placement/test2.xx.com'](
+            ['xxx.app1#1234', 'xxx.app2#2345']
+        )
+        self.master.check_placement_integrity()
+
+        kazoo.client.KazooClient.get_children_async.assert_called_once_with(
+            '/placement/test2.xx.com'
+        )
+        treadmill.zkutils.ensure_deleted.assert_called_with(
+            mock.ANY,
+            '/placement/test2.xx.com/xxx.app1#1234'
+        )
+
+        # Watch of removed server is dropped.
+        del self.master.servers['test2.xx.com']
+        self.master.cell.apps[app2.name].server = None
+        self.master.check_placement_integrity()
+        self.assertNotIn('test2.xx.com', self.master.placement_mirror)
+        self.assertFalse(
+            watches['/placement/test2.xx.com'](['xxx.app2#2345'])
+        )
+
+    @mock.patch('treadmill.zkutils.put', mock.Mock())
+    @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
+    def test_save_state_reports(self):
+        """Tests saving full state reports followed by deltas."""
+        self.master.save_state_reports()
+
+        paths = [args[1] for args, _kwargs
+                 in treadmill.zkutils.put.call_args_list]
+        self.assertIn('/reports/servers', paths)
+        self.assertIn('/reports/apps', paths)
+        treadmill.zkutils.ensure_deleted.assert_any_call(
+            mock.ANY, '/reports.delta/apps'
+        )
+
+        treadmill.zkutils.put.reset_mock()
+        self.master.save_state_reports()
+
+        paths = [args[1] for args, _kwargs
+                 in treadmill.zkutils.put.call_args_list]
+        self.assertIn('/reports.delta/servers', paths)
+        self.assertIn('/reports.delta/apps', paths)
+        self.assertNotIn('/reports/apps', paths)
+
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock(
         return_value=('{}', None)))
     @mock.patch('kazoo.client.KazooClient.set', mock.Mock())
@@ -1496,6 +1756,8 @@ class MasterTest(mockzk.MockZookeeperTestCase):
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children_async', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_exists', mock.Mock())
     @mock.patch('treadmill.zkutils.ensure_deleted', mock.Mock())
     @mock.patch('treadmill.zkutils.put', mock.Mock())
@@ -1590,6 +1852,10 @@ class MasterTest(mockzk.MockZookeeperTestCase):
 
         )
         ro_master.load_model()
+        # Model is loaded from data prefetched with async calls.
+        self.assertFalse(kazoo.client.KazooClient.get.called)
+        self.assertFalse(kazoo.client.KazooClient.get_children.called)
+
         ro_master.init_schedule()
 
         self.assertFalse(treadmill.zkutils.ensure_deleted.called)
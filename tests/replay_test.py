@@ -0,0 +1,144 @@
+"""Unit test for treadmill.scheduler.replay.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import unittest
+
+import mock
+
+import treadmill
+from treadmill import scheduler
+from treadmill import zknamespace as z
+from treadmill.scheduler import backend as be
+from treadmill.scheduler import master
+from treadmill.scheduler import replay
+
+
+def _manifest():
+    """Return app manifest as stored in ZK."""
+    return {
+        'memory': '1G',
+        'disk': '1G',
+        'cpu': '100%',
+        'affinity': 'foo.bar',
+        'data_retention_timeout': None,
+    }
+
+
+class ReplayTest(unittest.TestCase):
+    """Tests scheduler trace recording and replay."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 3
+        self.old_exit_on_unhandled = treadmill.utils.exit_on_unhandled
+        treadmill.utils.exit_on_unhandled = mock.Mock(side_effect=lambda x: x)
+
+        self.zk = replay.ReplayBackend()
+        for path in [z.IDENTITY_GROUPS, z.PARTITIONS, z.PLACEMENT]:
+            self.zk.ensure_exists(path)
+        self.zk.put('/cell/pod:pod1', None)
+        self.zk.put('/buckets/pod:pod1', {'traits': None})
+        self.zk.put('/buckets/rack:1', {'traits': None, 'parent': 'pod:pod1'})
+        for servername in ['s1', 's2']:
+            self.zk.put(z.path.server(servername), {
+                'memory': '4G',
+                'disk': '4G',
+                'cpu': '400%',
+                'parent': 'rack:1',
+            })
+            self.zk.put(z.path.server_presence(servername), None)
+        for appname in ['foo.bar#1', 'foo.bar#2']:
+            self.zk.put(z.path.scheduled(appname), _manifest())
+
+    def tearDown(self):
+        treadmill.utils.exit_on_unhandled = self.old_exit_on_unhandled
+
+    def test_replay_backend(self):
+        """Test replay backend applies trace records."""
+        backend = replay.ReplayBackend()
+        backend.apply('listing', '/scheduled', ['foo.bar#1'])
+        backend.apply('object', '/scheduled/foo.bar#2', [{'x': 1}, 1000])
+
+        self.assertEqual(
+            backend.list('/scheduled'), ['foo.bar#1', 'foo.bar#2']
+        )
+        data, metadata = backend.get_with_metadata('/scheduled/foo.bar#2')
+        self.assertEqual(data, {'x': 1})
+        self.assertEqual(metadata.ctime, 1000)
+
+        backend.apply('exists', '/scheduled/foo.bar#1', False)
+        backend.apply('object', '/scheduled/foo.bar#2', None)
+        self.assertEqual(backend.list('/scheduled'), [])
+        self.assertFalse(backend.exists('/scheduled/foo.bar#2'))
+        self.assertIsNone(backend.get_default('/scheduled/foo.bar#2'))
+        with self.assertRaises(be.ObjectNotFoundError):
+            backend.get('/scheduled/foo.bar#2')
+
+    def test_trace_max_size(self):
+        """Test trace recording stops after the event exceeding max size."""
+        stream = io.StringIO()
+        trace = replay.Trace(stream, max_size=100)
+        trace.record('object', '/a', ['x' * 100, 1])
+        trace.record('event', '/b', [])
+        trace.record('object', '/c', None)
+        trace.record('event', '/d', [])
+
+        stream.seek(0)
+        self.assertEqual(
+            [record[1:] for record in replay.load_trace(stream)],
+            [('object', '/a', ['x' * 100, 1]), ('event', '/b', [])]
+        )
+
+    def test_record_replay(self):
+        """Test recorded trace replays to the same placement."""
+        stream = io.StringIO()
+        trace = replay.Trace(stream)
+        cell_master = master.Master(
+            replay.RecordingBackend(self.zk, trace), 'test-cell', trace=trace
+        )
+        cell_master.process_complete[z.SCHEDULED] = mock.Mock()
+
+        with mock.patch('time.time', mock.Mock(return_value=100)):
+            cell_master.load_model()
+            cell_master.init_schedule()
+
+        with mock.patch('time.time', mock.Mock(return_value=201)):
+            self.zk.put(z.path.scheduled('foo.bar#3'), _manifest())
+            cell_master.process((z.SCHEDULED, self.zk.list(z.SCHEDULED)))
+            cell_master.reschedule(incremental=True)
+
+        expected = {
+            appname: app.server
+            for appname, app in cell_master.cell.apps.items()
+        }
+
+        stream.seek(0)
+        cell_replay = replay.Replay('test-cell', replay.load_trace(stream))
+        stats = cell_replay.run()
+
+        self.assertEqual(
+            {
+                appname: app.server
+                for appname, app in cell_replay.master.cell.apps.items()
+            },
+            expected
+        )
+        self.assertEqual(stats.events, 1)
+        self.assertEqual(stats.runs, {'full': 1, 'incremental': 1})
+        self.assertEqual(stats.churn, {'scheduled': 3})
+        # Scheduler runs on the first tick after the event.
+        self.assertEqual(stats.pending, [0, 0, 1])
+        self.assertEqual(stats.simulated, 102)
+
+        stats = stats.to_dict()
+        self.assertEqual(stats['latency']['count'], 2)
+        self.assertEqual(stats['pending']['max'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
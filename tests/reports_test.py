@@ -235,6 +235,85 @@ class ReportsTest(unittest.TestCase):
         df = reports.explain_placement(self.cell, app1, mode='servers')
         self.assertEqual(len(df), 4)
 
+    @mock.patch('time.time', mock.Mock(return_value=500))
+    def test_explain_pending(self):
+        """Test batch explain of pending apps"""
+        default = (self.cell.partitions['_default'].allocation
+                   .get_sub_alloc('t1')
+                   .get_sub_alloc('t11')
+                   .get_sub_alloc('a1'))
+        traits = scheduler.Allocation([10, 10, 10], rank=100, traits=8)
+        (self.cell.partitions['part'].allocation
+         .get_sub_alloc('t2')
+         .add_sub_alloc('a8', traits))
+        nowhere = self.cell.partitions['nowhere'].allocation
+
+        apps = [
+            scheduler.Application('fits#1', 100, [1, 1, 1], 'fits'),
+            scheduler.Application('fits#2', 100, [1, 1, 1], 'fits'),
+            scheduler.Application('nowhere#1', 100, [1, 1, 1], 'nowhere'),
+            scheduler.Application('traits#1', 100, [1, 1, 1], 'traits'),
+            scheduler.Application('affinity#1', 100, [1, 1, 1], 'affinity',
+                                  affinity_limits={'rack': 0}),
+            scheduler.Application('lease#1', 100, [1, 1, 1], 'lease',
+                                  lease=3000),
+            scheduler.Application('cpu#1', 100, [1, 30, 1], 'cpu'),
+        ]
+        for app in apps:
+            if app.name.startswith('nowhere'):
+                nowhere.add(app)
+            elif app.name.startswith('traits'):
+                traits.add(app)
+            else:
+                default.add(app)
+
+        df = reports.explain_pending(self.cell, apps)
+        self.assertEqual(
+            df.to_dict(orient='records')[0],
+            {'name': 'fits#1', 'partition': 2, 'traits': 2, 'affinity': 2,
+             'state': 2, 'lifetime': 2, 'memory': 2, 'cpu': 2, 'disk': 2,
+             'reason': ''}
+        )
+        self.assertEqual(
+            df['reason'].tolist(),
+            ['', '', 'partition', 'traits', 'affinity', '', 'cpu']
+        )
+        # Only srv4 is valid until after the lease.
+        self.assertEqual(df['lifetime'].tolist()[5], 1)
+
+        # Affinity is counted for placed apps, app without allocation can be
+        # placed on any server but srv3.
+        app = scheduler.Application('fits#0', 100, [1, 1, 1], 'fits',
+                                    affinity_limits={'server': 1})
+        self.cell.members()['srv3'].put(app)
+        df = reports.explain_pending(self.cell, [app])
+        self.assertEqual(df['partition'].tolist(), [4])
+        self.assertEqual(df['affinity'].tolist(), [3])
+
+    def test_explain_checks(self):
+        """Test explain checks include a check per capacity dimension."""
+        # pylint: disable=protected-access
+        self.assertEqual(reports._explain_checks()[-3:],
+                         ['memory', 'cpu', 'disk'])
+        with mock.patch('treadmill.scheduler.DIMENSION_COUNT', 4):
+            self.assertEqual(reports._explain_checks()[-4:],
+                             ['memory', 'cpu', 'disk', 'dim3'])
+
+    def test_schedule_stats(self):
+        """Tests schedule stats report."""
+        self.cell.schedule()
+
+        df = reports.schedule_stats(self.cell)
+        self.assertEqual(list(df.columns), ['kind', 'name', 'value'])
+        self.assertEqual(
+            df[df.kind == 'run'].name.tolist(), ['timestamp', 'incremental']
+        )
+        self.assertIn('total', df[df.kind == 'phase'].name.tolist())
+
+        counters = df[df.kind == 'counter'].set_index('name').value
+        self.assertEqual(counters['apps'], 0)
+        self.assertEqual(counters['partitions'], 2)
+
     def test_serialize_dataframe(self):
         """Test serializing a dataframe."""
         df = pd.DataFrame([
@@ -255,6 +334,60 @@ class ReportsTest(unittest.TestCase):
             )
         )
 
+    def test_serialize_columns(self):
+        """Test serializing a dataframe in columnar format."""
+        df = pd.DataFrame([
+            ['foo', 1, 0.5, None],
+            ['bar', 2, 1.5, 'foo'],
+        ], columns=['a', 'b', 'c', 'd'])
+
+        result = reports.deserialize_dataframe(
+            reports.serialize_columns(df, 100)
+        )
+        self.assertEqual(result.to_dict('list'), df.to_dict('list'))
+        self.assertEqual(result.b.dtype, np.int64)
+        self.assertEqual(result.c.dtype, np.float64)
+
+        # Trait masks larger than int64 are kept as integers.
+        df = pd.DataFrame({'traits': [1 << 70, 3, None]}, dtype=object)
+        result = reports.deserialize_dataframe(
+            reports.serialize_columns(df, 100)
+        )
+        self.assertEqual(result.traits.tolist(), [1 << 70, 3, None])
+
+    def test_serialize_delta(self):
+        """Test serializing a dataframe as delta against the base."""
+        base = pd.DataFrame([
+            ['foo', 1, None],
+            ['bar', 2, 'x'],
+            ['baz', 3, 'y'],
+            ['qux', 4, 'z'],
+        ], columns=['a', 'b', 'c'])
+        df = pd.DataFrame([
+            ['bar', 2, 'x'],
+            ['foo', 1, None],
+            ['baz', 5, 'y'],
+            ['new', 6, 'y'],
+        ], columns=['a', 'b', 'c'])
+
+        data = reports.serialize_columns(base, 100)
+        delta = reports.serialize_delta(base, df, 100)
+        self.assertEqual(
+            reports.deserialize_dataframe(data, delta).to_dict('list'),
+            df.to_dict('list')
+        )
+
+        # Delta against different generation of the report is ignored.
+        data = reports.serialize_columns(base, 200)
+        self.assertEqual(
+            reports.deserialize_dataframe(data, delta).to_dict('list'),
+            base.to_dict('list')
+        )
+
+        # Delta is not worth it when most of the rows changed.
+        df.loc[1, 'b'] = 7
+        self.assertIsNone(reports.serialize_delta(base, df, 100))
+
     def test_deserialize_dataframe_bz2(self):
         """Test deserializing a compressed dataframe."""
         content = bz2.compress(
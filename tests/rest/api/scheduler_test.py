@@ -90,6 +90,24 @@ class ReportTest(unittest.TestCase):
         self.client.get('/scheduler/explain/proid.app#123')
         self.impl.explain.get.assert_called_with('proid.app#123')
 
+    def test_get_explain_pending(self):
+        """Test GET on /scheduler/explain path without instance."""
+        self.impl.explain.list.return_value = pd.DataFrame(
+            [['proid.app#123', 0, 'partition']],
+            columns=['name', 'partition', 'reason']
+        )
+        resp = self.client.get('/scheduler/explain?match=proid.*')
+        self.impl.explain.list.assert_called_with(
+            match='proid.*', partition=None
+        )
+        self.assertEqual(
+            json.loads(b''.join(resp.response).decode()),
+            {
+                'columns': ['name', 'partition', 'reason'],
+                'data': [['proid.app#123', 0, 'partition']],
+            }
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,15 @@
-"""Performance test for treadmill.scheduler.
+"""Performance benchmarks for treadmill.scheduler.
+
+Each scenario builds a synthetic cell, runs Cell.schedule() and reports
+time per call, time spent in each scheduler phase and peak memory.
+
+Usage::
+
+    python -m tests.scheduler_perf --output before.json
+    python -m tests.scheduler_perf --output after.json --baseline before.json
+
+Results are written as JSON, if baseline results are given, relative change
+of median times is printed for every step present in both.
 """
 
 from __future__ import absolute_import
@@ -6,101 +17,434 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import timeit
+import argparse
+import collections
+import contextlib
+import functools
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 # Disable W0611: Unused import
 import tests.treadmill_test_skip_windows  # pylint: disable=W0611
 
-# XXX: Test needs update to new Scheduler API
-# XXX: from treadmill import scheduler
-
-
-def schedule(sched):
-    """Helper function to run the scheduler."""
-
-    def _schedule():
-        """Run the scheduler, output some stats."""
-        new_placement = 0
-        evicted = 0
-        for event in sched.schedule():
-            if event.node:
-                new_placement = new_placement + 1
-            else:
-                evicted = evicted + 1
-
-        print('scheduled: ', new_placement, ', evicted: ', evicted)
-
-    interval = timeit.timeit(stmt=_schedule, number=1)
-    print('time  :', interval)
-
-
-# XXX: Test needs update to new Scheduler API
-# XXX:
-# XXX: def test_reschedule(nodes_count, app_count, attempts, affinity):
-# XXX:     """Add high priority apps on top of low priority with full capacity.
-# XXX:     """
-# XXX:     print('nodes: %s, apps: %s, attempts: %s' % (nodes_count,
-# XXX:                                                  app_count,
-# XXX:                                                  attempts))
-# XXX:     cell = scheduler.Cell(3)
-# XXX:     for idx in range(0, nodes_count):
-# XXX:         node = scheduler.Node('node' + str(idx), [48, 48, 48])
-# XXX:         cell.add_node(node)
-# XXX:
-# XXX:     alloc = scheduler.Allocation([10, 10, 10])
-# XXX:     cell.add_allocation('a1', alloc)
-# XXX:
-# XXX:     sched = scheduler.Scheduler(cell)
-# XXX:
-# XXX:     for attempt in range(0, attempts):
-# XXX:         for app_idx in range(0, app_count):
-# XXX:             prio = attempt * 5 + random.randint(0, 5)
-# XXX:             demand = [random.randint(1, 48),
-# XXX:                       random.randint(1, 48),
-# XXX:                       random.randint(1, 48)]
-# XXX:             name = 'app_%s.%s' % (attempt, app_idx)
-# XXX:             alloc.add(scheduler.Application(name, prio, demand,
-# XXX:                                             affinity=affinity(app_idx)))
-# XXX:
-# XXX:         schedule(sched)
-
-
-# XXX: Test needs update to new Scheduler API
-# XXX:
-# XXX: def test_affinity(nodes_count, app_count, affinity_limit):
-# XXX:     """Add more apps than nodes count to test affinity limit algo."""
-# XXX:     print('node: %s, apps: %s, affinity_limit %s' % (nodes_count,
-# XXX:                                                      app_count,
-# XXX:                                                      affinity_limit))
-# XXX:
-# XXX:     cell = scheduler.Cell(3)
-# XXX:     for idx in range(0, nodes_count):
-# XXX:         node = scheduler.Node('node' + str(idx), [48, 48, 48])
-# XXX:         cell.add_node(node)
-# XXX:
-# XXX:     alloc = scheduler.Allocation([10, 10, 10])
-# XXX:     cell.add_allocation('a1', alloc)
-# XXX:     for app_idx in range(0, app_count):
-# XXX:         name = '1.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='1'))
-# XXX:         name = '2.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='2'))
-# XXX:         name = '3.%s' % (app_idx)
-# XXX:         alloc.add(scheduler.Application(name, 0, [1, 1, 1],
-# XXX:                                         affinity_limit=affinity_limit,
-# XXX:                                         affinity='3'))
-# XXX:
-# XXX:     sched = scheduler.Scheduler(cell)
-# XXX:     schedule(sched)
+import six
+
+from treadmill import scheduler
+
+
+# Scheduler methods timed as phases, time is inclusive of nested phases.
+_PHASES = (
+    (scheduler.Cell, '_fix_invalid_placements'),
+    (scheduler.Cell, '_handle_inactive_servers'),
+    (scheduler.Cell, '_fix_invalid_identities'),
+    (scheduler.Cell, '_place_new_apps'),
+    (scheduler.Cell, 'schedule_alloc'),
+    (scheduler.Cell, '_record_rank_and_util'),
+    (scheduler.Cell, '_find_placements'),
+    (scheduler.Cell, '_find_evictions'),
+    (scheduler.Allocation, '_utilization_columns'),
+)
+
+_SERVERS_PER_RACK = 40
+_RACKS_PER_BUILDING = 10
+_SERVER_CAPACITY = [100, 100, 100]
+
+
+class PhaseTimer(object):
+    """Accumulates time spent in scheduler phases."""
+
+    def __init__(self):
+        self.totals = collections.defaultdict(float)
+
+    def _wrap(self, name, func):
+        """Wrap function, accumulating time spent in it."""
+
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            """Timed function call."""
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.totals[name] += time.time() - start
+
+        return _timed
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Time scheduler phases within the context."""
+        originals = []
+        for cls, name in _PHASES:
+            func = cls.__dict__[name]
+            originals.append((cls, name, func))
+            setattr(cls, name, self._wrap(name, func))
+        try:
+            yield
+        finally:
+            for cls, name, func in originals:
+                setattr(cls, name, func)
+
+    def reset(self):
+        """Reset and return accumulated totals."""
+        totals = dict(self.totals)
+        self.totals.clear()
+        return totals
+
+
+class Benchmark(object):
+    """Collects timings of the schedule steps of a scenario."""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.steps = collections.OrderedDict()
+        self.timer = PhaseTimer()
+
+    def schedule(self, step, incremental=False):
+        """Run and time single schedule call, record it under step."""
+        with self.timer.measure():
+            start = time.time()
+            placement = self.cell.schedule(incremental=incremental)
+            elapsed = time.time() - start
+
+        result = self.steps.setdefault(step, {
+            'times': [],
+            'phases': collections.defaultdict(float),
+            'placed': 0,
+            'evicted': 0,
+        })
+        result['times'].append(elapsed)
+        for name, total in six.iteritems(self.timer.reset()):
+            result['phases'][name] += total
+
+        for _app, before, _exp_before, after, _exp_after in placement:
+            if before == after:
+                continue
+            if after:
+                result['placed'] += 1
+            elif before:
+                result['evicted'] += 1
+
+    def results(self):
+        """Return summary of the recorded steps."""
+        summary = collections.OrderedDict()
+        for step, result in six.iteritems(self.steps):
+            times = sorted(result['times'])
+            summary[step] = {
+                'calls': len(times),
+                'min': times[0],
+                'median': times[len(times) // 2],
+                'max': times[-1],
+                'phases': {
+                    name: total / len(times)
+                    for name, total in six.iteritems(result['phases'])
+                },
+                'placed': result['placed'],
+                'evicted': result['evicted'],
+            }
+        return summary
+
+
+def make_cell(servers, seed, workers=1, partitions=0):
+    """Build cell with servers in a building/rack hierarchy.
+
+    If partitions is set, racks are assigned to partitions round robin.
+    """
+    rnd = random.Random(seed)
+    valid_until = time.time() + 30 * 24 * 60 * 60
+
+    cell = scheduler.Cell('top', workers=workers)
+    label = None
+    rack = None
+    building = None
+    for idx in range(servers):
+        if idx % (_SERVERS_PER_RACK * _RACKS_PER_BUILDING) == 0:
+            building = scheduler.Bucket('building:%s' % idx,
+                                        traits=0, level='building')
+            cell.add_node(building)
+        if idx % _SERVERS_PER_RACK == 0:
+            rack = scheduler.Bucket('rack:%s' % idx, traits=0, level='rack')
+            building.add_node(rack)
+            if partitions:
+                label = 'part%s' % (idx // _SERVERS_PER_RACK % partitions)
+
+        server = scheduler.Server('server%s' % idx, _SERVER_CAPACITY,
+                                  traits=0, valid_until=valid_until,
+                                  up_since=time.time() - rnd.randint(0, 3600),
+                                  label=label)
+        rack.add_node(server)
+
+    return cell
+
+
+def make_allocations(cell, count, seed, label=None):
+    """Create tenant allocations with sub-allocations."""
+    rnd = random.Random(seed)
+    root = cell.partitions[label].allocation
+    allocations = []
+    for idx in range(count):
+        tenant = root.get_sub_alloc('tenant%s' % (idx % 10))
+        alloc = tenant.get_sub_alloc('alloc%s' % idx)
+        reserved = rnd.randint(0, 100)
+        alloc.update([reserved] * len(_SERVER_CAPACITY),
+                     rnd.choice([50, 100, 150]), 0)
+        allocations.append(alloc)
+    return allocations
+
+
+def add_apps(cell, allocations, count, seed, prefix='app', priority=None,
+             demand=None, identity_groups=0):
+    """Add apps with mixed priorities, demand and affinity limits."""
+    rnd = random.Random(seed)
+    for idx in range(count):
+        name = '%s%s' % (prefix, idx)
+        affinity = '%s.%s' % (prefix, idx % (count // 10 + 1))
+        limits = None
+        if idx % 3 == 0:
+            limits = {'server': 1, 'rack': rnd.randint(2, 5)}
+
+        identity_group = None
+        if identity_groups:
+            identity_group = 'group%s' % (idx % identity_groups)
+
+        app = scheduler.Application(
+            name,
+            priority if priority is not None else rnd.randint(1, 100),
+            demand or [rnd.randint(1, 10)] * len(_SERVER_CAPACITY),
+            affinity=affinity,
+            affinity_limits=limits,
+            identity_group=identity_group,
+        )
+        cell.add_app(rnd.choice(allocations), app)
+
+
+def scenario_steady(args):
+    """Initial placement, then repeated schedule of unchanged cell."""
+    cell = make_cell(args.servers, args.seed, workers=args.workers)
+    allocations = make_allocations(cell, args.allocations, args.seed)
+    add_apps(cell, allocations, args.apps, args.seed)
+
+    bench = Benchmark(cell)
+    bench.schedule('initial')
+    for _idx in range(args.repeat):
+        bench.schedule('full')
+    for idx in range(args.repeat):
+        add_apps(cell, allocations, args.apps // 100 + 1, args.seed + idx,
+                 prefix='new%s.' % idx)
+        bench.schedule('incremental', incremental=True)
+    return bench
+
+
+def scenario_identity(args):
+    """Apps using identity groups."""
+    groups = args.apps // 100 + 1
+    cell = make_cell(args.servers, args.seed, workers=args.workers)
+    allocations = make_allocations(cell, args.allocations, args.seed)
+    for idx in range(groups):
+        cell.configure_identity_group('group%s' % idx, 120)
+    add_apps(cell, allocations, args.apps, args.seed, identity_groups=groups)
+
+    bench = Benchmark(cell)
+    bench.schedule('initial')
+    for _idx in range(args.repeat):
+        bench.schedule('full')
+    return bench
+
+
+def scenario_eviction(args):
+    """Full cell, waves of high priority apps evicting running apps."""
+    cell = make_cell(args.servers, args.seed, workers=args.workers)
+    allocations = make_allocations(cell, args.allocations, args.seed)
+    # Fill the cell with low priority apps.
+    capacity = args.servers * _SERVER_CAPACITY[0]
+    add_apps(cell, allocations, capacity // 5, args.seed, priority=1,
+             demand=[5] * len(_SERVER_CAPACITY))
+
+    bench = Benchmark(cell)
+    bench.schedule('initial')
+    for idx in range(args.repeat):
+        add_apps(cell, allocations, capacity // 100, args.seed + idx,
+                 prefix='wave%s.' % idx, priority=90 + idx,
+                 demand=[10] * len(_SERVER_CAPACITY))
+        bench.schedule('wave')
+    return bench
+
+
+def scenario_server_down(args):
+    """Servers going down, apps moved to remaining servers."""
+    cell = make_cell(args.servers, args.seed, workers=args.workers)
+    allocations = make_allocations(cell, args.allocations, args.seed)
+    add_apps(cell, allocations, args.apps, args.seed)
+
+    bench = Benchmark(cell)
+    bench.schedule('initial')
+
+    rnd = random.Random(args.seed)
+    servers = list(cell.members().values())
+    rnd.shuffle(servers)
+    down_count = max(1, len(servers) // 50)
+    for idx in range(args.repeat):
+        for server in servers[idx * down_count:(idx + 1) * down_count]:
+            server.state = scheduler.State.down
+        bench.schedule('down')
+    return bench
+
+
+def scenario_partitions(args):
+    """Apps spread over independent partitions."""
+    partitions = 4
+    cell = make_cell(args.servers, args.seed, workers=args.workers,
+                     partitions=partitions)
+    for idx in range(partitions):
+        allocations = make_allocations(cell, args.allocations // partitions,
+                                       args.seed + idx, 'part%s' % idx)
+        add_apps(cell, allocations, args.apps // partitions, args.seed + idx,
+                 prefix='part%s.app' % idx)
+
+    bench = Benchmark(cell)
+    bench.schedule('initial')
+    for _idx in range(args.repeat):
+        bench.schedule('full')
+    return bench
+
+
+SCENARIOS = collections.OrderedDict([
+    ('steady', scenario_steady),
+    ('identity', scenario_identity),
+    ('eviction', scenario_eviction),
+    ('server_down', scenario_server_down),
+    ('partitions', scenario_partitions),
+])
+
+
+def _peak_rss():
+    """Return peak resident set size of the process in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def run_scenario(name, args):
+    """Run scenario, return its results."""
+    if args.trace_memory and tracemalloc is not None:
+        tracemalloc.start()
+
+    bench = SCENARIOS[name](args)
+
+    result = {
+        'steps': bench.results(),
+        'apps': len(bench.cell.apps),
+        'peak_rss': _peak_rss(),
+    }
+    if args.trace_memory and tracemalloc is not None:
+        _current, result['peak_traced'] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return result
+
+
+def compare(results, baseline):
+    """Print relative change of median times against baseline."""
+    print('%-12s %-12s %10s %10s %8s' % (
+        'scenario', 'step', 'baseline', 'current', 'change'))
+    for scenario, result in six.iteritems(results['scenarios']):
+        base_result = baseline['scenarios'].get(scenario)
+        if not base_result:
+            continue
+        for step, stats in six.iteritems(result['steps']):
+            base_stats = base_result['steps'].get(step)
+            if not base_stats:
+                continue
+            before = base_stats['median']
+            after = stats['median']
+            change = (after - before) / before * 100 if before else 0.0
+            print('%-12s %-12s %10.4f %10.4f %+7.1f%%' % (
+                scenario, step, before, after, change))
+
+
+def report(scenario, result):
+    """Print scenario results."""
+    print('%s: %s apps, peak rss: %s' % (
+        scenario, result['apps'], result['peak_rss']))
+    for step, stats in six.iteritems(result['steps']):
+        print('  %-12s calls: %3d, median: %.4f, min: %.4f, max: %.4f, '
+              'placed: %s, evicted: %s' % (
+                  step, stats['calls'], stats['median'], stats['min'],
+                  stats['max'], stats['placed'], stats['evicted']))
+        for name, elapsed in sorted(six.iteritems(stats['phases']),
+                                    key=lambda item: -item[1]):
+            print('    %-26s %.4f' % (name, elapsed))
+
+
+def main(argv=None):
+    """Run scheduler benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--servers', type=int, default=1000)
+    parser.add_argument('--apps', type=int, default=10000)
+    parser.add_argument('--allocations', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of schedule calls per step.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes scheduling partitions in parallel.')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Trace peak memory, slows down the run.')
+    parser.add_argument('--output', help='Write JSON results to file.')
+    parser.add_argument('--baseline', help='Compare with JSON results.')
+    parser.add_argument('scenarios', nargs='*',
+                        help='Scenarios to run, all by default: %s.' %
+                        ', '.join(SCENARIOS))
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(sorted(unknown)))
+
+    scheduler.DIMENSION_COUNT = len(_SERVER_CAPACITY)
+    if args.workers > 1:
+        scheduler.start_workers(args.workers)
+
+    results = {
+        'python': platform.python_version(),
+        'params': {
+            'servers': args.servers,
+            'apps': args.apps,
+            'allocations': args.allocations,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'workers': args.workers,
+        },
+        'scenarios': collections.OrderedDict(),
+    }
+    for scenario in args.scenarios or SCENARIOS:
+        result = run_scenario(scenario, args)
+        results['scenarios'][scenario] = result
+        report(scenario, result)
+
+    if args.output:
+        with io.open(args.output, 'w') as f:
+            f.write(six.text_type(json.dumps(results, indent=4)))
+
+    if args.baseline:
+        with io.open(args.baseline) as f:
+            compare(results, json.load(f))
 
 
 if __name__ == '__main__':
-    pass
-# XXX:     test_reschedule(500, 1000, 5, affinity=lambda idx: None)
-# XXX:     test_reschedule(1000, 1000, 3, affinity=str)
-# XXX:     test_reschedule(1000, 3000, 3, affinity=lambda idx: str(idx % 5))
-# XXX:     test_affinity(500, 1000, 1)
+    main()
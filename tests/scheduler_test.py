@@ -6,6 +6,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import copy
+import pickle
+import random
 import time
 import unittest
 import sys
@@ -44,6 +47,89 @@ def app_list(count, name, *args, **kwargs):
             for idx in range(0, count)]
 
 
+def _random_cell(seed, server_count=60, app_count=400,
+                 partition_affinity=False, **kwargs):
+    """Build random cell, return (cell, servers, apps, rnd).
+
+    Cells built with the same seed are identical, including the app global
+    order, so the placements can be compared across scheduler engines. If
+    partition_affinity is set, apps in different partitions do not share
+    affinity.
+    """
+    rnd = random.Random(seed)
+    cell = scheduler.Cell('top', **kwargs)
+    racks = []
+    for bld_idx in range(max(1, server_count // 40)):
+        building = scheduler.Bucket('bld%d' % bld_idx, level='building')
+        cell.add_node(building)
+        for rack_idx in range(4):
+            rack = scheduler.Bucket('rack%d.%d' % (bld_idx, rack_idx),
+                                    level='rack')
+            building.add_node(rack)
+            racks.append(rack)
+        building.set_affinity_strategy('aff0', scheduler.PackStrategy)
+
+    servers = []
+    for idx in range(server_count):
+        server = scheduler.Server(
+            'srv%d' % idx, [rnd.randint(20, 100)] * 2,
+            valid_until=time.time() + rnd.randint(0, 10 ** 6),
+            label=rnd.choice([None, None, 'xx']),
+            traits=rnd.choice([0, 0, 2, 6])
+        )
+        rnd.choice(racks).add_node(server)
+        servers.append(server)
+
+    apps = []
+    for idx in range(app_count):
+        label = rnd.choice([None, None, 'xx'])
+        alloc = cell.partitions[label].allocation
+        if rnd.random() < 0.5:
+            alloc = alloc.get_sub_alloc('t%d' % rnd.randint(0, 3))
+            alloc.update([rnd.randint(0, 50)] * 2, 100, 0)
+            alloc.set_traits(rnd.choice([0, 0, 2]))
+        affinity = 'aff%d' % (idx % 20)
+        if partition_affinity:
+            affinity += '.%s' % label
+        app = scheduler.Application(
+            'app%d' % idx, rnd.randint(0, 100),
+            [rnd.randint(1, 20), rnd.randint(1, 20)],
+            affinity,
+            affinity_limits=rnd.choice(
+                [None, {'server': 1}, {'rack': 2, 'server': 1}]
+            ),
+            lease=rnd.choice([0, 0, 3600, 10 ** 5])
+        )
+        app.global_order = idx
+        cell.add_app(alloc, app)
+        apps.append(app)
+
+    return cell, servers, apps, rnd
+
+
+def _schedule_rounds(seed, rounds=4, **kwargs):
+    """Schedule random cell several times, mutating it between the rounds.
+
+    Returns list of app placements and server free capacity after each round.
+    """
+    cell, servers, apps, rnd = _random_cell(seed, **kwargs)
+    result = []
+    for _round in range(rounds):
+        cell.schedule()
+        result.append([app.server for app in apps])
+        result.append([tuple(server.free_capacity) for server in servers])
+
+        for server in rnd.sample(servers, 5):
+            server.state = rnd.choice(list(scheduler.State))
+        for app in rnd.sample(apps, 5):
+            cell.remove_app(app.name)
+        server = rnd.choice(servers)
+        if server.parent is not None and not server.apps:
+            server.parent.remove_node(server)
+
+    return result
+
+
 class OpsTest(unittest.TestCase):
     """Test comparison operators."""
     # Disable warning accessing protected members.
@@ -284,6 +370,73 @@ class AllocationTest(unittest.TestCase):
         self.assertEqual('p1', queue[1][-1].name)
         self.assertEqual('r2', queue[2][-1].name)
 
+    def test_queue_cache(self):
+        """Test queue order is maintained as apps are added and removed."""
+        # Disable warning accessing protected members.
+        #
+        # pylint: disable=W0212
+        alloc = scheduler.Allocation([10, 10])
+        apps = [
+            scheduler.Application('app1', 5, [1, 1], 'app1'),
+            scheduler.Application('app2', 3, [2, 2], 'app1'),
+            scheduler.Application('app3', 4, [3, 3], 'app1'),
+        ]
+        for order, app in zip([1, 3, 2], apps):
+            app.global_order = order
+
+        alloc.add(apps[0])
+        alloc.add(apps[1])
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['app1', 'app2'], [item[-1].name for item in queue])
+
+        alloc.add(apps[2])
+        alloc.remove('app1')
+        self.assertIsNotNone(alloc._queue)
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['app3', 'app2'], [item[-1].name for item in queue])
+        self.assertEqual((3 - 10) / (10 + 20), queue[0][2])
+        self.assertEqual((5 - 10) / (10 + 20), queue[1][2])
+
+        alloc.apps['app2'].priority = 10
+        self.assertIsNone(alloc._queue)
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['app2', 'app3'], [item[-1].name for item in queue])
+
+        alloc.apps['app2'].priority = 4
+        alloc.apps['app2'].server = 'abc'
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['app2', 'app3'], [item[-1].name for item in queue])
+
+        alloc.apps['app2'].server = None
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['app3', 'app2'], [item[-1].name for item in queue])
+
+    def test_zero_demand_merge(self):
+        """Test merging queues which are not in sorted order."""
+        alloc = scheduler.Allocation()
+
+        sub_alloc_a = scheduler.Allocation()
+        alloc.add_sub_alloc('a', sub_alloc_a)
+        app_a1 = scheduler.Application('a1', 10, [0, 0], 'app1')
+        app_a1.global_order = 2
+        sub_alloc_a.add(app_a1)
+        app_a2 = scheduler.Application('a2', 5, [0, 0], 'app1')
+        app_a2.global_order = 3
+        app_a2.server = 'abc'
+        sub_alloc_a.add(app_a2)
+
+        sub_alloc_b = scheduler.Allocation()
+        alloc.add_sub_alloc('b', sub_alloc_b)
+        app_b1 = scheduler.Application('b1', 1, [0, 0], 'app1')
+        app_b1.global_order = 1
+        sub_alloc_b.add(app_b1)
+
+        # Pending a1 is ahead of running a2 with the same utilization, so
+        # the merge picks b1 first, as heapq.merge would.
+        queue = list(alloc.utilization_queue([20., 20.]))
+        self.assertEqual(['b1', 'a1', 'a2'],
+                         [item[-1].name for item in queue])
+
     def test_visitor(self):
         """Test queue visitor"""
         alloc = scheduler.Allocation()
@@ -701,6 +854,19 @@ class NodeTest(unittest.TestCase):
         self.assertTrue(scheduler._all_isclose(left.size(None), [2, 2]))
         self.assertTrue(scheduler._all_isclose(top.size(None), [4, 4]))
 
+        # Cached sizes are updated as servers are removed and added.
+        left.remove_node(srv_b)
+        self.assertTrue(scheduler._all_isclose(left.size(None), [1, 1]))
+        self.assertTrue(scheduler._all_isclose(top.size(None), [3, 3]))
+
+        left.add_node(srv_b)
+        right.add_node(scheduler.Server('c', [2, 2], label='xx'))
+        self.assertTrue(scheduler._all_isclose(right.size(None), [2, 2]))
+        self.assertTrue(scheduler._all_isclose(top.size(None), [4, 4]))
+        self.assertTrue(scheduler._all_isclose(top.size('xx'), [2, 2]))
+        right.remove_node_by_name('c')
+        self.assertTrue(scheduler._all_isclose(top.size('xx'), [0, 0]))
+
         self.assertEqual(
             {
                 'a': srv_a,
@@ -768,6 +934,37 @@ class CellTest(unittest.TestCase):
 
         cell.schedule()
 
+    def test_members(self):
+        """Test cell members index follows the topology."""
+        cell = scheduler.Cell('top')
+        left = scheduler.Bucket('left', traits=0)
+        right = scheduler.Bucket('right', traits=0)
+        srv_a = scheduler.Server('a', [10, 10], valid_until=500)
+        srv_b = scheduler.Server('b', [10, 10], valid_until=500)
+        srv_c = scheduler.Server('c', [10, 10], valid_until=500)
+
+        left.add_node(srv_a)
+        cell.add_node(left)
+        cell.add_node(right)
+        left.add_node(srv_b)
+        right.add_node(srv_c)
+        self.assertEqual({'a': srv_a, 'b': srv_b, 'c': srv_c},
+                         dict(cell.members()))
+
+        left.remove_node_by_name('a')
+        self.assertEqual({'b': srv_b, 'c': srv_c}, dict(cell.members()))
+
+        cell.remove_node_by_name('right')
+        self.assertEqual({'b': srv_b}, dict(cell.members()))
+
+        right.add_node(srv_a)
+        cell.add_node(right)
+        self.assertEqual({'a': srv_a, 'b': srv_b, 'c': srv_c},
+                         dict(cell.members()))
+
+        cell.reset_children()
+        self.assertEqual({}, dict(cell.members()))
+
     def test_labels(self):
         """Test scheduling with labels."""
         cell = scheduler.Cell('top')
@@ -1140,10 +1337,48 @@ class CellTest(unittest.TestCase):
 
         cell.schedule()
 
-        # TODO: need to implement serialization.
-        #
-        # data = scheduler.dumps(cell)
-        # cell1 = scheduler.loads(data)
+        data = scheduler.dumps(cell)
+        cell1 = scheduler.loads(data)
+
+        self.assertEqual(
+            {name: app.server for name, app in six.iteritems(cell.apps)},
+            {name: app.server for name, app in six.iteritems(cell1.apps)}
+        )
+        self.assertEqual(sorted(cell1.members()), ['a', 'b', 'y', 'z'])
+        self.assertIs(cell1.members()['a'].parent,
+                      cell1.children_by_name['left'])
+        self.assertEqual(cell1.members()['a'].level, 'server')
+        self.assertEqual(cell1.children_by_name['left'].level, 'rack')
+        np.testing.assert_array_equal(
+            cell1.members()['a'].free_capacity,
+            cell.members()['a'].free_capacity
+        )
+        self.assertEqual(cell1.apps[apps[0].name].affinity.limits['rack'], 1)
+        self.assertEqual(
+            cell1.apps[apps[0].name].affinity.limits['cell'], float('inf')
+        )
+
+        # Restored cell continues scheduling and reboot bookkeeping.
+        app_copy = copy.copy(apps[4])
+        cell.add_app(cell.partitions[None].allocation, apps[4])
+        cell1.add_app(cell1.partitions[None].allocation, app_copy)
+        cell.schedule()
+        cell1.schedule()
+        self.assertEqual(
+            {name: app.server for name, app in six.iteritems(cell.apps)},
+            {name: app.server for name, app in six.iteritems(cell1.apps)}
+        )
+
+        # pylint: disable=W0212
+        now = time.time() + 7 * 24 * 60 * 60
+        cell.partitions[None].tick(now)
+        cell1.partitions[None].tick(now)
+        self.assertEqual(
+            [bucket.timestamp
+             for bucket in cell.partitions[None]._reboot_buckets],
+            [bucket.timestamp
+             for bucket in cell1.partitions[None]._reboot_buckets]
+        )
 
     def test_identity(self):
         """Tests scheduling apps with identity."""
@@ -1272,6 +1507,113 @@ class CellTest(unittest.TestCase):
         self.assertEqual(len([app for app in large_apps if app.evicted]), 1)
         self.assertEqual(len([app for app in large_apps if app.server]), 9)
 
+    def test_schedule_stats(self):
+        """Tests phase timings and counters collected by schedule."""
+        cell = scheduler.Cell('top')
+        for idx in range(0, 2):
+            server = scheduler.Server(str(idx), [10, 10], traits=0,
+                                      valid_until=time.time() + 1000)
+            cell.add_node(server)
+
+        large_apps = app_list(2, 'large', 50, [8, 8])
+        for app in large_apps:
+            cell.add_app(cell.partitions[None].allocation, app)
+
+        cell.schedule()
+        stats = cell.stats
+        self.assertFalse(stats.incremental)
+        self.assertEqual(stats.counters['apps'], 2)
+        self.assertEqual(stats.counters['placed'], 2)
+        self.assertEqual(stats.counters['evicted'], 0)
+        self.assertEqual(stats.counters['partitions'], 1)
+        self.assertEqual(stats.counters['queued'], 2)
+        for phase in ('snapshot', 'fixups', 'inactive_servers', 'new_apps',
+                      'partitions', 'queue', 'placement', 'diff', 'total'):
+            self.assertIn(phase, stats.phases)
+            self.assertGreaterEqual(stats.phases[phase], 0)
+
+        # Higher priority app forces eviction of one of the large apps.
+        medium_apps = app_list(1, 'medium', 70, [5, 5])
+        for app in medium_apps:
+            cell.add_app(cell.partitions[None].allocation, app)
+
+        cell.schedule(incremental=True)
+        stats = cell.stats
+        self.assertTrue(stats.incremental)
+        self.assertEqual(stats.counters['placed'], 1)
+        self.assertEqual(stats.counters['evicted'], 1)
+        self.assertEqual(stats.counters['evictions'], 1)
+        self.assertGreaterEqual(stats.counters['eviction_scanned'], 1)
+        self.assertIn('evictions', stats.phases)
+        self.assertGreaterEqual(stats.phases['evictions'], 0)
+        self.assertEqual(
+            set(stats.to_dict()),
+            set(['timestamp', 'incremental', 'phases', 'counters'])
+        )
+
+    def test_schedule_no_stats(self):
+        """Tests that stats are not collected if disabled."""
+        cell = scheduler.Cell('top', stats=False)
+        server = scheduler.Server('1', [10, 10], traits=0,
+                                  valid_until=time.time() + 1000)
+        cell.add_node(server)
+
+        apps = app_list(2, 'app', 50, [4, 4])
+        for app in apps:
+            cell.add_app(cell.partitions[None].allocation, app)
+
+        cell.schedule()
+        self.assertEqual(len([app for app in apps if app.server]), 2)
+        self.assertEqual(cell.stats.to_dict()['phases'], {})
+        self.assertEqual(cell.stats.to_dict()['counters'], {})
+
+    def test_eviction_candidates(self):
+        """Tests that only apps freeing enough capacity are evicted."""
+        cell = scheduler.Cell('top')
+        srv1 = scheduler.Server('srv1', [10, 10], traits=0,
+                                valid_until=time.time() + 1000)
+        srv2 = scheduler.Server('srv2', [10, 10], traits=0,
+                                valid_until=time.time() + 1000)
+        cell.add_node(srv1)
+        cell.add_node(srv2)
+
+        small = scheduler.Application('small', 20, [1, 1], 'small')
+        large1 = scheduler.Application('large1', 50, [8, 8], 'large1')
+        large2 = scheduler.Application('large2', 30, [8, 8], 'large2')
+        for app in (small, large1, large2):
+            cell.add_app(cell.partitions[None].allocation, app)
+
+        self.assertTrue(srv1.put(small))
+        self.assertTrue(srv1.put(large1))
+        self.assertTrue(srv2.put(large2))
+        cell.schedule()
+
+        # Evicting small app from srv1 does not free enough capacity, large2
+        # is the lowest priority app to evict, small app is not touched.
+        medium = scheduler.Application('medium', 90, [6, 6], 'medium')
+        cell.add_app(cell.partitions[None].allocation, medium)
+        cell.schedule()
+
+        self.assertEqual(medium.server, 'srv2')
+        self.assertEqual(small.server, 'srv1')
+        self.assertFalse(small.evicted)
+        self.assertEqual(large1.server, 'srv1')
+        self.assertIsNone(large2.server)
+        self.assertTrue(large2.evicted)
+        self.assertEqual(cell.stats.counters['evictions'], 1)
+
+        # Only large1 needs to be evicted from srv1, even though small app
+        # has lower priority.
+        urgent = scheduler.Application('urgent', 95, [5, 5], 'urgent')
+        cell.add_app(cell.partitions[None].allocation, urgent)
+        cell.schedule()
+
+        self.assertEqual(urgent.server, 'srv1')
+        self.assertEqual(small.server, 'srv1')
+        self.assertFalse(small.evicted)
+        self.assertIsNone(large1.server)
+        self.assertEqual(cell.stats.counters['evictions'], 1)
+
     @mock.patch('time.time', mock.Mock(return_value=100))
     def test_eviction_server_down(self):
         """Tests app restore."""
@@ -1481,6 +1823,419 @@ class CellTest(unittest.TestCase):
             self.assertIsNone(app.server)
 
 
+class CapacityMatrixTest(unittest.TestCase):
+    """treadmill.scheduler.CapacityMatrix tests."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 2
+        super(CapacityMatrixTest, self).setUp()
+
+    def test_attach_detach(self):
+        """Test nodes capacity is stored in the matrix once attached."""
+        cell = scheduler.Cell('top', capacity_matrix=True)
+        matrix = cell.matrix
+
+        bucket = scheduler.Bucket('bucket')
+        srv1 = scheduler.Server('n1', [10, 5], valid_until=500)
+        srv2 = scheduler.Server('n2', [5, 10], valid_until=500)
+        bucket.add_node(srv1)
+        self.assertIsNone(srv1.matrix)
+
+        cell.add_node(bucket)
+        bucket.add_node(srv2)
+        self.assertIs(matrix, srv1.matrix)
+        self.assertIs(matrix, srv2.matrix)
+        self.assertEqual(4, len(matrix))
+        self.assertEqual(bucket.node_id, matrix.parent[srv1.node_id])
+        self.assertTrue(np.array_equal(matrix.free[bucket.node_id],
+                                       np.array([10., 10.])))
+
+        # Server capacity is a view into the matrix.
+        apps = app_list(2, 'app', 50, [1, 2])
+        self.assertTrue(srv1.put(apps[0]))
+        self.assertTrue(np.array_equal(matrix.free[srv1.node_id],
+                                       np.array([9., 3.])))
+
+        cell.remove_node(bucket)
+        self.assertIsNone(srv1.matrix)
+        self.assertIsNone(bucket.matrix)
+        self.assertEqual(1, len(matrix))
+        self.assertTrue(np.array_equal(srv1.free_capacity,
+                                       np.array([9., 3.])))
+        self.assertTrue(np.array_equal(bucket.free_capacity,
+                                       np.array([9., 10.])))
+
+        # Released rows are reused.
+        cell.add_node(bucket)
+        self.assertEqual(4, len(matrix.nodes))
+        self.assertTrue(np.array_equal(srv1.free_capacity,
+                                       np.array([9., 3.])))
+
+    def test_grow(self):
+        """Test matrix grows, preserving node capacity."""
+        cell = scheduler.Cell('top', capacity_matrix=True)
+        bucket = scheduler.Bucket('bucket')
+        cell.add_node(bucket)
+        for idx in range(200):
+            bucket.add_node(
+                scheduler.Server('n%d' % idx, [idx, idx], valid_until=500)
+            )
+
+        self.assertTrue(np.array_equal(
+            cell.free_capacity, np.array([199., 199.])
+        ))
+        self.assertTrue(np.array_equal(
+            bucket.children_by_name['n10'].free_capacity,
+            np.array([10., 10.])
+        ))
+        self.assertTrue(np.array_equal(
+            cell.size(None), np.array([19900., 19900.])
+        ))
+
+    def test_bucket_capacity(self):
+        """Test bucket capacity is adjusted down, ignoring servers not up."""
+        cell = scheduler.Cell('top', capacity_matrix=True)
+        bucket = scheduler.Bucket('b')
+        cell.add_node(bucket)
+
+        srv1 = scheduler.Server('n1', [10, 5], valid_until=500)
+        srv2 = scheduler.Server('n2', [5, 10], valid_until=500)
+        bucket.add_node(srv1)
+        bucket.add_node(srv2)
+        self.assertTrue(np.array_equal(cell.free_capacity,
+                                       np.array([10., 10.])))
+
+        srv1.state = scheduler.State.down
+        bucket.adjust_capacity_down()
+        self.assertTrue(np.array_equal(bucket.free_capacity,
+                                       np.array([5., 10.])))
+        self.assertTrue(np.array_equal(cell.free_capacity,
+                                       np.array([5., 10.])))
+
+    def test_size(self):
+        """Test size matches recursive size, including missing labels."""
+        for capacity_matrix in (False, True):
+            cell = scheduler.Cell('top', capacity_matrix=capacity_matrix)
+            left = scheduler.Bucket('left')
+            right = scheduler.Bucket('right')
+            cell.add_node(left)
+            cell.add_node(right)
+            cell.add_node(scheduler.Bucket('empty'))
+            left.add_node(scheduler.Server('a', [1, 2], label='xx'))
+            left.add_node(scheduler.Server('b', [3, 4]))
+            right.add_node(scheduler.Server('c', [5, 6], label='xx'))
+
+            eps = np.finfo(float).eps
+            self.assertTrue(np.array_equal(cell.size('xx'),
+                                           np.array([6., 8.])))
+            self.assertTrue(np.array_equal(cell.size(None),
+                                           np.array([3., 4.])))
+            self.assertTrue(np.array_equal(cell.size('yy'),
+                                           np.array([eps, eps])))
+
+    def test_feasible(self):
+        """Test feasible servers mask."""
+        cell = scheduler.Cell('top', capacity_matrix=True)
+        bucket = scheduler.Bucket('bucket')
+        cell.add_node(bucket)
+
+        now = time.time()
+        srv_a = scheduler.Server('a', [10, 10], valid_until=now + 1000)
+        srv_b = scheduler.Server('b', [10, 10], valid_until=now + 1000,
+                                 traits=_traits2int(['b']))
+        srv_c = scheduler.Server('c', [10, 10], valid_until=now + 10)
+        srv_d = scheduler.Server('d', [1, 10], valid_until=now + 1000)
+        srv_x = scheduler.Server('x', [10, 10], valid_until=now + 1000,
+                                 label='xx')
+        for server in [srv_a, srv_b, srv_c, srv_d]:
+            bucket.add_node(server)
+        bucket_xx = scheduler.Bucket('bucket_xx')
+        cell.add_node(bucket_xx)
+        bucket_xx.add_node(srv_x)
+
+        def _feasible(app):
+            feasible = cell.matrix.feasible(app)
+            return set([node.name for node in cell.matrix.nodes
+                        if feasible[node.node_id]])
+
+        app = scheduler.Application('app', 10, [2, 2], 'app', lease=100)
+        cell.partitions[None].allocation.add(app)
+        # Buckets with feasible servers are included.
+        self.assertEqual(set(['a', 'b', 'bucket', 'top']), _feasible(app))
+
+        srv_a.state = scheduler.State.frozen
+        app.lease = 0
+        self.assertEqual(set(['b', 'c', 'bucket', 'top']), _feasible(app))
+
+        cell.partitions[None].allocation.set_traits(_traits2int(['b']))
+        self.assertEqual(set(['b', 'bucket', 'top']), _feasible(app))
+
+        app = scheduler.Application('app_xx', 10, [2, 2], 'app')
+        cell.partitions['xx'].allocation.add(app)
+        self.assertEqual(set(['x', 'bucket_xx', 'top']), _feasible(app))
+
+        app = scheduler.Application('app_yy', 10, [2, 2], 'app')
+        cell.partitions['yy'].allocation.add(app)
+        self.assertEqual(set(), _feasible(app))
+
+    def test_reject_all(self):
+        """Test strategy rejection matches trying every node."""
+        bucket = scheduler.Bucket('bucket')
+        for idx in range(5):
+            bucket.add_node(
+                scheduler.Server('n%d' % idx, [10, 10], valid_until=500)
+            )
+
+        for strategy_t in [scheduler.SpreadStrategy,
+                           scheduler.PackStrategy]:
+            for start in range(5):
+                strategy = strategy_t(bucket)
+                strategy.current_idx = start
+                # pylint: disable=bad-super-call
+                super(strategy_t, strategy).reject_all()
+                expected = strategy.current_idx
+
+                strategy.current_idx = start
+                strategy.reject_all()
+                self.assertEqual(expected, strategy.current_idx)
+
+    def test_failed_put_keeps_strategy(self):
+        """Test failed isolated placement does not advance the strategy."""
+        for capacity_matrix in (False, True):
+            cell = scheduler.Cell('top', capacity_matrix=capacity_matrix,
+                                  workers=2)
+            bucket = scheduler.Bucket('bucket')
+            cell.add_node(bucket)
+            for idx in range(5):
+                bucket.add_node(
+                    scheduler.Server('n%d' % idx, [10, 10], valid_until=500)
+                )
+
+            for strategy_t in [scheduler.SpreadStrategy,
+                               scheduler.PackStrategy]:
+                bucket.set_affinity_strategy('app', strategy_t)
+                strategy = bucket.get_affinity_strategy('app')
+                for start in range(5):
+                    strategy.current_idx = start
+                    app = scheduler.Application('app', 10, [5, 5], 'app',
+                                                lease=1000)
+                    self.assertFalse(cell.put(app))
+                    self.assertEqual(start, strategy.current_idx)
+
+    def test_same_placement(self):
+        """Test matrix backed cell produces same placements."""
+        for seed in range(5):
+            self.assertEqual(
+                _schedule_rounds(seed),
+                _schedule_rounds(seed, capacity_matrix=True)
+            )
+
+
+class ParallelScheduleTest(unittest.TestCase):
+    """treadmill.scheduler.Cell partition-parallel schedule tests."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 2
+        scheduler.start_workers(2)
+        super(ParallelScheduleTest, self).setUp()
+
+    def test_partition_groups(self):
+        """Test partitions sharing affinity are scheduled together."""
+        cell, _servers, _apps, _rnd = _random_cell(0)
+        self.assertEqual(
+            cell._partition_groups([None, 'xx']),  # pylint: disable=W0212
+            [[None, 'xx']]
+        )
+
+        cell, _servers, _apps, _rnd = _random_cell(0, partition_affinity=True)
+        self.assertEqual(
+            cell._partition_groups([None, 'xx']),  # pylint: disable=W0212
+            [[None], ['xx']]
+        )
+
+    def test_same_placement(self):
+        """Test parallel schedule produces same placements as serial."""
+        for seed in range(3):
+            with mock.patch('treadmill.scheduler.Cell._partition_groups',
+                            side_effect=lambda labels: [labels]):
+                expected = _schedule_rounds(seed, partition_affinity=True,
+                                            workers=2)
+            self.assertEqual(
+                expected,
+                _schedule_rounds(seed, partition_affinity=True, workers=2)
+            )
+
+        cell, _servers, _apps, _rnd = _random_cell(
+            0, partition_affinity=True, workers=2
+        )
+        cell.schedule()
+        self.assertEqual(cell.stats.counters['workers'], 2)
+
+        # Worker processes are kept across the runs.
+        pool = scheduler.start_workers(2)
+        cell.invalidate()
+        cell.schedule()
+        self.assertIs(pool, scheduler.start_workers(2))
+
+    @mock.patch('treadmill.scheduler._WORKER_POOL', None)
+    def test_no_workers(self):
+        """Test parallel schedule fails if workers are not started."""
+        cell, _servers, _apps, _rnd = _random_cell(
+            0, partition_affinity=True, workers=2
+        )
+        with self.assertRaises(RuntimeError):
+            cell.schedule()
+
+    def test_group_state(self):
+        """Test only the group partitions and their apps are sent."""
+        cell, _servers, apps, _rnd = _random_cell(0, partition_affinity=True)
+        cell.schedule()
+        servers = cell.members()
+        before = {
+            name: (dict(server.apps), dict(server.affinity_counters))
+            for name, server in six.iteritems(servers)
+        }
+
+        with cell._group_state(['xx']):  # pylint: disable=W0212
+            self.assertEqual(list(cell.partitions), ['xx'])
+            self.assertEqual(
+                set(cell.apps),
+                set(app.name for app in
+                    cell.partitions['xx'].allocation.all_apps())
+            )
+            for server in six.itervalues(servers):
+                if 'xx' not in server.labels:
+                    self.assertEqual(server.apps, {})
+                    self.assertEqual(server.affinity_counters, {})
+
+        self.assertEqual(len(cell.apps), len(apps))
+        self.assertEqual(set(cell.partitions), set([None, 'xx']))
+        self.assertEqual(
+            before,
+            {
+                name: (dict(server.apps), dict(server.affinity_counters))
+                for name, server in six.iteritems(servers)
+            }
+        )
+
+
+class IncrementalScheduleTest(unittest.TestCase):
+    """treadmill.scheduler.Cell incremental schedule tests."""
+
+    def setUp(self):
+        scheduler.DIMENSION_COUNT = 2
+        super(IncrementalScheduleTest, self).setUp()
+
+        valid_until = time.time() + 1000
+        self.cell = scheduler.Cell('top')
+        self.bucket = scheduler.Bucket('bucket', traits=0)
+        self.cell.add_node(self.bucket)
+        self.servers = []
+        for idx in range(2):
+            server = scheduler.Server('s%d' % idx, [10, 10],
+                                      valid_until=valid_until)
+            self.bucket.add_node(server)
+            self.servers.append(server)
+        server = scheduler.Server('x', [10, 10], label='xx',
+                                  valid_until=valid_until)
+        self.bucket.add_node(server)
+        self.servers.append(server)
+
+        alloc = self.cell.partitions[None].allocation
+        for idx in range(4):
+            self.cell.add_app(
+                alloc, scheduler.Application('app%d' % idx, 10, [4, 4], 'app')
+            )
+        self.cell.add_app(
+            self.cell.partitions['xx'].allocation,
+            scheduler.Application('app_xx', 10, [4, 4], 'app')
+        )
+        self.cell.schedule()
+
+    def _schedule(self):
+        """Run incremental schedule, return set of rescheduled partitions."""
+        with mock.patch.object(scheduler.Cell, 'schedule_alloc',
+                               autospec=True,
+                               side_effect=scheduler.Cell.schedule_alloc):
+            self.cell.schedule(incremental=True)
+            return set([
+                call[0][1].label
+                for call in scheduler.Cell.schedule_alloc.call_args_list
+            ])
+
+    def test_new_app(self):
+        """Test new app is placed without rescheduling."""
+        self.assertEqual({None: False, 'xx': False}, self.cell.backlog)
+
+        app = scheduler.Application('new', 10, [1, 1], 'app')
+        self.cell.add_app(self.cell.partitions[None].allocation, app)
+
+        self.assertEqual(set(), self._schedule())
+        self.assertIn(app.server, ['s0', 's1'])
+        self.assertEqual(set(), self.cell.dirty_apps)
+
+    def test_new_app_eviction(self):
+        """Test partition is rescheduled if new app does not fit."""
+        app = scheduler.Application('new', 20, [4, 4], 'app')
+        self.cell.add_app(self.cell.partitions[None].allocation, app)
+
+        self.assertEqual(set([None]), self._schedule())
+        self.assertIn(app.server, ['s0', 's1'])
+        self.assertEqual(
+            1, len([a for a in self.cell.apps.values() if a.server is None])
+        )
+        self.assertEqual({None: True, 'xx': False}, self.cell.backlog)
+
+        # Pending apps may evict new ones, partition is rescheduled.
+        app = scheduler.Application('new2', 10, [1, 1], 'app')
+        self.cell.add_app(self.cell.partitions[None].allocation, app)
+        self.assertEqual(set([None]), self._schedule())
+
+    def test_changes(self):
+        """Test changed partitions are rescheduled."""
+        self.assertEqual(set(), self._schedule())
+
+        self.cell.remove_app('app_xx')
+        self.assertEqual(set(['xx']), self._schedule())
+
+        self.servers[0].state = scheduler.State.frozen
+        self.assertEqual(set([None]), self._schedule())
+
+        self.servers[0].valid_until -= 10
+        self.assertEqual(set([None]), self._schedule())
+
+        self.bucket.remove_node_by_name('x')
+        self.assertEqual(set(['xx']), self._schedule())
+
+        self.cell.configure_identity_group('ident', 1)
+        self.assertEqual(set([None, 'xx']), self._schedule())
+
+        self.cell.invalidate()
+        self.assertEqual(set([None, 'xx']), self._schedule())
+
+    def test_same_as_full(self):
+        """Test full schedule does not change incremental placement."""
+        for seed in range(10):
+            cell, _servers, apps, rnd = _random_cell(seed, app_count=100)
+            cell.schedule()
+            for idx in range(20):
+                app = scheduler.Application(
+                    'new%d' % idx, rnd.randint(0, 100),
+                    [rnd.randint(1, 20)] * 2, 'aff%d' % rnd.randint(0, 30),
+                    lease=rnd.choice([0, 3600])
+                )
+                cell.add_app(
+                    cell.partitions[rnd.choice([None, 'xx'])].allocation,
+                    app
+                )
+                apps.append(app)
+                cell.schedule(incremental=True)
+
+                placement = [app.server for app in apps]
+                cell.schedule()
+                self.assertEqual(placement, [app.server for app in apps])
+
+
 class IdentityGroupTest(unittest.TestCase):
     """scheduler IdentityGroup test."""
 
@@ -1495,6 +2250,28 @@ class IdentityGroupTest(unittest.TestCase):
         ident_group.release(1)
         self.assertEqual(1, ident_group.acquire())
 
+    def test_ordered(self):
+        """Test ordered group acquires the lowest available identity."""
+        ident_group = scheduler.IdentityGroup(5, ordered=True)
+        self.assertEqual(
+            [0, 1, 2, 3, 4],
+            [ident_group.acquire() for _ in range(5)]
+        )
+        self.assertEqual(None, ident_group.acquire())
+
+        ident_group.release(3)
+        ident_group.release(1)
+        self.assertEqual(1, ident_group.acquire())
+
+        ident_group.adjust(2)
+        ident_group.adjust(4)
+        self.assertEqual(2, ident_group.acquire())
+        self.assertEqual(3, ident_group.acquire())
+        self.assertEqual(None, ident_group.acquire())
+
+        ident_group.reset([3, 0])
+        self.assertEqual(0, ident_group.acquire())
+
     def test_adjust(self):
         """Test identity group count adjustement."""
         ident_group = scheduler.IdentityGroup(5)
@@ -1589,6 +2366,54 @@ class RebootSchedulerTest(unittest.TestCase):
             server4.up_since + scheduler.DEFAULT_SERVER_UPTIME
         )
 
+    def test_reboots_index(self):
+        """Test servers are tracked in exactly one reboot bucket."""
+        partition = scheduler.Partition(now=_time('2000-01-01 00:00:00'))
+        # pylint: disable=W0212
+        buckets = partition._reboot_buckets
+
+        servers = [
+            scheduler.Server('s%s' % idx, [10, 10],
+                             up_since=_time('2000-01-01 00:00:00'))
+            for idx in range(30)
+        ]
+        for server in servers:
+            # Server goes to the bucket of least cost, latest on ties.
+            expected = min(reversed(buckets), key=lambda b: b.cost(server))
+            partition.add(server)
+            self.assertEqual(server.valid_until, expected.timestamp)
+
+        self.assertEqual(sum(len(bucket.servers) for bucket in buckets), 30)
+
+        # Adding server again moves it.
+        partition.add(servers[0], buckets[0].timestamp)
+        self.assertEqual(
+            sum(len(bucket.servers) for bucket in buckets), 30
+        )
+        self.assertIn('s0', buckets[0].servers)
+
+        partition.remove(servers[0])
+        partition.remove(servers[0])
+        self.assertEqual(
+            sum(len(bucket.servers) for bucket in buckets), 29
+        )
+
+        # Indexes are restored on unpickling.
+        partition1 = pickle.loads(pickle.dumps(partition))
+        partition1.remove(servers[1])
+        self.assertEqual(
+            sum(len(bucket.servers)
+                for bucket in partition1._reboot_buckets),
+            28
+        )
+
+        # Expired buckets are dropped with their servers.
+        expired = buckets[1]
+        servername = next(iter(expired.servers))
+        partition.tick(expired.timestamp + 1)
+        self.assertNotIn(expired, partition._reboot_buckets)
+        self.assertNotIn(servername, partition._reboot_servers)
+
 
 class ShapeTest(unittest.TestCase):
     """App shape test cases."""
@@ -12,8 +12,11 @@ import unittest
 # Disable W0611: Unused import
 import tests.treadmill_test_skip_windows  # pylint: disable=W0611
 
+import kazoo.exceptions
 import mock
+import pandas as pd
 
+from treadmill import reports
 from treadmill.sproc.export_reports import export_reports
 
 
@@ -25,9 +28,14 @@ class ExportReportsTest(unittest.TestCase):
     @mock.patch('io.open', mock.mock_open(), create=True)
     def test_export_reports(self):
         """Test saving of state reports to file."""
+        report = pd.DataFrame([[1, 'x'], [2, None]], columns=['a', 'b'])
+
         zkclient = mock.Mock()
         zkclient.get_children.return_value = ['foo']
-        zkclient.get.return_value = ('save this', 'meta')
+        zkclient.get.side_effect = [
+            (reports.serialize_columns(report, 1), 'meta'),
+            kazoo.exceptions.NoNodeError(),
+        ]
 
         cell_dir = '/foo/bar'
 
@@ -39,8 +47,13 @@ class ExportReportsTest(unittest.TestCase):
             'wb'
         )
 
-        zkclient.get.assert_called_with('/reports/foo')
-        io.open().write.assert_called_with('save this')
+        zkclient.get.assert_has_calls([
+            mock.call('/reports/foo'),
+            mock.call('/reports.delta/foo'),
+        ])
+        io.open().write.assert_called_with(
+            reports.serialize_dataframe(report)
+        )
 
 
 if __name__ == '__main__':
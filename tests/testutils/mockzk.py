@@ -107,6 +107,20 @@ class MockZookeeperMetadata(namedtuple('MockZookeeperMetadata',
                    children_count=children_count)
 
 
+class MockAsyncResult(object):
+    """Completed async result of the mock Zk call."""
+
+    def __init__(self):
+        self.value = None
+        self.exception = None
+
+    def get(self):
+        """Return the value or raise the exception of the call."""
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
 class MockZookeeperTestCase(unittest.TestCase):
     """Helper class to mock Zk get[children] events."""
     # Disable too many branches warning.
@@ -209,6 +223,9 @@ class MockZookeeperTestCase(unittest.TestCase):
             content = zk_content
             while path:
                 path_component = path.pop(0)
+                if path_component not in content:
+                    raise kazoo.client.NoNodeError()
+
                 content = content[path_component]
 
             watches[(zkpath, states.EventType.CHILD)] = watch
@@ -219,6 +236,20 @@ class MockZookeeperTestCase(unittest.TestCase):
             else:
                 return []
 
+        def mock_async(func):
+            """Make async version of the mock function."""
+
+            def _async(*args, **kwargs):
+                """Return async result of the call."""
+                result = MockAsyncResult()
+                try:
+                    result.value = func(*args, **kwargs)
+                except Exception as err:  # pylint: disable=W0703
+                    result.exception = err
+                return result
+
+            return _async
+
         if events:
             self.watch_events = queue.Queue()
 
@@ -244,7 +275,10 @@ class MockZookeeperTestCase(unittest.TestCase):
             (kazoo.client.KazooClient.exists, mock_exists),
             (kazoo.client.KazooClient.get, mock_get),
             (kazoo.client.KazooClient.delete, mock_delete),
-            (kazoo.client.KazooClient.get_children, mock_get_children)]
+            (kazoo.client.KazooClient.get_children, mock_get_children),
+            (kazoo.client.KazooClient.get_async, mock_async(mock_get)),
+            (kazoo.client.KazooClient.get_children_async,
+             mock_async(mock_get_children))]
 
         for mthd, side_effect in side_effects:
             try:
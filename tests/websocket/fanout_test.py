@@ -0,0 +1,216 @@
+"""Unit test for multi-process websocket server.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+# Disable W0611: Unused import
+import tests.treadmill_test_skip_windows  # pylint: disable=W0611
+
+import mock
+
+from treadmill import websocket
+from treadmill.websocket import fanout
+
+
+def _send_message(sock, msg):
+    """Send JSON line message."""
+    sock.sendall((json.dumps(msg) + '\n').encode())
+
+
+def _read_messages(sock):
+    """Read available JSON line messages."""
+    sock.settimeout(1)
+    data = b''
+    while not data.endswith(b'\n'):
+        data += sock.recv(64 * 1024)
+    return [json.loads(line.decode()) for line in data.splitlines()]
+
+
+class DummyHandler(object):
+    """Dummy handler to test dispatched events."""
+
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, filename, operation, content):
+        """Append event for further validation."""
+        self.events.append((filename, operation, content))
+
+
+class FanoutTest(unittest.TestCase):
+    """Test event routing between the router and workers."""
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.channels = [socket.socketpair() for _ in range(2)]
+
+    def tearDown(self):
+        for router_end, worker_end in self.channels:
+            router_end.close()
+            worker_end.close()
+        if self.root and os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+    @mock.patch('treadmill.utils.sys_exit', mock.Mock())
+    def test_router(self):
+        """Test events are routed only to the subscribed workers."""
+        router = fanout.EventRouter(
+            [router_end for router_end, _ in self.channels]
+        )
+        worker1 = self.channels[0][1]
+        worker2 = self.channels[1][1]
+
+        _send_message(worker1, {'watch': self.root})
+        router.run(once=True)
+        self.assertEqual(_read_messages(worker1), [{'watching': self.root}])
+        self.assertEqual(router.subscribers, {self.root: set([0])})
+
+        with io.open(os.path.join(self.root, 'aaa'), 'w') as f:
+            f.write('x')
+        io.open(os.path.join(self.root, '.aaa'), 'w').close()
+        router.run(once=True)
+
+        messages = _read_messages(worker1)
+        self.assertEqual(
+            messages[0]['event'][:2],
+            ['c', os.path.join(self.root, 'aaa')]
+        )
+        self.assertEqual(messages[-1]['event'][3], 'x')
+        self.assertNotIn(
+            os.path.join(self.root, '.aaa'),
+            [message['event'][1] for message in messages]
+        )
+
+        worker2.setblocking(False)
+        with self.assertRaises(socket.error):
+            worker2.recv(1)
+
+        _send_message(worker1, {'unwatch': self.root})
+        router.run(once=True)
+        self.assertEqual(router.subscribers, {})
+
+    @mock.patch('treadmill.utils.sys_exit', mock.Mock())
+    def test_slow_worker(self):
+        """Test events for a slow worker are buffered."""
+        # Access to protected member: _send, _output
+        #
+        # pylint: disable=W0212
+        router = fanout.EventRouter(
+            [router_end for router_end, _ in self.channels]
+        )
+        worker1 = self.channels[0][1]
+        worker2 = self.channels[1][1]
+
+        data = 'x' * (4 * 1024 * 1024)
+        router._send(0, fanout._encode({'event': ['c', '/a', 1.0, data]}))
+        self.assertTrue(router._output[0])
+
+        # Other workers are not delayed.
+        router._send(1, fanout._encode({'watching': self.root}))
+        self.assertEqual(_read_messages(worker2), [{'watching': self.root}])
+
+        worker1.setblocking(False)
+        received = b''
+        while not received.endswith(b'\n'):
+            router.run(once=True)
+            try:
+                received += worker1.recv(1024 * 1024)
+            except socket.error:
+                pass
+
+        self.assertFalse(router._output[0])
+        self.assertEqual(json.loads(received.decode())['event'][3], data)
+
+    @mock.patch('treadmill.utils.sys_exit', mock.Mock())
+    def test_channel(self):
+        """Test worker dispatches routed events to the subscribed handlers."""
+        channel = fanout.RouterChannel(self.channels[0][1])
+        pubsub = websocket.DirWatchPubSub(self.root, watcher=channel)
+        channel.pubsub = pubsub
+
+        ws = mock.Mock()
+        ws.active.return_value = True
+        handler = DummyHandler()
+
+        # Access to protected member: _add_handler, _handle, _release
+        #
+        # pylint: disable=W0212
+        _watch_dirs, pending, held = pubsub._add_handler('/', 'a*', ws,
+                                                         handler, None)
+        self.assertEqual(len(pending), 1)
+        self.assertFalse(pending[0].done())
+
+        channel._handle({'watching': self.root})
+        self.assertTrue(pending[0].done())
+        pubsub._release(held, ws, handler, None)
+
+        channel._handle({
+            'event': ['c', os.path.join(self.root, 'aaa'), 1.0, 'x']
+        })
+        channel._handle({
+            'event': ['c', os.path.join(self.root, 'bbb'), 2.0, 'y']
+        })
+        self.assertEqual(handler.events, [('/aaa', 'c', 'x')])
+
+    def test_channel_concurrent(self):
+        """Test subscriptions wait for the directory watch in flight."""
+        channel = fanout.RouterChannel(self.channels[0][1])
+        pubsub = websocket.DirWatchPubSub(self.root, watcher=channel)
+        channel.pubsub = pubsub
+
+        ws = mock.Mock()
+        ws.active.return_value = True
+        io.open(os.path.join(self.root, 'aaa'), 'w').close()
+
+        # Access to protected member: _add_handler, _handle, _load_dir
+        #
+        # pylint: disable=W0212
+        _watch_dirs, pending1, _held = pubsub._add_handler(
+            '/', 'a*', ws, DummyHandler(), 1
+        )
+        _watch_dirs, pending2, _held = pubsub._add_handler(
+            '/', 'a*', ws, DummyHandler(), 2
+        )
+        self.assertEqual(len(pending1), 1)
+        self.assertEqual(pending1, pending2)
+
+        # Directory is not cached until it is watched.
+        pubsub._load_dir(self.root)
+        self.assertNotIn(self.root, pubsub._cache)
+
+        channel._handle({'watching': self.root})
+        self.assertTrue(pending2[0].done())
+        pubsub._load_dir(self.root)
+        self.assertIn(self.root, pubsub._cache)
+
+        ws.active.return_value = False
+        pubsub._gc()
+        self.assertNotIn(self.root, pubsub._watching)
+        self.assertNotIn(self.root, pubsub._cache)
+
+        # Permanent watch is waited for as well.
+        ws.active.return_value = True
+        channel = fanout.RouterChannel(self.channels[1][1])
+        pubsub = websocket.DirWatchPubSub(self.root, watches=['/'],
+                                          watcher=channel)
+        _watch_dirs, pending, _held = pubsub._add_handler(
+            '/', 'a*', ws, DummyHandler(), 1
+        )
+        self.assertEqual(len(pending), 1)
+        channel._handle({'watching': self.root})
+        self.assertTrue(pending[0].done())
+
+
+if __name__ == '__main__':
+    unittest.main()
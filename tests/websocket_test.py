@@ -236,6 +236,116 @@ class PubSubTest(unittest.TestCase):
             ]
         )
 
+    @mock.patch('treadmill.utils.sys_exit', mock.Mock())
+    def test_sow_cache(self):
+        """Tests sow is served from the cache updated by dirwatch events."""
+        # Access to protected member: _cache, _gc
+        #
+        # pylint: disable=W0212
+        pubsub = websocket.DirWatchPubSub(self.root)
+        ws = mock.Mock()
+        ws.active.return_value = True
+
+        with io.open(os.path.join(self.root, 'aaa'), 'w') as f:
+            f.write('a')
+        with io.open(os.path.join(self.root, 'abb'), 'w') as f:
+            f.write('b')
+        io.open(os.path.join(self.root, 'xxx'), 'w').close()
+
+        handler1 = DummyHandler()
+        pubsub.register('/', 'a*', ws, handler1, 0)
+        self.assertEqual(
+            [('/aaa', None, 'a'), ('/abb', None, 'b')],
+            sorted(handler1.events)
+        )
+        self.assertEqual(
+            ['aaa', 'abb', 'xxx'],
+            pubsub._cache[self.root].names
+        )
+
+        # Cache is updated from the events, files are not read again.
+        with io.open(os.path.join(self.root, 'abc'), 'w') as f:
+            f.write('c')
+        os.unlink(os.path.join(self.root, 'aaa'))
+        pubsub.run(once=True)
+
+        handler2 = DummyHandler()
+        with mock.patch('io.open', mock.Mock()) as open_mock:
+            pubsub.register('/', 'ab*', ws, handler2, 0)
+            self.assertFalse(open_mock.called)
+        self.assertEqual(
+            [('/abb', None, 'b'), ('/abc', None, 'c')],
+            sorted(handler2.events)
+        )
+
+        # Cache is dropped with the dir watch.
+        ws.active.return_value = False
+        pubsub._gc()
+        self.assertNotIn(self.root, pubsub._cache)
+
+    def test_held_events(self):
+        """Tests live events are sent after the sow."""
+        # Access to protected member: _add_handler, _publish_sow, _release
+        #
+        # pylint: disable=W0212
+        pubsub = websocket.DirWatchPubSub(self.root)
+        ws = mock.Mock()
+        ws.active.return_value = True
+        handler = DummyHandler()
+
+        _watch_dirs, _pending, held = pubsub._add_handler('/', 'a*', ws,
+                                                          handler, None)
+        path = os.path.join(self.root, 'aaa')
+        pubsub.dispatch('d', path, 2.0, None)
+        self.assertEqual([], handler.events)
+
+        pubsub._publish_sow([(1.0, '/aaa', 'a')], ws, handler)
+        pubsub._release(held, ws, handler, None)
+        pubsub.dispatch('c', path, 3.0, 'b')
+        self.assertEqual(
+            [('/aaa', None, 'a'), ('/aaa', 'd', None), ('/aaa', 'c', 'b')],
+            handler.events
+        )
+
+    def test_load_dir(self):
+        """Tests events are queued while the directory is loading."""
+        # Access to protected member: _add_handler, _load_dir, _cache
+        #
+        # pylint: disable=W0212
+        pubsub = websocket.DirWatchPubSub(self.root)
+        ws = mock.Mock()
+        ws.active.return_value = True
+        pubsub._add_handler('/', '*', ws, DummyHandler(), None)
+
+        for filename in ('aaa', 'bbb'):
+            with io.open(os.path.join(self.root, filename), 'w') as f:
+                f.write(filename)
+
+        read_file = websocket.read_file
+
+        def _read_file(path):
+            """Read file, the other file changes meanwhile."""
+            # Cache is not locked while the files are read.
+            self.assertTrue(pubsub._cache_lock.acquire(False))
+            pubsub._cache_lock.release()
+
+            data = read_file(path)
+            if path.endswith('aaa'):
+                pubsub.dispatch('d', os.path.join(self.root, 'bbb'), 1.0,
+                                None)
+            else:
+                pubsub.dispatch('m', os.path.join(self.root, 'aaa'), 1.0,
+                                'xxx')
+            return data
+
+        with mock.patch('treadmill.websocket.read_file',
+                        mock.Mock(side_effect=_read_file)):
+            cache = pubsub._load_dir(self.root)
+
+        self.assertIs(cache, pubsub._cache[self.root])
+        self.assertEqual({'aaa': (1.0, 'xxx')}, cache.files)
+        self.assertEqual({}, pubsub._loading)
+
     @mock.patch('glob.glob')
     @mock.patch('os.path.isdir')
     @mock.patch('treadmill.dirwatch.DirWatcher')
@@ -7,7 +7,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
-import glob
 import io
 import os
 import shutil
@@ -48,6 +47,7 @@ class ZkSyncTest(mockzk.MockZookeeperTestCase):
                 self.assertTrue(content == f.read())
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     def test_sync_children(self):
@@ -96,7 +96,7 @@ class ZkSyncTest(mockzk.MockZookeeperTestCase):
                                    zk2fs_sync._default_on_del)
         self.assertFalse(os.path.exists(os.path.join(self.root, 'a/x')))
 
-    @mock.patch('glob.glob', mock.Mock())
+    @mock.patch('os.listdir', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
@@ -115,7 +115,7 @@ class ZkSyncTest(mockzk.MockZookeeperTestCase):
 
         self.make_mock_zk(zk_content)
 
-        glob.glob.return_value = ['a/b', 'a/a', 'a/y']
+        os.listdir.return_value = ['b', 'a', 'y', '.done']
 
         add = []
         rm = []
@@ -130,6 +130,51 @@ class ZkSyncTest(mockzk.MockZookeeperTestCase):
         self.assertSequenceEqual(['y', 'x', 'z'], add)
         self.assertSequenceEqual(['a', 'b'], rm)
 
+    @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
+    def test_sync_children_index(self):
+        """Test changes are diffed against mirrored children index."""
+        # Disable W0212: accessing protected members.
+        # pylint: disable=W0212
+        zk_content = {
+            'a': {
+                'x': b'1',
+                'y': b'2',
+            },
+        }
+        self.make_mock_zk(zk_content)
+
+        zk2fs_sync = zk2fs.Zk2Fs(kazoo.client.KazooClient(), self.root)
+        fs.mkdir_safe(os.path.join(self.root, 'a'))
+        utils.touch(os.path.join(self.root, 'a', 'stale'))
+        zk2fs_sync._children_watch('/a', ['x', 'y', 'gone'],
+                                   False,
+                                   zk2fs_sync._default_on_add,
+                                   zk2fs_sync._default_on_del)
+        self._check_file('a/x', '1')
+        self._check_file('a/y', '2')
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a/stale')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a/gone')))
+        self.assertEqual(kazoo.client.KazooClient.get_async.call_count, 3)
+        self.assertFalse(kazoo.client.KazooClient.get.called)
+
+        # Directory is not listed again, only added nodes are read.
+        kazoo.client.KazooClient.get_async.reset_mock()
+        zk_content['a']['z'] = b'3'
+        with mock.patch('os.listdir', mock.Mock()) as listdir_mock:
+            zk2fs_sync._children_watch('/a', ['y', 'z'],
+                                       False,
+                                       zk2fs_sync._default_on_add,
+                                       zk2fs_sync._default_on_del)
+            self.assertFalse(listdir_mock.called)
+
+        kazoo.client.KazooClient.get_async.assert_called_once_with('/a/z')
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a/x')))
+        self._check_file('a/z', '3')
+        self.assertEqual(zk2fs_sync.mirrored['/a'], set(['y', 'z']))
+
     @mock.patch('treadmill.utils.sys_exit', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
@@ -203,6 +248,7 @@ class ZkSyncTest(mockzk.MockZookeeperTestCase):
         self.assertFalse(os.path.exists(os.path.join(self.root, 'a/x')))
 
     @mock.patch('kazoo.client.KazooClient.get', mock.Mock())
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.exists', mock.Mock())
     @mock.patch('kazoo.client.KazooClient.get_children', mock.Mock())
     def test_sync_children_immutable(self):
@@ -205,6 +205,88 @@ class ZkTest(unittest.TestCase):
         zkutils.update(zkclient, '/a', 'bbb', check_content=True)
         kazoo.client.KazooClient.set.assert_called_with('/a', b'bbb')
 
+    @mock.patch('kazoo.client.KazooClient.transaction', mock.Mock())
+    def test_create_many(self):
+        """Verifies nodes are created in a single transaction."""
+        transaction = kazoo.client.KazooClient.transaction.return_value
+        transaction.commit.return_value = ['/a/b', '/a/c']
+        zkclient = kazoo.client.KazooClient()
+
+        self.assertTrue(zkutils.create_many(zkclient, []))
+        self.assertFalse(kazoo.client.KazooClient.transaction.called)
+
+        self.assertTrue(
+            zkutils.create_many(zkclient, [('/a/b', {'x': 1}, None),
+                                           ('/a/c', 'c', None)])
+        )
+        transaction.create.assert_has_calls([
+            mock.call('/a/b', yaml.dump({'x': 1}).encode(), acl=mock.ANY),
+            mock.call('/a/c', b'c', acl=mock.ANY),
+        ])
+
+        transaction.commit.return_value = [
+            kazoo.client.NodeExistsError(),
+            kazoo.exceptions.RolledBackError(),
+        ]
+        self.assertFalse(
+            zkutils.create_many(zkclient, [('/a/b', None, None),
+                                           ('/a/c', None, None)])
+        )
+
+    @mock.patch('kazoo.client.KazooClient.transaction', mock.Mock())
+    def test_delete_many(self):
+        """Verifies nodes are deleted in a single transaction."""
+        transaction = kazoo.client.KazooClient.transaction.return_value
+        transaction.commit.return_value = [True, True]
+        zkclient = kazoo.client.KazooClient()
+
+        self.assertTrue(zkutils.delete_many(zkclient, ['/a/b', '/a/c']))
+        transaction.delete.assert_has_calls([
+            mock.call('/a/b'),
+            mock.call('/a/c'),
+        ])
+
+        transaction.commit.return_value = [
+            kazoo.exceptions.RolledBackError(),
+            kazoo.client.NoNodeError(),
+        ]
+        self.assertFalse(zkutils.delete_many(zkclient, ['/a/b', '/a/c']))
+
+    @mock.patch('kazoo.client.KazooClient.get_async', mock.Mock())
+    def test_get_many_with_metadata(self):
+        """Verifies requests are pipelined and missing nodes are omitted."""
+        outstanding = []
+
+        def get_async(path):
+            """Return async result, track outstanding requests."""
+            outstanding.append(path)
+            self.assertLessEqual(len(outstanding), 2)
+            result = mock.Mock()
+
+            def get():
+                """Complete the request."""
+                outstanding.remove(path)
+                if path == '/a/missing':
+                    raise kazoo.client.NoNodeError()
+                return (yaml.dump({'path': path}).encode(), path + ':meta')
+
+            result.get.side_effect = get
+            return result
+
+        kazoo.client.KazooClient.get_async.side_effect = get_async
+        zkclient = kazoo.client.KazooClient()
+
+        self.assertEqual(
+            zkutils.get_many_with_metadata(
+                zkclient, ['/a/b', '/a/missing', '/a/c'], max_pending=2
+            ),
+            {
+                '/a/b': ({'path': '/a/b'}, '/a/b:meta'),
+                '/a/c': ({'path': '/a/c'}, '/a/c:meta'),
+            }
+        )
+        self.assertEqual(outstanding, [])
+
 
 if __name__ == '__main__':
     unittest.main()